@@ -1,6 +1,8 @@
 # ResultManagement/admin.py
-from django.contrib import admin
-from .models import ExamConfiguration, StudentResult, StudentOverallResult
+from django.contrib import admin, messages
+from .models import ExamConfiguration, StudentResult, StudentOverallResult, GradingScale, GradeBoundary, BackgroundJob
+from .grading import THRESHOLD_FIELDS
+from .jobs import enqueue_job
 
 @admin.register(ExamConfiguration)
 class ExamConfigurationAdmin(admin.ModelAdmin):
@@ -8,6 +10,7 @@ class ExamConfigurationAdmin(admin.ModelAdmin):
     list_filter = ('examination', 'classroom', 'has_practical', 'created_at')
     search_fields = ('examination__name', 'classroom__name', 'subject__name')
     ordering = ('-created_at',)
+    actions = ['generate_school_result_cards']
     
     fieldsets = (
         ('Basic Information', {
@@ -20,6 +23,20 @@ class ExamConfigurationAdmin(admin.ModelAdmin):
             'fields': ('has_practical', 'full_practical_marks', 'pass_practical_marks')
         }),
     )
+    
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        # Regrade existing results in the background when thresholds change
+        if change and set(form.changed_data) & set(THRESHOLD_FIELDS):
+            if StudentResult.objects.filter(exam_config=obj).exists():
+                job = enqueue_job(BackgroundJob.REGRADE, {'config_ids': [obj.id]}, user=request.user)
+                messages.info(request, f"Existing results are being regraded in the background (job #{job.id}).")
+
+    @admin.action(description="Generate result cards for every class of the selected examinations")
+    def generate_school_result_cards(self, request, queryset):
+        for exam_id in queryset.order_by('examination_id').values_list('examination_id', flat=True).distinct():
+            job = enqueue_job(BackgroundJob.SCHOOL_PDF, {'exam_id': exam_id}, user=request.user)
+            messages.info(request, f"Result cards for examination {exam_id} are being generated (job #{job.id}).")
 
 @admin.register(StudentResult)
 class StudentResultAdmin(admin.ModelAdmin):
@@ -72,4 +89,23 @@ class StudentOverallResultAdmin(admin.ModelAdmin):
             'fields': ('extracurricular_grade', 'extracurricular_remarks', 'extracurricular_entered_by'),
             'classes': ('collapse',)
         }),
-    )
\ No newline at end of file
+    )
+
+class GradeBoundaryInline(admin.TabularInline):
+    model = GradeBoundary
+    extra = 1
+
+@admin.register(GradingScale)
+class GradingScaleAdmin(admin.ModelAdmin):
+    list_display = ('name', 'kind', 'is_default', 'fail_grade', 'updated_at')
+    list_filter = ('kind', 'is_default')
+    search_fields = ('name',)
+    filter_horizontal = ('classes',)
+    inlines = [GradeBoundaryInline]
+
+
+@admin.register(BackgroundJob)
+class BackgroundJobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'kind', 'status', 'completed', 'total', 'created_by', 'created_at', 'finished_at')
+    list_filter = ('kind', 'status', 'created_at')
+    readonly_fields = ('kind', 'params', 'status', 'total', 'completed', 'result', 'error', 'created_by', 'created_at', 'started_at', 'finished_at')
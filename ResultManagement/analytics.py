@@ -0,0 +1,179 @@
+# ResultManagement/analytics.py
+import numpy as np
+from django.core.cache import cache
+from django.db.models import F
+from django.utils import timezone
+
+from management.models import Class, Subject
+from .models import StudentResult
+
+# Percentage buckets of the histograms: 0-10, 10-20, ... 90-100
+HISTOGRAM_BUCKETS = 10
+
+CACHE_TIMEOUT = 60 * 60
+
+
+def cache_key(examination_id):
+    return f"exam_analytics:{examination_id}"
+
+
+def invalidate_exam_analytics(examination_id):
+    """Drop the cached statistics of an examination after its marks change"""
+    cache.delete(cache_key(examination_id))
+
+
+def get_exam_analytics(examination_id):
+    """Statistics for an examination, computed once and cached until marks change"""
+    analytics = cache.get(cache_key(examination_id))
+    if analytics is None:
+        analytics = compute_exam_analytics(examination_id)
+        cache.set(cache_key(examination_id), analytics, CACHE_TIMEOUT)
+    return analytics
+
+
+def load_exam_results(examination_id):
+    """Load every subject result of an examination into NumPy arrays with one query"""
+    rows = StudentResult.objects.filter(examination_id=examination_id).annotate(
+        full_marks=F('exam_config__full_theory_marks') + F('exam_config__full_practical_marks'),
+    ).values_list(
+        'exam_config__classroom_id', 'subject_id', 'student_id',
+        'percentage', 'total_marks', 'full_marks', 'is_passed', 'grade',
+    )
+    columns = list(zip(*rows)) or [()] * 8
+    return {
+        'classroom': np.array(columns[0], dtype=np.int64),
+        'subject': np.array(columns[1], dtype=np.int64),
+        'student': np.array(columns[2], dtype=np.int64),
+        'percentage': np.array([float(value or 0) for value in columns[3]], dtype=np.float64),
+        'total_marks': np.array([float(value or 0) for value in columns[4]], dtype=np.float64),
+        'full_marks': np.array([float(value or 0) for value in columns[5]], dtype=np.float64),
+        'passed': np.array(columns[6], dtype=bool),
+        'grade': np.array(columns[7], dtype=object),
+    }
+
+
+def group_statistics(groups, values, passed, grades=None):
+    """
+    Vectorized statistics of ``values`` per group code (0..n-1): count, mean,
+    median, standard deviation, highest, lowest, pass rate, grade counts and
+    histogram buckets. Returns a list of dicts indexed by group code.
+    """
+    n_groups = int(groups.max()) + 1 if groups.size else 0
+    if not n_groups:
+        return []
+
+    counts = np.bincount(groups, minlength=n_groups)
+    sums = np.bincount(groups, weights=values, minlength=n_groups)
+    squares = np.bincount(groups, weights=values * values, minlength=n_groups)
+    means = sums / counts
+    stds = np.sqrt(np.maximum(squares / counts - means * means, 0))
+    pass_rates = np.bincount(groups, weights=passed, minlength=n_groups) / counts * 100
+
+    # Sort values within each group to read medians, highs and lows by offset
+    order = np.lexsort((values, groups))
+    ordered = values[order]
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    medians = (ordered[starts + (counts - 1) // 2] + ordered[starts + counts // 2]) / 2
+    lowest = ordered[starts]
+    highest = ordered[starts + counts - 1]
+
+    buckets = np.clip((values // (100 / HISTOGRAM_BUCKETS)).astype(np.int64), 0, HISTOGRAM_BUCKETS - 1)
+    histograms = np.bincount(
+        groups * HISTOGRAM_BUCKETS + buckets, minlength=n_groups * HISTOGRAM_BUCKETS
+    ).reshape(n_groups, HISTOGRAM_BUCKETS)
+
+    grade_counts = None
+    if grades is not None and grades.size:
+        grade_labels, grade_codes = np.unique(grades.astype(str), return_inverse=True)
+        grade_counts = np.bincount(
+            groups * len(grade_labels) + grade_codes, minlength=n_groups * len(grade_labels)
+        ).reshape(n_groups, len(grade_labels))
+
+    statistics = []
+    for index in range(n_groups):
+        statistics.append({
+            'count': int(counts[index]),
+            'mean': round(float(means[index]), 2),
+            'median': round(float(medians[index]), 2),
+            'std': round(float(stds[index]), 2),
+            'highest': round(float(highest[index]), 2),
+            'lowest': round(float(lowest[index]), 2),
+            'pass_rate': round(float(pass_rates[index]), 1),
+            'grades': {
+                str(label): int(count)
+                for label, count in zip(grade_labels, grade_counts[index]) if count
+            } if grade_counts is not None else {},
+            'histogram': histograms[index].tolist(),
+        })
+    return statistics
+
+
+def compute_exam_analytics(examination_id):
+    """
+    Per (class, subject) statistics of subject percentages, and per class
+    statistics of each student's overall percentage, for a whole examination
+    """
+    data = load_exam_results(examination_id)
+
+    # Per (class, subject)
+    pairs = np.stack([data['classroom'], data['subject']], axis=1) if data['classroom'].size else np.empty((0, 2), dtype=np.int64)
+    pair_keys, pair_codes = np.unique(pairs, axis=0, return_inverse=True)
+    pair_codes = pair_codes.reshape(-1)
+    subject_stats = group_statistics(pair_codes, data['percentage'], data['passed'], data['grade'])
+
+    # Per (class, student): overall percentage and whether every subject passed
+    students = np.stack([data['classroom'], data['student']], axis=1) if data['classroom'].size else np.empty((0, 2), dtype=np.int64)
+    student_keys, student_codes = np.unique(students, axis=0, return_inverse=True)
+    student_codes = student_codes.reshape(-1)
+    n_students = len(student_keys)
+    obtained = np.bincount(student_codes, weights=data['total_marks'], minlength=n_students)
+    full = np.bincount(student_codes, weights=data['full_marks'], minlength=n_students)
+    student_percentage = np.divide(obtained * 100, full, out=np.zeros(n_students), where=full > 0)
+    failures = np.bincount(student_codes, weights=~data['passed'], minlength=n_students)
+    student_passed = failures == 0
+
+    class_ids, class_codes = np.unique(student_keys[:, 0], return_inverse=True) if n_students else (np.array([], dtype=np.int64), np.array([], dtype=np.int64))
+    class_stats = group_statistics(class_codes.reshape(-1), student_percentage, student_passed)
+
+    class_names = {cls.id: str(cls) for cls in Class.objects.filter(id__in=class_ids.tolist())}
+    subject_names = dict(Subject.objects.filter(id__in=np.unique(data['subject']).tolist()).values_list('id', 'name'))
+
+    classes = []
+    for class_index, classroom_id in enumerate(class_ids.tolist()):
+        class_entry = {
+            'classroom_id': classroom_id,
+            'classroom': class_names.get(classroom_id, ''),
+            'students': class_stats[class_index]['count'],
+            **{key: value for key, value in class_stats[class_index].items() if key not in ('count', 'grades')},
+            'grades': {},
+            'subjects': [],
+        }
+        classes.append(class_entry)
+
+    # Subject grade counts per class come from the (class, subject) groups
+    by_class = {entry['classroom_id']: entry for entry in classes}
+    for pair_index, (classroom_id, subject_id) in enumerate(pair_keys.tolist()):
+        class_entry = by_class[classroom_id]
+        stats = subject_stats[pair_index]
+        class_entry['subjects'].append({
+            'subject_id': subject_id,
+            'subject': subject_names.get(subject_id, ''),
+            **stats,
+        })
+        for grade, count in stats['grades'].items():
+            class_entry['grades'][grade] = class_entry['grades'].get(grade, 0) + count
+
+    for class_entry in classes:
+        class_entry['subjects'].sort(key=lambda subject: subject['subject'])
+    classes.sort(key=lambda class_entry: class_entry['classroom'])
+
+    return {
+        'examination_id': examination_id,
+        'generated_at': timezone.now().isoformat(),
+        'results': int(data['percentage'].size),
+        'histogram_buckets': [
+            f"{int(bucket * 100 / HISTOGRAM_BUCKETS)}-{int((bucket + 1) * 100 / HISTOGRAM_BUCKETS)}"
+            for bucket in range(HISTOGRAM_BUCKETS)
+        ],
+        'classes': classes,
+    }
@@ -7,4 +7,8 @@ class ResultmanagementConfig(AppConfig):
     verbose_name = 'Result Management'
 
     def ready(self):
-        import ResultManagement.signals
\ No newline at end of file
+        import ResultManagement.signals
+        # Register the background job handlers for the job worker
+        import ResultManagement.cards
+        import ResultManagement.grading
+        import ResultManagement.school_cards
\ No newline at end of file
@@ -0,0 +1,372 @@
+# ResultManagement/benchmark.py
+"""
+How result card generation behaves as classes grow.
+
+``run_benchmark()`` seeds synthetic classes (students x subjects) into a
+throwaway test database and generates their cards in every rendering mode:
+
+- ``single``: one student at a time, with the queries of the
+  ``generate_result_pdf`` view
+- ``cards``, ``combined``, ``split``, ``concurrent``: the bulk job modes (see
+  ``BULK_PDF_MODES``); ``concurrent`` only applies to the playwright backend
+
+Each run is timed end to end and per stage (query, template, pdf, split,
+output, i.e. writing the ZIP or PDF), with the peak resident memory of the
+process. Concurrent renders overlap, so that mode reports them as one pdf
+stage.
+
+Backends are called directly, bypassing the PDF cache and the fallback
+chain, so every card is really drawn by the backend being measured.
+"""
+import datetime
+import json
+import os
+import platform
+import random
+import threading
+import time
+import zipfile
+from collections import defaultdict
+from contextlib import contextmanager
+from decimal import Decimal
+from pathlib import Path
+
+from django.template.loader import get_template
+
+from .cards import (
+    BULK_PDF_MODES, PDF_ZIP_COMPRESSION, card_context, card_filename, class_card_contexts,
+    split_class_document, write_card_zip_concurrently,
+)
+from .pdf_backends import HTMLBackend, PDFBackendUnavailable, get_backend
+
+BENCHMARK_MODES = ('single',) + BULK_PDF_MODES
+
+STAGES = ('query', 'template', 'pdf', 'split', 'output')
+
+# Seconds between memory samples
+RSS_SAMPLE_INTERVAL = 0.005
+
+
+def parse_size(value):
+    """'50x6' -> (50 students, 6 subjects)"""
+    students, _, subjects = value.lower().partition('x')
+    try:
+        size = int(students), int(subjects or 1)
+    except ValueError:
+        raise ValueError(f"Class sizes look like 50x6 (students x subjects), not {value!r}")
+    if min(size) < 1:
+        raise ValueError(f"Class size {value!r} must have at least one student and one subject")
+    return size
+
+
+# ============ MEASUREMENT ============
+
+class Stopwatch:
+    """Seconds spent in each named stage"""
+
+    def __init__(self):
+        self.stages = defaultdict(float)
+
+    @contextmanager
+    def stage(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] += time.perf_counter() - started
+
+
+def current_rss():
+    """Resident memory of this process in bytes"""
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        # Peak rather than current where /proc is unavailable; kilobytes on Linux, bytes on macOS
+        import resource
+        usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return usage if platform.system() == 'Darwin' else usage * 1024
+
+
+class PeakMemory:
+    """Sample resident memory on a thread while the block runs"""
+
+    def __enter__(self):
+        self.before = self.peak = current_rss()
+        self.done = threading.Event()
+        self.thread = threading.Thread(target=self.sample, daemon=True)
+        self.thread.start()
+        return self
+
+    def sample(self):
+        while not self.done.wait(RSS_SAMPLE_INTERVAL):
+            self.peak = max(self.peak, current_rss())
+
+    def __exit__(self, *exc_info):
+        self.done.set()
+        self.thread.join()
+        self.peak = max(self.peak, current_rss())
+
+
+# ============ SYNTHETIC DATA ============
+
+@contextmanager
+def benchmark_database():
+    """Run the block against a fresh test database, destroyed afterwards"""
+    from django.db import connection
+
+    old_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+def seed_class(examination, subjects, students, rnd):
+    """A graded class of ``students`` sitting every subject of ``subjects``"""
+    from management.models import Class, ClassSubject, Student
+    from .grading import grade_marks_sheet
+    from .models import ExamConfiguration
+    from .recompute import coalesce_overall_results
+
+    classroom = Class.objects.create(name=f"Bench {students}x{len(subjects)}", section='A')
+    roster = Student.objects.bulk_create([
+        Student(
+            first_name=f"Student{number}", last_name=classroom.name.replace(' ', ''),
+            roll_number=str(number), date_of_birth=datetime.date(2012, 1, 1),
+            father_name='Father', mother_name='Mother', permanent_address='Address',
+            student_contact='9800000000', classroom=classroom,
+        )
+        for number in range(1, students + 1)
+    ])
+
+    with coalesce_overall_results():
+        for index, subject in enumerate(subjects):
+            ClassSubject.objects.create(classroom=classroom, subject=subject)
+            has_practical = index % 2 == 0
+            config = ExamConfiguration.objects.create(
+                examination=examination, classroom=classroom, subject=subject,
+                full_theory_marks=75 if has_practical else 100, pass_theory_marks=30,
+                has_practical=has_practical,
+                full_practical_marks=25 if has_practical else 0,
+                pass_practical_marks=10 if has_practical else 0,
+            )
+            grade_marks_sheet(config, {
+                student: (
+                    Decimal(rnd.randint(0, int(config.full_theory_marks) * 100)) / 100,
+                    Decimal(rnd.randint(0, 2500)) / 100 if has_practical else None,
+                )
+                for student in roster
+            })
+    return classroom
+
+
+# ============ RENDERING MODES ============
+
+def draw(backend, contexts, watch):
+    """PDF of one card, or a class document for a list, timing template and PDF apart"""
+    many = isinstance(contexts, list)
+    if not isinstance(backend, HTMLBackend):
+        with watch.stage('pdf'):
+            return backend.render_many(contexts) if many else backend.render(contexts)
+
+    with watch.stage('template'):
+        if many:
+            html = get_template(backend.class_template_name).render({**contexts[0], 'cards': contexts})
+        else:
+            html = get_template(backend.template_name).render(contexts)
+    with watch.stage('pdf'):
+        return backend.render_html(html)
+
+
+def bench_single(examination, classroom, backend, watch, samples):
+    """
+    The first ``samples`` students of the class one at a time: the queries
+    of the ``generate_result_pdf`` view, then the card drawn by ``backend``
+    itself rather than through the view's PDF cache and fallbacks
+    """
+    from management.models import Student
+    from .models import StudentOverallResult, StudentResult
+    from .rankings import student_class_rank
+
+    student_ids = list(Student.objects.filter(classroom=classroom).order_by('id').values_list('id', flat=True)[:samples])
+    size = 0
+    for student_id in student_ids:
+        with watch.stage('query'):
+            student = Student.objects.get(id=student_id)
+            overall_result = StudentOverallResult.objects.filter(student=student, examination=examination).first()
+            subject_results = list(StudentResult.objects.filter(
+                student=student, examination=examination
+            ).select_related('subject', 'exam_config').order_by('subject__name'))
+            class_rank = student_class_rank(examination, student, subject_results)
+            context = card_context(student, examination, overall_result, subject_results, class_rank)
+        size += len(draw(backend, context, watch))
+    return len(student_ids), size
+
+
+def bench_class(examination, classroom, backend, mode, watch, path):
+    """One bulk job mode for the whole class, written to ``path``"""
+    with watch.stage('query'):
+        cards = class_card_contexts(examination, classroom)
+
+    if mode == 'concurrent':
+        from django.test.utils import override_settings
+        from .renderer import ensure_renderer
+
+        ensure_renderer()
+        with watch.stage('pdf'), override_settings(RESULT_PDF_CACHE={'MAX_SIZE': 0}):
+            summary = write_card_zip_concurrently(cards, path)
+        if set(summary['backends']) != {backend.name}:
+            raise PDFBackendUnavailable("The browser was unavailable for part of the class.")
+    elif mode == 'cards':
+        with zipfile.ZipFile(path, 'w', PDF_ZIP_COMPRESSION) as zip_file:
+            for student, context in cards:
+                pdf = draw(backend, context, watch)
+                with watch.stage('output'):
+                    zip_file.writestr(card_filename(student), pdf)
+    else:
+        pdf = draw(backend, [context for _, context in cards], watch)
+        if mode == 'combined':
+            with watch.stage('output'):
+                path.write_bytes(pdf)
+        else:
+            with watch.stage('split'):
+                parts = list(split_class_document(pdf, cards))
+            with watch.stage('output'):
+                with zipfile.ZipFile(path, 'w', PDF_ZIP_COMPRESSION) as zip_file:
+                    for student, pdf_bytes in parts:
+                        zip_file.writestr(card_filename(student), pdf_bytes)
+    return len(cards), path.stat().st_size
+
+
+def run_case(examination, classroom, backend, mode, output_dir, samples):
+    watch = Stopwatch()
+    path = Path(output_dir) / f"{classroom.id}_{backend.name}_{mode}.out"
+    started = time.perf_counter()
+    with PeakMemory() as memory:
+        if mode == 'single':
+            cards, size = bench_single(examination, classroom, backend, watch, samples)
+        else:
+            cards, size = bench_class(examination, classroom, backend, mode, watch, path)
+    seconds = time.perf_counter() - started
+    path.unlink(missing_ok=True)
+
+    return {
+        'cards': cards,
+        'seconds': round(seconds, 4),
+        'ms_per_card': round(seconds * 1000 / cards, 2) if cards else None,
+        'stages': {stage: round(watch.stages.get(stage, 0.0), 4) for stage in STAGES},
+        'output_bytes': size,
+        'peak_rss_mb': round(memory.peak / 2 ** 20, 1),
+        'rss_growth_mb': round((memory.peak - memory.before) / 2 ** 20, 1),
+    }
+
+
+def run_benchmark(sizes, modes=BENCHMARK_MODES, backends=('xhtml2pdf', 'reportlab'),
+                  samples=10, seed=1, progress=None):
+    """
+    Benchmark every (class size, backend, mode) in a throwaway database.
+    ``progress(result)`` is called after each case. Returns the report dict.
+    """
+    import tempfile
+    from management.models import Examination, Subject
+
+    for mode in modes:
+        if mode not in BENCHMARK_MODES:
+            raise ValueError(f"Unknown benchmark mode {mode!r}; choose from {', '.join(BENCHMARK_MODES)}")
+    backends = [get_backend(name) for name in backends]
+
+    report = {
+        'created_at': datetime.datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'samples': samples,
+        'results': [],
+    }
+    rnd = random.Random(seed)
+    warmed = set()
+    with benchmark_database(), tempfile.TemporaryDirectory() as output_dir:
+        subjects = [Subject.objects.create(name=f"Subject {number:02d}") for number in range(1, max(s for _, s in sizes) + 1)]
+        examination = Examination.objects.create(name='Benchmark', subject=subjects[0], date=datetime.date.today())
+
+        for students, subject_count in sizes:
+            classroom = seed_class(examination, subjects[:subject_count], students, rnd)
+            unavailable = {}
+            for backend in backends:
+                if backend.name not in warmed:
+                    # Keep template loading and font setup out of the first measured case
+                    try:
+                        run_case(examination, classroom, backend, 'single', output_dir, samples=1)
+                    except Exception:
+                        pass
+                    warmed.add(backend.name)
+                for mode in modes:
+                    if mode == 'concurrent' and backend.name != 'playwright':
+                        continue
+                    result = {'students': students, 'subjects': subject_count, 'backend': backend.name, 'mode': mode}
+                    if backend.name in unavailable:
+                        result['error'] = unavailable[backend.name]
+                    else:
+                        try:
+                            result.update(run_case(examination, classroom, backend, mode, output_dir, samples))
+                        except PDFBackendUnavailable as e:
+                            unavailable[backend.name] = result['error'] = str(e)
+                        except Exception as e:
+                            result['error'] = f"{type(e).__name__}: {e}"
+                    report['results'].append(result)
+                    if progress:
+                        progress(result)
+    return report
+
+
+# ============ REPORTS ============
+
+def result_key(result):
+    return result['students'], result['subjects'], result['backend'], result['mode']
+
+
+def compare_reports(report, baseline):
+    """Add ``vs_baseline`` (ratio of ms per card, above 1 is slower) to each comparable result"""
+    previous = {result_key(result): result for result in baseline.get('results', [])}
+    for result in report['results']:
+        before = previous.get(result_key(result), {})
+        if result.get('ms_per_card') and before.get('ms_per_card'):
+            result['vs_baseline'] = round(result['ms_per_card'] / before['ms_per_card'], 2)
+    return report
+
+
+def markdown_report(report):
+    lines = [
+        f"# Result card benchmark ({report['created_at']})",
+        '',
+        f"Python {report['python']} on {report['platform']}, {report['cpus']} CPUs; "
+        f"single mode renders {report['samples']} students per class.",
+        '',
+        '| Class | Backend | Mode | Cards | Total s | ms/card | '
+        + ' | '.join(f"{stage} s" for stage in STAGES)
+        + ' | Peak RSS MB | RSS growth MB | vs baseline |',
+        '|' + '---|' * (9 + len(STAGES)),
+    ]
+    for result in report['results']:
+        size = f"{result['students']}x{result['subjects']}"
+        if 'error' in result:
+            cells = [size, result['backend'], result['mode'], result['error'][:80]] + [''] * (5 + len(STAGES))
+        else:
+            cells = [
+                size, result['backend'], result['mode'], result['cards'],
+                f"{result['seconds']:.2f}", f"{result['ms_per_card']:.1f}",
+                *(f"{result['stages'][stage]:.3f}" for stage in STAGES),
+                f"{result['peak_rss_mb']:.1f}", f"{result['rss_growth_mb']:.1f}",
+                f"{result['vs_baseline']:.2f}x" if 'vs_baseline' in result else '-',
+            ]
+        lines.append('| ' + ' | '.join(str(cell) for cell in cells) + ' |')
+    return '\n'.join(lines) + '\n'
+
+
+def write_report(report, json_path=None, markdown_path=None):
+    if json_path:
+        Path(json_path).write_text(json.dumps(report, indent=2))
+    if markdown_path:
+        Path(markdown_path).write_text(markdown_report(report))
@@ -0,0 +1,444 @@
+# ResultManagement/cards.py
+import asyncio
+import logging
+import os
+import queue
+import re
+import threading
+import zipfile
+from io import BytesIO
+from pathlib import Path
+
+from django.conf import settings
+from django.db.models import Prefetch
+
+from .jobs import job_handler, update_progress
+from .pdf_backends import PDFBackendUnavailable, get_backend, pdf_backend_settings, render_with_fallback
+from .pdf_cache import card_cache_key, cached_render, get_cached_pdf, pdf_cache_enabled, store_pdf
+from .pdf_optimize import PDFOptimizer
+from .rankings import attach_standings
+from .renderer import RendererError, RendererUnavailable, ensure_renderer, renderer_settings
+
+logger = logging.getLogger(__name__)
+
+SCHOOL_INFO = {
+    'name': 'Siddhartha Academy',
+    'address': 'Sallaghari,Srijana Nagar-Bhaktapur',
+    'phone': '01- 6615178'
+}
+
+# Write progress to the job row every this many students
+PROGRESS_EVERY = 5
+
+# How a bulk job lays out a class: a PDF per student rendered one by one,
+# one combined PDF, one combined render split back into a PDF per student,
+# or a PDF per student with several rendering at once in the shared browser
+BULK_PDF_MODES = ('cards', 'combined', 'split', 'concurrent')
+
+# PDFs are already compressed; deflating them again costs CPU for ~1% size
+PDF_ZIP_COMPRESSION = zipfile.ZIP_STORED
+
+# Printed (invisibly) at the top of each card of a class document
+CARD_MARKER = re.compile(r'\[\[\s*card\s*:\s*(\d+)\s*\]\]')
+
+
+def card_context(student, examination, overall_result, subject_results, class_rank):
+    """Template context of one student's result card"""
+    return {
+        'student': student,
+        'exam': examination,
+        'overall_result': overall_result,
+        'subject_results': attach_standings(subject_results, class_rank),
+        'class_rank': class_rank,
+        'school_info': SCHOOL_INFO,
+        'attendance_days': 59,
+        'total_days': 67,
+        'current_date': examination.date,
+    }
+
+
+def class_card_contexts(examination, classroom):
+    """
+    Result card contexts of every active student of a class with an overall
+    result in the examination, in roll number order, from four queries
+    """
+    from management.models import Student
+    from .models import ClassRank, StudentOverallResult, StudentResult
+
+    students = list(Student.objects.filter(
+        classroom=classroom,
+        is_active=True,
+        overall_results__examination=examination
+    ).select_related('classroom').prefetch_related(
+        Prefetch(
+            'overall_results',
+            queryset=StudentOverallResult.objects.filter(examination=examination),
+            to_attr='exam_overall_results'
+        ),
+        Prefetch(
+            'results',
+            queryset=StudentResult.objects.filter(examination=examination).select_related(
+                'subject', 'exam_config'
+            ).order_by('subject__name'),
+            to_attr='exam_results'
+        ),
+    ).order_by('roll_number'))
+
+    class_ranks = {
+        class_rank.student_id: class_rank
+        for class_rank in ClassRank.objects.filter(examination=examination, classroom=classroom)
+    }
+
+    return [
+        (student, card_context(
+            student, examination, student.exam_overall_results[0],
+            student.exam_results, class_ranks.get(student.id)
+        ))
+        for student in students
+    ]
+
+
+def render_card(context, backend=None, bulk=False):
+    """
+    Result card PDF from the PDF cache, drawn only when its inputs changed.
+    ``backend`` picks the PDF backend (default: the DEFAULT or, with
+    ``bulk``, the BULK one of settings), falling back when it is unavailable
+    or fails on this card. Returns (pdf bytes, whether it was cached, name of the backend used).
+    """
+    (pdf, cached), used = render_with_fallback(
+        context,
+        lambda pdf_backend, card: cached_render(card, pdf_backend.version(), pdf_backend.render),
+        name=backend,
+        bulk=bulk,
+    )
+    return pdf, cached, used.name
+
+
+def card_filename(student):
+    return f"{student.first_name}_{student.last_name}_{student.roll_number}.pdf"
+
+
+def render_class_document(cards, backend=None):
+    """
+    Every card of ``class_card_contexts()`` as one PDF, one card per page,
+    from a single render. Returns (pdf bytes, name of the backend used).
+    """
+    pdf, used = render_with_fallback(
+        [context for _, context in cards],
+        lambda pdf_backend, contexts: pdf_backend.render_many(contexts),
+        name=backend,
+        bulk=True,
+    )
+    return pdf, used.name
+
+
+def split_class_document(pdf, cards):
+    """
+    Split a class document back into ``(student, pdf bytes)`` per card,
+    using the marker each card starts with, so a card may span pages
+    """
+    from pypdf import PdfReader, PdfWriter
+
+    reader = PdfReader(BytesIO(pdf))
+    students = {student.id: student for student, _ in cards}
+    if len(reader.pages) == len(cards):
+        # Every card starts a new page, so each has exactly one
+        page_groups = [(student, [page]) for (student, _), page in zip(cards, reader.pages)]
+    else:
+        page_groups = []
+        for page in reader.pages:
+            match = CARD_MARKER.search(page.extract_text() or '')
+            if match and int(match.group(1)) in students:
+                page_groups.append((students[int(match.group(1))], [page]))
+            elif page_groups:
+                page_groups[-1][1].append(page)
+            else:
+                raise RendererError("The class document does not start with a card marker.")
+
+    if len(page_groups) != len(cards):
+        raise RendererError(f"Found {len(page_groups)} of {len(cards)} cards in the class document.")
+
+    for student, pages in page_groups:
+        writer = PdfWriter()
+        for page in pages:
+            writer.add_page(page)
+        output = BytesIO()
+        writer.write(output)
+        yield student, output.getvalue()
+
+
+# ============ BULK PDF JOBS ============
+
+def bulk_pdf_dir():
+    """Directory of finished class ZIPs; outside MEDIA_ROOT so only the download view serves them"""
+    return Path(getattr(settings, 'RESULT_PDF_OUTPUT_DIR', settings.BASE_DIR / 'generated_pdfs'))
+
+
+def bulk_pdf_path(job):
+    """Path of a finished bulk PDF job's ZIP, or None"""
+    filename = job.result.get('file')
+    if not filename:
+        return None
+    path = bulk_pdf_dir() / filename
+    return path if path.exists() else None
+
+
+@job_handler('bulk_pdf')
+def run_bulk_pdf_job(job):
+    """
+    Background job: render the result card of every student of
+    ``params['class_id']`` in ``params['exam_id']`` into a file on disk,
+    laid out as ``params['mode']`` (one of BULK_PDF_MODES)
+    """
+    from management.models import Class, Examination
+
+    examination = Examination.objects.get(id=job.params['exam_id'])
+    classroom = Class.objects.get(id=job.params['class_id'])
+    mode = job.params.get('mode', 'cards')
+    if mode not in BULK_PDF_MODES:
+        raise ValueError(f"Unknown bulk PDF mode {mode!r}")
+
+    cards = class_card_contexts(examination, classroom)
+    update_progress(job, 0, len(cards))
+    if not cards:
+        raise ValueError("No students with results found for this class and exam.")
+
+    output_dir = bulk_pdf_dir()
+    output_dir.mkdir(parents=True, exist_ok=True)
+    extension = class_output_extension(mode)
+    filename = f"job_{job.id}.{extension}"
+    summary = write_class_output(
+        cards, output_dir / filename, mode, job.params.get('backend'),
+        on_progress=lambda done: update_progress(job, done),
+        concurrency=job.params.get('concurrency'),
+        optimize=job.params.get('optimize'),
+    )
+    return {
+        'file': filename,
+        'download_name': f"{examination.name}_{classroom.name}_results.{extension}",
+        'mode': mode,
+        **summary,
+        'size': (output_dir / filename).stat().st_size,
+    }
+
+
+def class_output_extension(mode):
+    return 'pdf' if mode == 'combined' else 'zip'
+
+
+def write_class_output(cards, path, mode='cards', backend=None, on_progress=None, concurrency=None, optimize=None):
+    """
+    Write the cards of ``class_card_contexts()`` to ``path`` laid out as
+    ``mode``, calling ``on_progress(cards done)`` along the way. Every PDF
+    is shrunk with the ``optimize`` profile (see pdf_optimize.py) on its
+    way in. The file appears only once complete. Returns a summary of what
+    was rendered and the bytes the optimisation saved.
+    """
+    if mode not in BULK_PDF_MODES:
+        raise ValueError(f"Unknown bulk PDF mode {mode!r}")
+    optimizer = PDFOptimizer(optimize)
+
+    # Written under a temporary name so a download never sees a half-written file
+    partial_path = path.with_name(f"{path.name}.part")
+    try:
+        if mode == 'cards':
+            summary = write_card_zip(cards, partial_path, backend, on_progress, optimizer)
+        elif mode == 'concurrent':
+            summary = write_card_zip_concurrently(cards, partial_path, backend, on_progress, concurrency, optimizer)
+        else:
+            pdf, used = render_class_document(cards, backend)
+            if mode == 'combined':
+                partial_path.write_bytes(optimizer(pdf))
+            else:
+                with zipfile.ZipFile(partial_path, 'w', PDF_ZIP_COMPRESSION) as zip_file:
+                    for student, pdf_bytes in split_class_document(pdf, cards):
+                        zip_file.writestr(card_filename(student), optimizer(pdf_bytes))
+            if on_progress:
+                on_progress(len(cards))
+            summary = {
+                'pdfs': len(cards), 'cached': 0, 'backends': {used: len(cards)}, 'errors': [], 'failed_students': [],
+            }
+    except BaseException:
+        partial_path.unlink(missing_ok=True)
+        raise
+
+    os.replace(partial_path, path)
+    return {**summary, 'optimization': optimizer.summary()}
+
+
+def write_card_zip(cards, path, backend=None, on_progress=None, optimize=None):
+    """ZIP of a PDF per card, each from the PDF cache or rendered on its own"""
+    pdf_count = 0
+    cached_count = 0
+    backends = {}
+    errors = []
+    failed_students = []
+
+    with zipfile.ZipFile(path, 'w', PDF_ZIP_COMPRESSION) as zip_file:
+        for index, (student, context) in enumerate(cards, 1):
+            try:
+                pdf_bytes, cached, used = render_card(context, backend, bulk=True)
+                zip_file.writestr(card_filename(student), optimize(pdf_bytes) if optimize else pdf_bytes)
+                pdf_count += 1
+                cached_count += cached
+                backends[used] = backends.get(used, 0) + 1
+            except RendererError as e:
+                # Every backend failed on this card; the rest of the class still goes in
+                logger.error("PDF generation failed for student %s: %s", student.id, e)
+                errors.append(f"{student.first_name} {student.last_name} ({student.roll_number}): {e}")
+                failed_students.append(student.id)
+
+            if on_progress and (index % PROGRESS_EVERY == 0 or index == len(cards)):
+                on_progress(index)
+
+    if not pdf_count:
+        raise RendererError(f"No PDFs were generated. First error: {errors[0]}")
+
+    return {
+        'pdfs': pdf_count, 'cached': cached_count, 'backends': backends,
+        'errors': errors, 'failed_students': failed_students,
+    }
+
+
+def write_card_zip_concurrently(cards, path, backend=None, on_progress=None, concurrency=None, optimize=None):
+    """
+    ZIP of a PDF per card drawn by the shared browser, keeping up to
+    ``concurrency`` cards (default: the renderer's CONCURRENCY, then PAGES)
+    rendering at once. The card data is all loaded beforehand and the event
+    loop runs on a thread of its own, so no coroutine touches the database:
+    PDFs come back to this thread, which alone writes the ZIP and reports
+    progress. When the browser is unavailable, the cards left are rendered
+    one by one with ``backend`` and its fallbacks.
+    """
+    conf = renderer_settings()
+    concurrency = max(1, int(concurrency or conf['CONCURRENCY'] or conf['PAGES']))
+    playwright = get_backend('playwright')
+    version = playwright.version()
+    summary = {
+        'pdfs': 0, 'cached': 0, 'backends': {}, 'errors': [], 'failed_students': [], 'concurrency': concurrency,
+    }
+    handled = set()
+
+    with zipfile.ZipFile(path, 'w', PDF_ZIP_COMPRESSION) as zip_file:
+        def write(student, pdf_bytes=None, error=None, used=None, cached=False):
+            if error is None:
+                zip_file.writestr(card_filename(student), optimize(pdf_bytes) if optimize else pdf_bytes)
+                summary['pdfs'] += 1
+                summary['cached'] += cached
+                summary['backends'][used] = summary['backends'].get(used, 0) + 1
+            else:
+                logger.error("PDF generation failed for student %s: %s", student.id, error)
+                summary['errors'].append(f"{student.first_name} {student.last_name} ({student.roll_number}): {error}")
+                summary['failed_students'].append(student.id)
+            handled.add(student.id)
+            if on_progress and (len(handled) % PROGRESS_EVERY == 0 or len(handled) == len(cards)):
+                on_progress(len(handled))
+
+        # Cached cards go straight in; only the rest need the browser
+        pending = []
+        for student, context in cards:
+            key = card_cache_key(context, version) if pdf_cache_enabled() else None
+            pdf_bytes = get_cached_pdf(key) if key else None
+            if pdf_bytes is None:
+                pending.append((student, context, key))
+            else:
+                write(student, pdf_bytes, used=playwright.name, cached=True)
+
+        try:
+            if pending:
+                ensure_renderer()
+                for (student, _, key), pdf_bytes, error in render_cards_in_thread(pending, playwright, concurrency):
+                    if error is None and key:
+                        store_pdf(key, pdf_bytes)
+                    write(student, pdf_bytes, error, used=playwright.name)
+        except (RendererUnavailable, PDFBackendUnavailable) as e:
+            logger.warning("Rendering the remaining cards one by one: %s", e)
+            playwright.mark_unavailable(pdf_backend_settings()['RETRY_AFTER'])
+            for student, context, _ in pending:
+                if student.id in handled:
+                    continue
+                try:
+                    pdf_bytes, cached, used = render_card(context, backend, bulk=True)
+                except RendererError as error:
+                    write(student, error=error)
+                else:
+                    write(student, pdf_bytes, used=used, cached=cached)
+
+    if not summary['pdfs']:
+        raise RendererError(f"No PDFs were generated. First error: {summary['errors'][0]}")
+    return summary
+
+
+def render_cards_in_thread(pending, backend, concurrency):
+    """
+    ``render_cards_concurrently()`` on an event loop of its own thread,
+    yielding each ``(item, pdf bytes, error)`` to the calling thread as it
+    finishes. The ORM refuses to run inside an event loop, so whatever the
+    caller does with a result (saving progress, caching the PDF) stays out
+    of it. Raises the PDFBackendUnavailable that stops the renders.
+    """
+    results = queue.Queue()
+    finished = object()
+    stopping = threading.Event()
+
+    def rendered(*result):
+        if stopping.is_set():
+            raise asyncio.CancelledError
+        results.put(result)
+
+    def run():
+        try:
+            asyncio.run(render_cards_concurrently(pending, backend, concurrency, rendered))
+        except BaseException as e:
+            results.put((finished, e))
+        else:
+            results.put((finished, None))
+
+    thread = threading.Thread(target=run, name='result-card-renders', daemon=True)
+    thread.start()
+    try:
+        while True:
+            result = results.get()
+            if result[0] is finished:
+                if result[1] is not None and not isinstance(result[1], asyncio.CancelledError):
+                    raise result[1]
+                return
+            yield result
+    finally:
+        # The caller gave up early (an error writing the ZIP): cancel the renders left
+        stopping.set()
+        thread.join()
+
+
+async def render_cards_concurrently(pending, backend, concurrency, rendered):
+    """
+    Render ``(student, context, cache key)`` items with
+    ``backend.render_async()``, at most ``concurrency`` at a time, and pass
+    each result to ``rendered(item, pdf bytes, error)`` from this coroutine
+    alone. Stops at the first PDFBackendUnavailable.
+    """
+    slots = asyncio.Semaphore(concurrency)
+    results = asyncio.Queue()
+    tasks = []
+
+    async def render_one(item):
+        try:
+            result = (item, await backend.render_async(item[1]), None)
+        except Exception as e:
+            result = (item, None, e)
+        finally:
+            slots.release()
+        results.put_nowait(result)
+
+    async def produce():
+        for item in pending:
+            await slots.acquire()
+            tasks.append(asyncio.create_task(render_one(item)))
+
+    producer = asyncio.create_task(produce())
+    for _ in pending:
+        item, pdf_bytes, error = await results.get()
+        if isinstance(error, PDFBackendUnavailable):
+            raise error
+        rendered(item, pdf_bytes, error)
+    await producer
@@ -0,0 +1,79 @@
+# ResultManagement/exports.py
+import csv
+
+from django.db.models import F, FilteredRelation, Q
+
+from .models import StudentResult
+
+# (header, value path) of each exported column, one row per subject result
+# with the student's overall result and class rank repeated alongside
+EXPORT_COLUMNS = [
+    ('Examination', 'examination__name'),
+    ('Class', 'exam_config__classroom__name'),
+    ('Section', 'exam_config__classroom__section'),
+    ('Roll No.', 'student__roll_number'),
+    ('First Name', 'student__first_name'),
+    ('Last Name', 'student__last_name'),
+    ('Subject', 'subject__name'),
+    ('Theory Marks', 'theory_marks'),
+    ('Practical Marks', 'practical_marks'),
+    ('Total Marks', 'total_marks'),
+    ('Full Marks', 'full_marks'),
+    ('Percentage', 'percentage'),
+    ('Grade', 'grade'),
+    ('Grade Point', 'grade_point'),
+    ('Passed', 'is_passed'),
+    ('Overall Marks', 'overall__total_marks_obtained'),
+    ('Overall Full Marks', 'overall__total_full_marks'),
+    ('Overall Percentage', 'overall__overall_percentage'),
+    ('CGPA', 'overall__cgpa'),
+    ('Overall Grade', 'overall__overall_grade'),
+    ('Promoted', 'overall__is_promoted'),
+    ('Rank', 'rank__rank'),
+]
+
+
+class Echo:
+    """File-like object that hands each written CSV line straight back"""
+
+    def write(self, value):
+        return value
+
+
+def export_queryset(examination_id, classroom_id=None, subject_id=None):
+    """Every subject result of an examination joined to its overall result and rank in one query"""
+    results = StudentResult.objects.filter(examination_id=examination_id)
+    if classroom_id:
+        results = results.filter(exam_config__classroom_id=classroom_id)
+    if subject_id:
+        results = results.filter(subject_id=subject_id)
+
+    return results.annotate(
+        overall=FilteredRelation(
+            'student__overall_results',
+            condition=Q(student__overall_results__examination_id=F('examination_id')),
+        ),
+        # A student transferred mid-year may have rank rows in more than one class
+        rank=FilteredRelation(
+            'student__class_ranks',
+            condition=Q(
+                student__class_ranks__examination_id=F('examination_id'),
+                student__class_ranks__classroom_id=F('exam_config__classroom_id'),
+            ),
+        ),
+        full_marks=F('exam_config__full_theory_marks') + F('exam_config__full_practical_marks'),
+    ).order_by(
+        'exam_config__classroom__name', 'exam_config__classroom__section',
+        'student__roll_number', 'student_id', 'subject__name',
+    ).values_list(*(path for _, path in EXPORT_COLUMNS))
+
+
+def export_results_csv(examination_id, classroom_id=None, subject_id=None, chunk_size=2000):
+    """Yield the results export as CSV lines, reading the database in chunks"""
+    writer = csv.writer(Echo())
+    yield writer.writerow([header for header, _ in EXPORT_COLUMNS])
+    for row in export_queryset(examination_id, classroom_id, subject_id).iterator(chunk_size=chunk_size):
+        yield writer.writerow([
+            ('Yes' if value else 'No') if isinstance(value, bool) else ('' if value is None else value)
+            for value in row
+        ])
@@ -0,0 +1,478 @@
+# ResultManagement/grading.py
+import time
+import uuid
+from bisect import bisect_right
+from decimal import Decimal
+
+import numpy as np
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+from .jobs import job_handler, update_progress
+
+
+# Fields written by the batch grading engine when a marks sheet is saved
+GRADED_FIELDS = [
+    'exam_config', 'theory_marks', 'practical_marks',
+    'total_marks', 'percentage', 'grade', 'grade_point',
+    'is_passed', 'is_theory_passed', 'is_practical_passed',
+    'entered_by', 'updated_at',
+]
+
+
+# Built-in ladders, used until grading scales are configured in the database.
+# Each entry is (lowest value, grade, grade point), highest first.
+DEFAULT_SUBJECT_SCALE = [
+    (90, 'A+', Decimal('4.00')),
+    (80, 'A', Decimal('3.70')),
+    (70, 'B+', Decimal('3.30')),
+    (60, 'B', Decimal('3.00')),
+    (50, 'C+', Decimal('2.70')),
+    (40, 'C', Decimal('2.30')),
+    (0, 'D', Decimal('2.00')),
+]
+DEFAULT_OVERALL_SCALE = [
+    (Decimal('3.8'), 'A+', None),
+    (Decimal('3.5'), 'A', None),
+    (Decimal('3.0'), 'B+', None),
+    (Decimal('2.7'), 'B', None),
+    (Decimal('2.3'), 'C+', None),
+    (Decimal('2.0'), 'C', None),
+    (0, 'F', None),
+]
+
+SCALE_VERSION_KEY = 'grading_scale_version'
+
+
+class CompiledScale:
+    """A grading ladder compiled into a sorted boundary array for bisection"""
+
+    __slots__ = ('bounds', 'grades', 'points', 'fail_grade', 'fail_grade_point', '_bounds', '_grades', '_points')
+
+    def __init__(self, boundaries, fail_grade='F', fail_grade_point=Decimal('0.00')):
+        boundaries = sorted(boundaries, key=lambda boundary: boundary[0])
+        self.bounds = [float(min_value) for min_value, _, _ in boundaries]
+        self.grades = [grade for _, grade, _ in boundaries]
+        self.points = [grade_point for _, _, grade_point in boundaries]
+        self.fail_grade = fail_grade
+        self.fail_grade_point = fail_grade_point
+        # NumPy copies for grade_many(); object arrays keep the Decimal points
+        self._bounds = np.array(self.bounds, dtype=np.float64)
+        self._grades = np.array(self.grades + [fail_grade], dtype=object)
+        self._points = np.array(self.points + [fail_grade_point], dtype=object)
+
+    def lookup(self, value):
+        """Return (grade, grade point) for a percentage or CGPA"""
+        index = max(bisect_right(self.bounds, float(value or 0)) - 1, 0)
+        return self.grades[index], self.points[index]
+
+    def grade(self, percentage, is_passed=True):
+        if not is_passed:
+            return self.fail_grade, self.fail_grade_point
+        return self.lookup(percentage)
+
+    def grade_many(self, percentages, passed=None):
+        """
+        Grade a whole array of percentages (and pass flags) with one
+        searchsorted over the boundaries. Returns a list of (grade, grade
+        point) pairs, the same as calling grade() on each.
+        """
+        values = np.fromiter((float(percentage or 0) for percentage in percentages), dtype=np.float64)
+        indexes = np.maximum(np.searchsorted(self._bounds, values, side='right') - 1, 0)
+        if passed is not None:
+            # The extra last entry of the grade and point arrays is the fail grade
+            indexes[~np.fromiter(passed, dtype=bool, count=len(indexes))] = len(self.bounds)
+        return list(zip(self._grades[indexes].tolist(), self._points[indexes].tolist()))
+
+
+# Seconds between checks of the shared version stamp; changes made in this
+# process take effect immediately, other processes notice within this window
+SCALE_VERSION_CHECK_INTERVAL = 1.0
+
+_compiled = {'version': None, 'checked_at': 0.0, 'scales': {}}
+
+
+def _compile_scales():
+    """Compile every stored scale, keyed by kind and then by class id (None for the default)"""
+    from .models import GradingScale
+
+    scales = {
+        GradingScale.SUBJECT: {None: CompiledScale(DEFAULT_SUBJECT_SCALE)},
+        GradingScale.OVERALL: {None: CompiledScale(DEFAULT_OVERALL_SCALE)},
+    }
+    for scale in GradingScale.objects.prefetch_related('boundaries', 'classes'):
+        boundaries = [
+            (boundary.min_value, boundary.grade, boundary.grade_point)
+            for boundary in scale.boundaries.all()
+        ]
+        if not boundaries:
+            continue
+        compiled = CompiledScale(boundaries, scale.fail_grade, scale.fail_grade_point)
+        if scale.is_default:
+            scales[scale.kind][None] = compiled
+        for classroom in scale.classes.all():
+            scales[scale.kind][classroom.id] = compiled
+    return scales
+
+
+def bump_scale_version():
+    """Invalidate every process's compiled grading scales"""
+    cache.set(SCALE_VERSION_KEY, uuid.uuid4().hex, None)
+    _compiled['checked_at'] = 0.0
+
+
+def _current_scale_version():
+    now = time.monotonic()
+    if now - _compiled['checked_at'] < SCALE_VERSION_CHECK_INTERVAL:
+        return _compiled['version']
+
+    version = cache.get(SCALE_VERSION_KEY)
+    if version is None:
+        cache.add(SCALE_VERSION_KEY, uuid.uuid4().hex, None)
+        version = cache.get(SCALE_VERSION_KEY)
+    _compiled['checked_at'] = now
+    return version
+
+
+def get_grading_scale(kind='subject', classroom_id=None):
+    """
+    The compiled grading scale of ``kind`` for a class. Scales are compiled
+    once per process and recompiled only when the shared version stamp moves.
+    """
+    version = _current_scale_version()
+    if _compiled['version'] != version or not _compiled['scales']:
+        _compiled['scales'] = _compile_scales()
+        _compiled['version'] = version
+
+    scales = _compiled['scales'][kind]
+    return scales.get(classroom_id) or scales[None]
+
+
+def calculate_grade_and_gpa(percentage, is_passed, scale=None):
+    """Calculate grade and GPA based on percentage"""
+    scale = scale or get_grading_scale('subject')
+    return scale.grade(percentage, is_passed)
+
+
+def calculate_marks(config, theory_marks, practical_marks):
+    """
+    Calculate total marks, percentage, and pass status for one student's
+    marks under ``config``. Returns a dict of StudentResult fields.
+    """
+    # Calculate total marks
+    theory = theory_marks or 0
+    practical = practical_marks or 0
+    total_marks = theory + practical
+
+    # Calculate percentage
+    full_marks = config.full_theory_marks + (config.full_practical_marks or 0)
+    if full_marks > 0:
+        percentage = (total_marks / full_marks) * 100
+    else:
+        percentage = 0
+
+    # Check pass status
+    is_theory_passed = theory >= config.pass_theory_marks
+    if config.has_practical:
+        is_practical_passed = practical >= config.pass_practical_marks
+    else:
+        is_practical_passed = True
+
+    return {
+        'total_marks': total_marks,
+        'percentage': percentage,
+        'is_passed': is_theory_passed and is_practical_passed,
+        'is_theory_passed': is_theory_passed,
+        'is_practical_passed': is_practical_passed,
+    }
+
+
+def calculate_result(config, theory_marks, practical_marks, scale=None):
+    """
+    Calculate total marks, percentage, grade, and pass status for one
+    student's marks under ``config``. Returns a dict of StudentResult fields.
+    """
+    fields = calculate_marks(config, theory_marks, practical_marks)
+    scale = scale or get_grading_scale('subject', config.classroom_id)
+    fields['grade'], fields['grade_point'] = scale.grade(fields['percentage'], fields['is_passed'])
+    return fields
+
+
+def build_results(config, marks, entered_by=None):
+    """
+    Build graded (unsaved) StudentResult rows for a whole marks sheet.
+
+    ``marks`` maps a Student or student id to a (theory, practical) pair.
+    """
+    from .models import StudentResult
+
+    now = timezone.now()
+    results = []
+    for student, (theory_marks, practical_marks) in marks.items():
+        student_id = getattr(student, 'pk', student)
+        result = StudentResult(
+            examination_id=config.examination_id,
+            student_id=student_id,
+            subject_id=config.subject_id,
+            exam_config=config,
+            theory_marks=theory_marks,
+            practical_marks=practical_marks,
+            entered_by=entered_by,
+            created_at=now,
+            updated_at=now,
+        )
+        for field, value in calculate_marks(config, theory_marks, practical_marks).items():
+            setattr(result, field, value)
+        results.append(result)
+
+    # Grade the whole sheet against the class's scale in one call
+    scale = get_grading_scale('subject', config.classroom_id)
+    graded = scale.grade_many(
+        [result.percentage for result in results],
+        [result.is_passed for result in results],
+    )
+    for result, (grade, grade_point) in zip(results, graded):
+        result.grade, result.grade_point = grade, grade_point
+    return results
+
+
+def save_results(results, batch_size=500):
+    """
+    Persist graded StudentResult rows with one bulk upsert.
+
+    bulk_create() does not fire post_save signals, so the affected overall
+    results are scheduled for recompute here instead.
+    """
+    from .models import StudentResult
+    from .recompute import schedule_overall_recompute
+
+    if results:
+        StudentResult.objects.bulk_create(
+            results,
+            batch_size=batch_size,
+            update_conflicts=True,
+            unique_fields=['examination', 'student', 'subject'],
+            update_fields=GRADED_FIELDS,
+        )
+        schedule_overall_recompute(
+            (result.examination_id, result.student_id) for result in results
+        )
+    return results
+
+
+def grade_marks_sheet(config, marks, entered_by=None, batch_size=500):
+    """Grade a whole marks sheet in one pass and persist it with one bulk upsert"""
+    return save_results(build_results(config, marks, entered_by=entered_by), batch_size=batch_size)
+
+
+def parse_marks(value, full_marks, label):
+    """Parse a submitted mark; None when blank, ValueError when out of bounds"""
+    if value is None or value == '':
+        return None
+    try:
+        marks = Decimal(str(value).strip())
+    except ArithmeticError:
+        raise ValueError(f"{label} marks must be a number")
+    if not marks.is_finite() or marks < 0 or marks > full_marks:
+        raise ValueError(f"{label} marks must be between 0 and {full_marks}")
+    return marks
+
+
+def diff_marks_sheet(config, marks, versions=None):
+    """
+    Split a submitted marks sheet into the rows that differ from what is
+    stored and the rows that can be skipped.
+
+    ``versions`` maps a student id to the ``updated_at`` the sheet was loaded
+    with (None for a row that did not exist yet); a changed row whose stored
+    result moved on since then is stale and is left alone rather than
+    overwriting someone else's entry.
+
+    Returns ``(changed, unchanged, stale)``: the subset of ``marks`` to save,
+    the number of untouched rows and the list of stale students.
+    """
+    from .models import StudentResult
+
+    versions = versions or {}
+    existing = {
+        result.student_id: result
+        for result in StudentResult.objects.filter(
+            examination_id=config.examination_id,
+            subject_id=config.subject_id,
+            student_id__in=[getattr(student, 'pk', student) for student in marks]
+        ).only('student_id', 'exam_config_id', 'theory_marks', 'practical_marks', 'updated_at')
+    }
+
+    changed = {}
+    unchanged = 0
+    stale = []
+    for student, (theory_marks, practical_marks) in marks.items():
+        student_id = getattr(student, 'pk', student)
+        result = existing.get(student_id)
+        if result is not None and (
+            result.exam_config_id == config.id
+            and result.theory_marks == theory_marks
+            and result.practical_marks == practical_marks
+        ):
+            unchanged += 1
+            continue
+        if result is not None and student_id in versions and result.updated_at != versions[student_id]:
+            stale.append(student)
+            continue
+        changed[student] = (theory_marks, practical_marks)
+    return changed, unchanged, stale
+
+
+# ExamConfiguration fields that change the grading of existing results
+THRESHOLD_FIELDS = [
+    'full_theory_marks', 'pass_theory_marks',
+    'full_practical_marks', 'pass_practical_marks', 'has_practical',
+]
+
+# Fields rewritten by a regrade; marks and entered_by are left as entered
+REGRADED_FIELDS = [
+    'total_marks', 'percentage', 'grade', 'grade_point',
+    'is_passed', 'is_theory_passed', 'is_practical_passed', 'updated_at',
+]
+
+
+def thresholds(config):
+    return tuple(getattr(config, field) for field in THRESHOLD_FIELDS)
+
+
+THRESHOLDS_CACHE_KEY = 'exam_config_thresholds:v2:{}'
+
+
+def threshold_payload(config):
+    """
+    Compact, JSON-safe bounds of a configuration for checking marks without
+    the database. ``version`` changes whenever the configuration is saved.
+    """
+    return {
+        'id': config.id,
+        'classroom_id': config.classroom_id,
+        'subject_id': config.subject_id,
+        'version': config.updated_at.isoformat() if config.updated_at else '',
+        'full_theory': float(config.full_theory_marks),
+        'pass_theory': float(config.pass_theory_marks),
+        'has_practical': config.has_practical,
+        'full_practical': float(config.full_practical_marks or 0),
+        'pass_practical': float(config.pass_practical_marks or 0),
+    }
+
+
+def get_thresholds(config_id):
+    """The threshold payload of a configuration, from the cache when possible; None if it does not exist"""
+    from .models import ExamConfiguration
+
+    key = THRESHOLDS_CACHE_KEY.format(config_id)
+    payload = cache.get(key)
+    if payload is None:
+        config = ExamConfiguration.objects.filter(id=config_id).first()
+        if config is None:
+            return None
+        payload = threshold_payload(config)
+        cache.set(key, payload, None)
+    return payload
+
+
+def invalidate_thresholds(config_id):
+    cache.delete(THRESHOLDS_CACHE_KEY.format(config_id))
+
+
+def check_marks(payload, theory_marks, practical_marks):
+    """
+    Pass/fail status of one row of marks against a threshold payload, as
+    ``theory_status``, ``practical_status`` and ``overall_status`` each
+    'pass', 'fail' or 'invalid'. Blank marks are not judged.
+    """
+    def status(value, full_marks, pass_marks):
+        if value is None or value == '':
+            return 'pass'
+        try:
+            value = float(value)
+        except (ValueError, TypeError):
+            return 'invalid'
+        if not 0 <= value <= full_marks:
+            return 'invalid'
+        return 'pass' if value >= pass_marks else 'fail'
+
+    theory_status = status(theory_marks, payload['full_theory'], payload['pass_theory'])
+    if payload['has_practical']:
+        practical_status = status(practical_marks, payload['full_practical'], payload['pass_practical'])
+    else:
+        practical_status = 'pass'
+
+    if 'fail' in (theory_status, practical_status):
+        overall_status = 'fail'
+    elif 'invalid' in (theory_status, practical_status):
+        overall_status = 'invalid'
+    else:
+        overall_status = 'pass'
+    return {
+        'theory_status': theory_status,
+        'practical_status': practical_status,
+        'overall_status': overall_status,
+    }
+
+
+def regrade_configuration(config, chunk_size=500, on_chunk=None):
+    """
+    Regrade every StudentResult of one configuration against its current
+    thresholds, ``chunk_size`` rows per transaction. The overall results of
+    each chunk are recomputed when that chunk commits.
+    """
+    from .models import StudentResult
+    from .recompute import schedule_overall_recompute
+
+    result_ids = list(StudentResult.objects.filter(exam_config=config).order_by('id').values_list('id', flat=True))
+    scale = get_grading_scale('subject', config.classroom_id)
+
+    for start in range(0, len(result_ids), chunk_size):
+        with transaction.atomic():
+            results = list(StudentResult.objects.filter(id__in=result_ids[start:start + chunk_size]))
+            now = timezone.now()
+            for result in results:
+                for field, value in calculate_marks(config, result.theory_marks, result.practical_marks).items():
+                    setattr(result, field, value)
+                result.updated_at = now
+            graded = scale.grade_many(
+                [result.percentage for result in results],
+                [result.is_passed for result in results],
+            )
+            for result, (grade, grade_point) in zip(results, graded):
+                result.grade, result.grade_point = grade, grade_point
+
+            StudentResult.objects.bulk_create(
+                results,
+                update_conflicts=True,
+                unique_fields=['examination', 'student', 'subject'],
+                update_fields=REGRADED_FIELDS,
+            )
+            schedule_overall_recompute((result.examination_id, result.student_id) for result in results)
+        if on_chunk:
+            on_chunk(len(results))
+    return len(result_ids)
+
+
+@job_handler('regrade')
+def run_regrade_job(job, chunk_size=500):
+    """Background job: regrade the results of ``params['config_ids']``"""
+    from .models import ExamConfiguration, StudentResult
+
+    configs = list(ExamConfiguration.objects.filter(id__in=job.params.get('config_ids', [])))
+    total = StudentResult.objects.filter(exam_config__in=configs).count()
+    update_progress(job, 0, total)
+
+    done = 0
+
+    def advance(count):
+        nonlocal done
+        done += count
+        update_progress(job, done)
+
+    for config in configs:
+        regrade_configuration(config, chunk_size=chunk_size, on_chunk=advance)
+
+    return {'configurations': len(configs), 'results_regraded': done}
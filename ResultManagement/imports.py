@@ -0,0 +1,227 @@
+# ResultManagement/imports.py
+import csv
+import io
+import re
+
+from django.db import transaction
+
+from management.models import Student
+from .grading import build_results, diff_marks_sheet, parse_marks, save_results
+
+IMPORT_EXTENSIONS = ('.csv', '.xlsx')
+
+ROLL_NUMBER_HEADERS = ('roll_number', 'roll_no', 'roll')
+THEORY_HEADERS = ('theory', 'theory_marks', 'th')
+PRACTICAL_HEADERS = ('practical', 'practical_marks', 'pr')
+
+# Rows with errors beyond this are counted but not listed in the report
+MAX_REPORTED_ERRORS = 500
+
+
+class ImportFileError(ValueError):
+    """The uploaded file as a whole cannot be imported"""
+
+
+def normalize_header(value):
+    return re.sub(r'[^a-z0-9]+', '_', str(value or '').strip().lower()).strip('_')
+
+
+def clean_cell(value):
+    """Spreadsheet cell as text; whole floats (roll numbers read from XLSX) lose their '.0'"""
+    if value is None:
+        return ''
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value).strip()
+
+
+def _csv_rows(upload):
+    text = io.TextIOWrapper(upload.file, encoding='utf-8-sig', newline='')
+    reader = csv.reader(text)
+    try:
+        yield from reader
+    except UnicodeDecodeError:
+        raise ImportFileError("The CSV file must be UTF-8 encoded.")
+    except csv.Error as e:
+        raise ImportFileError(f"The CSV file is malformed near line {reader.line_num}: {e}.")
+    finally:
+        # Leave the upload itself open for Django to clean up
+        text.detach()
+
+
+def _xlsx_rows(upload):
+    try:
+        from openpyxl import load_workbook
+    except ImportError:
+        raise ImportFileError("XLSX import needs the openpyxl package; upload a CSV file instead.")
+
+    try:
+        workbook = load_workbook(upload.file, read_only=True, data_only=True)
+    except Exception:
+        raise ImportFileError("The file is not a valid XLSX workbook.")
+    try:
+        yield from workbook.active.iter_rows(values_only=True)
+    finally:
+        workbook.close()
+
+
+def open_sheet(upload):
+    """
+    Open a CSV or XLSX upload for streaming. Returns the normalized header
+    row and an iterator of ``(line number, {header: cell text})`` that reads
+    the file one row at a time, skipping blank rows.
+    """
+    name = upload.name.lower()
+    if name.endswith('.csv'):
+        rows = _csv_rows(upload)
+    elif name.endswith('.xlsx'):
+        rows = _xlsx_rows(upload)
+    else:
+        raise ImportFileError(f"Upload a {' or '.join(IMPORT_EXTENSIONS)} file.")
+
+    header = next(rows, None)
+    if header is None:
+        raise ImportFileError("The file is empty.")
+    headers = [normalize_header(value) for value in header]
+
+    def records():
+        for line, values in enumerate(rows, 2):
+            cells = [clean_cell(value) for value in values]
+            if any(cells):
+                yield line, dict(zip(headers, cells))
+
+    return headers, records()
+
+
+def find_header(headers, candidates):
+    return next((candidate for candidate in candidates if candidate in headers), None)
+
+
+def marks_columns(configs, headers, per_subject=False):
+    """
+    Match each configuration to its theory and practical columns. A single
+    configuration uses plain ``theory``/``practical`` columns; with
+    ``per_subject`` each subject has its own (``english``/``english_theory``
+    and ``english_practical``). Subjects without a column are left out.
+    """
+    columns = []
+    for config in configs:
+        if per_subject:
+            subject = normalize_header(config.subject.name)
+            theory_names = (subject, f'{subject}_theory', f'{subject}_th')
+            practical_names = (f'{subject}_practical', f'{subject}_pr')
+            label = config.subject.name
+        else:
+            theory_names, practical_names, label = THEORY_HEADERS, PRACTICAL_HEADERS, ''
+
+        theory = find_header(headers, theory_names)
+        if theory is None:
+            if per_subject:
+                continue
+            raise ImportFileError(f"The file needs a '{THEORY_HEADERS[0]}' column.")
+
+        practical = None
+        if config.has_practical:
+            practical = find_header(headers, practical_names)
+            if practical is None:
+                raise ImportFileError(f"The file needs a '{practical_names[0]}' column for {config.subject.name}.")
+
+        columns.append((config, theory, practical, label))
+    return columns
+
+
+def import_marks_file(upload, configs, entered_by=None, dry_run=False, per_subject=False):
+    """
+    Import marks for ``configs`` (all of one examination and class) from a
+    CSV or XLSX upload, matching rows to students by roll number.
+
+    The file is read one row at a time. Rows with errors are skipped and
+    reported; the rest are graded and written with one bulk upsert, which
+    schedules one overall-result recompute for the affected students.
+    Returns a report dict.
+    """
+    configs = list(configs)
+    headers, rows = open_sheet(upload)
+
+    roll_header = find_header(headers, ROLL_NUMBER_HEADERS)
+    if roll_header is None:
+        raise ImportFileError(f"The file needs a '{ROLL_NUMBER_HEADERS[0]}' column.")
+    columns = marks_columns(configs, headers, per_subject=per_subject)
+    if not columns:
+        raise ImportFileError("The file has no marks columns for these subjects.")
+
+    students = dict(Student.objects.filter(
+        classroom_id=configs[0].classroom_id,
+        is_active=True
+    ).values_list('roll_number', 'id'))
+
+    marks = {config.id: {} for config, _, _, _ in columns}
+    seen = {}
+    report = {
+        'subjects': [config.subject.name for config, _, _, _ in columns],
+        'rows': 0,
+        'valid': 0,
+        'saved': 0,
+        # Results a dry run would have saved; equal to 'saved' otherwise
+        'would_save': 0,
+        'unchanged': 0,
+        'passed': 0,
+        'failed': 0,
+        'error_rows': 0,
+        'errors': [],
+        'dry_run': dry_run,
+    }
+
+    for line, row in rows:
+        report['rows'] += 1
+        roll_number = row.get(roll_header, '')
+        errors = []
+        row_marks = []
+
+        if not roll_number:
+            errors.append("Missing roll number")
+        elif roll_number not in students:
+            errors.append(f"No active student with roll number {roll_number} in this class")
+        elif roll_number in seen:
+            errors.append(f"Roll number {roll_number} already appears on line {seen[roll_number]}")
+        else:
+            seen[roll_number] = line
+            for config, theory_column, practical_column, label in columns:
+                try:
+                    theory_marks = parse_marks(
+                        row.get(theory_column), config.full_theory_marks,
+                        f"{label} theory" if label else "Theory"
+                    )
+                    practical_marks = parse_marks(
+                        row.get(practical_column), config.full_practical_marks,
+                        f"{label} practical" if label else "Practical"
+                    ) if practical_column else None
+                except ValueError as e:
+                    errors.append(str(e))
+                else:
+                    row_marks.append((config, theory_marks, practical_marks))
+
+        if errors:
+            report['error_rows'] += 1
+            if len(report['errors']) < MAX_REPORTED_ERRORS:
+                report['errors'].append({'line': line, 'roll_number': roll_number, 'errors': errors})
+            continue
+
+        report['valid'] += 1
+        for config, theory_marks, practical_marks in row_marks:
+            marks[config.id][students[roll_number]] = (theory_marks, practical_marks)
+
+    with transaction.atomic():
+        results = []
+        for config, _, _, _ in columns:
+            changed, unchanged, _ = diff_marks_sheet(config, marks[config.id])
+            report['unchanged'] += unchanged
+            results.extend(build_results(config, changed, entered_by=entered_by))
+        if not dry_run:
+            save_results(results)
+
+    report['would_save'] = len(results)
+    report['saved'] = 0 if dry_run else len(results)
+    report['passed'] = sum(1 for result in results if result.is_passed)
+    report['failed'] = len(results) - report['passed']
+    return report
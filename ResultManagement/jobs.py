@@ -0,0 +1,128 @@
+# ResultManagement/jobs.py
+import logging
+import threading
+import traceback
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+# kind -> callable(job) that does the work and returns the job result dict
+JOB_HANDLERS = {}
+
+
+def job_handler(kind):
+    """Register the function that runs jobs of ``kind``"""
+    def decorator(func):
+        JOB_HANDLERS[kind] = func
+        return func
+    return decorator
+
+
+def enqueue_job(kind, params, user=None, start=None):
+    """
+    Create a queued BackgroundJob. With ``start`` it begins in a background
+    thread once the current transaction commits, so the request that queued
+    it never waits on the work. ``start`` defaults to on unless
+    ``RESULT_JOB_WORKER`` says a ``run_result_jobs`` worker picks jobs up.
+    """
+    from .models import BackgroundJob
+
+    job = BackgroundJob.objects.create(
+        kind=kind,
+        params=params,
+        created_by=user if user is not None and user.is_authenticated else None,
+    )
+    if start is None:
+        start = not getattr(settings, 'RESULT_JOB_WORKER', False)
+    if start:
+        transaction.on_commit(lambda: start_job_thread(job.id))
+    return job
+
+
+def start_job_thread(job_id):
+    thread = threading.Thread(target=_run_in_thread, args=(job_id,), name=f"result-job-{job_id}", daemon=True)
+    thread.start()
+    return thread
+
+
+def _run_in_thread(job_id):
+    try:
+        run_job(job_id)
+    finally:
+        connection.close()
+
+
+def claim_job(job_id):
+    """Move a queued job to running; False if another runner already took it"""
+    from .models import BackgroundJob
+
+    return BackgroundJob.objects.filter(id=job_id, status=BackgroundJob.QUEUED).update(
+        status=BackgroundJob.RUNNING,
+        started_at=timezone.now(),
+    ) == 1
+
+
+def run_job(job_id):
+    """Claim and run one job, recording its result or failure"""
+    from .models import BackgroundJob
+
+    close_old_connections()
+    if not claim_job(job_id):
+        return None
+
+    job = BackgroundJob.objects.get(id=job_id)
+    try:
+        result = JOB_HANDLERS[job.kind](job)
+    except Exception as e:
+        logger.exception("Background job %s failed", job.id)
+        BackgroundJob.objects.filter(id=job.id).update(
+            status=BackgroundJob.FAILED,
+            error=f"{e}\n\n{traceback.format_exc()}",
+            finished_at=timezone.now(),
+        )
+    else:
+        BackgroundJob.objects.filter(id=job.id).update(
+            status=BackgroundJob.COMPLETED,
+            result=result or {},
+            finished_at=timezone.now(),
+        )
+    job.refresh_from_db()
+    return job
+
+
+def update_progress(job, completed, total=None):
+    """Record progress so any web worker polling the job sees it"""
+    from .models import BackgroundJob
+
+    job.completed = completed
+    fields = {'completed': completed}
+    if total is not None:
+        job.total = total
+        fields['total'] = total
+    BackgroundJob.objects.filter(id=job.id).update(**fields)
+
+
+def next_queued_job_id(kinds=None):
+    from .models import BackgroundJob
+
+    jobs = BackgroundJob.objects.filter(status=BackgroundJob.QUEUED)
+    if kinds:
+        jobs = jobs.filter(kind__in=kinds)
+    return jobs.order_by('created_at', 'id').values_list('id', flat=True).first()
+
+
+def fail_interrupted_jobs(kinds=None):
+    """Mark jobs left running by a worker that died as failed; returns how many"""
+    from .models import BackgroundJob
+
+    jobs = BackgroundJob.objects.filter(status=BackgroundJob.RUNNING)
+    if kinds:
+        jobs = jobs.filter(kind__in=kinds)
+    return jobs.update(
+        status=BackgroundJob.FAILED,
+        error="The worker running this job stopped before it finished.",
+        finished_at=timezone.now(),
+    )
@@ -0,0 +1,73 @@
+# ResultManagement/management/commands/benchmark_result_cards.py
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ResultManagement.benchmark import (
+    BENCHMARK_MODES, compare_reports, markdown_report, parse_size, run_benchmark, write_report,
+)
+from ResultManagement.pdf_backends import PDF_BACKENDS
+
+
+def comma_list(value):
+    return [item.strip() for item in value.split(',') if item.strip()]
+
+
+class Command(BaseCommand):
+    help = "Benchmark result card generation on synthetic classes in a throwaway database"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='10x6,50x6',
+                            help="Comma-separated class sizes as students x subjects (default: 10x6,50x6)")
+        parser.add_argument('--modes', default=','.join(BENCHMARK_MODES),
+                            help=f"Comma-separated rendering modes (default: {','.join(BENCHMARK_MODES)})")
+        parser.add_argument('--backends', default='xhtml2pdf,reportlab',
+                            help=f"Comma-separated PDF backends from {', '.join(PDF_BACKENDS)} (default: xhtml2pdf,reportlab)")
+        parser.add_argument('--samples', type=int, default=10, help="Students rendered one at a time in single mode")
+        parser.add_argument('--seed', type=int, default=1, help="Random seed of the synthetic marks")
+        parser.add_argument('--json', help="Write the report as JSON to this path")
+        parser.add_argument('--markdown', help="Write the report as Markdown to this path")
+        parser.add_argument('--baseline', help="Earlier JSON report to compare ms per card against")
+        parser.add_argument('--max-regression', type=float,
+                            help="Fail when any case is this many times slower per card than the baseline")
+
+    def handle(self, *args, **options):
+        try:
+            sizes = [parse_size(size) for size in comma_list(options['sizes'])]
+        except ValueError as e:
+            raise CommandError(str(e))
+        modes = comma_list(options['modes'])
+        backends = comma_list(options['backends'])
+        unknown = [mode for mode in modes if mode not in BENCHMARK_MODES]
+        unknown += [backend for backend in backends if backend not in PDF_BACKENDS]
+        if unknown:
+            raise CommandError(f"Unknown mode or backend: {', '.join(unknown)}")
+        if options['max_regression'] and not options['baseline']:
+            raise CommandError("--max-regression needs a --baseline report.")
+
+        def progress(result):
+            if options['verbosity'] > 1:
+                size = f"{result['students']}x{result['subjects']}"
+                outcome = result.get('error') or f"{result['cards']} cards in {result['seconds']:.2f}s"
+                self.stdout.write(f"{size} {result['backend']} {result['mode']}: {outcome}")
+
+        report = run_benchmark(
+            sizes, modes=modes, backends=backends,
+            samples=options['samples'], seed=options['seed'], progress=progress,
+        )
+        if options['baseline']:
+            with open(options['baseline']) as baseline:
+                compare_reports(report, json.load(baseline))
+
+        write_report(report, json_path=options['json'], markdown_path=options['markdown'])
+        self.stdout.write(markdown_report(report))
+
+        if options['max_regression']:
+            slower = [
+                result for result in report['results']
+                if result.get('vs_baseline', 0) > options['max_regression']
+            ]
+            if slower:
+                raise CommandError(
+                    f"{len(slower)} cases are more than {options['max_regression']}x slower per card than the baseline."
+                )
@@ -0,0 +1,86 @@
+# ResultManagement/management/commands/generate_school_results.py
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.template.defaultfilters import filesizeformat
+
+from management.models import Examination
+from ResultManagement.cards import BULK_PDF_MODES
+from ResultManagement.pdf_backends import PDF_BACKENDS
+from ResultManagement.pdf_optimize import PDF_OPTIMIZE_PROFILES
+from ResultManagement.school_cards import default_workers, exam_output_dir, generate_school_cards
+
+
+class Command(BaseCommand):
+    help = "Render the result cards of every class in an examination, a file per class"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--exam', type=int, required=True, help="Examination id")
+        parser.add_argument('--class', dest='classes', type=int, action='append',
+                            help="Only this class id (repeatable; default: every class)")
+        parser.add_argument('--workers', type=int, help="Spread classes across this many processes (default: one per core)")
+        parser.add_argument('--mode', choices=BULK_PDF_MODES, help="A ZIP of a PDF per card, one combined PDF, a ZIP split from one render, "
+                                 "or a ZIP of cards rendered several at once in the browser")
+        parser.add_argument('--backend', choices=sorted(PDF_BACKENDS), help="PDF backend (default: the BULK one of settings)")
+        parser.add_argument('--optimize', choices=PDF_OPTIMIZE_PROFILES,
+                            help="PDF optimisation profile (default: RESULT_PDF_OPTIMIZE['PROFILE'])")
+        parser.add_argument('--output', help="Results directory (default: RESULT_SCHOOL_CARDS['OUTPUT_DIR'])")
+        parser.add_argument('--force', action='store_true', help="Render classes again even when their file exists")
+
+    def handle(self, *args, **options):
+        try:
+            examination = Examination.objects.get(id=options['exam'])
+        except Examination.DoesNotExist:
+            raise CommandError(f"Examination {options['exam']} does not exist.")
+
+        workers = options['workers'] or default_workers()
+        started = time.monotonic()
+        classes = skipped = cards = failed = failed_classes = 0
+        bytes_before = bytes_after = 0
+
+        for summary in generate_school_cards(
+            examination.id,
+            mode=options['mode'],
+            backend=options['backend'],
+            workers=workers,
+            class_ids=options['classes'],
+            output_dir=options['output'],
+            force=options['force'],
+            optimize=options['optimize'],
+        ):
+            classes += 1
+            if summary['skipped']:
+                skipped += 1
+                if options['verbosity'] > 1:
+                    self.stdout.write(f"{summary['file']}: already written, skipped")
+                continue
+            if summary.get('failed'):
+                failed_classes += 1
+                self.stderr.write(f"{summary['file']}: failed: {summary['error']}")
+                continue
+            cards += summary['cards']
+            failed += len(summary.get('errors', []))
+            bytes_before += summary.get('optimization', {}).get('bytes_before', 0)
+            bytes_after += summary.get('optimization', {}).get('bytes_after', 0)
+            if options['verbosity'] > 1:
+                self.stdout.write(f"{summary['file']}: {summary['cards']} cards in {summary['seconds']:.2f}s")
+
+        elapsed = time.monotonic() - started
+        rate = cards / elapsed if elapsed else 0
+        self.stdout.write(self.style.SUCCESS(
+            f"Rendered {cards} cards across {classes - skipped - failed_classes} classes in {elapsed:.2f}s "
+            f"({rate:.1f} cards/s with {workers} workers) into {exam_output_dir(options['output'], examination)}"
+        ))
+        if bytes_before > bytes_after:
+            self.stdout.write(
+                f"Optimisation saved {filesizeformat(bytes_before - bytes_after)} "
+                f"({100 * (bytes_before - bytes_after) / bytes_before:.1f}%)"
+            )
+        if skipped:
+            self.stdout.write(f"Skipped {skipped} classes already written; use --force to render them again")
+        if failed:
+            self.stdout.write(self.style.WARNING(f"{failed} cards failed; see the manifest for details"))
+        if failed_classes:
+            self.stdout.write(self.style.WARNING(
+                f"{failed_classes} classes failed and will be retried on the next run; see the manifest for details"
+            ))
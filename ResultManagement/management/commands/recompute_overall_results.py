@@ -0,0 +1,46 @@
+# ResultManagement/management/commands/recompute_overall_results.py
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from management.models import Class, Examination
+from ResultManagement.recompute import recompute_overall_results_bulk
+
+
+class Command(BaseCommand):
+    help = "Rebuild StudentOverallResult for a class, an examination, or the whole school"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--exam', type=int, help="Examination id (default: every examination)")
+        parser.add_argument('--class', dest='classroom', type=int, help="Class id (default: every class)")
+        parser.add_argument('--workers', type=int, default=1, help="Spread classes across this many processes")
+        parser.add_argument('--chunk-size', type=int, default=500, help="Students per bulk update")
+
+    def handle(self, *args, **options):
+        exam_id = options['exam']
+        class_id = options['classroom']
+
+        if exam_id is not None and not Examination.objects.filter(id=exam_id).exists():
+            raise CommandError(f"Examination {exam_id} does not exist.")
+        if class_id is not None and not Class.objects.filter(id=class_id).exists():
+            raise CommandError(f"Class {class_id} does not exist.")
+
+        started = time.monotonic()
+        classes = 0
+        students = 0
+
+        for examination_id, classroom_id, count in recompute_overall_results_bulk(
+            examination_id=exam_id,
+            classroom_id=class_id,
+            workers=options['workers'],
+            chunk_size=options['chunk_size'],
+        ):
+            classes += 1
+            students += count
+            if options['verbosity'] > 1:
+                self.stdout.write(f"Examination {examination_id}, class {classroom_id}: {count} students")
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Recomputed {students} overall results across {classes} classes in {elapsed:.2f}s"
+        ))
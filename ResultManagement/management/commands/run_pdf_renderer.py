@@ -0,0 +1,48 @@
+# ResultManagement/management/commands/run_pdf_renderer.py
+import asyncio
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ResultManagement.renderer import RendererError, RendererServer, renderer_health, server_lock
+
+
+class Command(BaseCommand):
+    help = "Run the shared headless browser that renders result card PDFs"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--address', help="Unix socket path or tcp://host:port (default: settings)")
+        parser.add_argument('--pages', type=int, help="Pages rendering at the same time")
+        parser.add_argument('--restart-after', type=int, help="Relaunch the browser after this many renders")
+        parser.add_argument('--status', action='store_true', help="Print the running renderer's health and exit")
+
+    def handle(self, *args, **options):
+        if options['status']:
+            try:
+                health = renderer_health(options['address'])
+            except RendererError as e:
+                raise CommandError(str(e))
+            self.stdout.write(json.dumps(health, indent=2))
+            return
+
+        server = RendererServer(
+            address=options['address'],
+            pages=options['pages'],
+            restart_after=options['restart_after'],
+        )
+        with server_lock(server.address) as acquired:
+            if not acquired:
+                # Lazily started renderers can race; the loser just exits
+                self.stdout.write(f"A PDF renderer is already serving {server.address}")
+                return
+
+            def ready():
+                self.stdout.write(self.style.SUCCESS(
+                    f"PDF renderer listening on {server.address} "
+                    f"({server.max_pages} pages, restart after {server.restart_after} renders)"
+                ))
+
+            try:
+                asyncio.run(server.serve(ready=ready))
+            except KeyboardInterrupt:
+                pass
@@ -0,0 +1,54 @@
+# ResultManagement/management/commands/run_result_jobs.py
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+
+from ResultManagement.jobs import JOB_HANDLERS, fail_interrupted_jobs, next_queued_job_id, run_job
+from ResultManagement.models import BackgroundJob
+
+
+class Command(BaseCommand):
+    help = "Run queued background jobs (bulk result PDFs, regrades) one at a time"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--kind', action='append', choices=sorted(JOB_HANDLERS),
+                            help="Only run jobs of this kind (repeatable; default: every kind)")
+        parser.add_argument('--once', action='store_true', help="Exit once the queue is empty")
+        parser.add_argument('--poll', type=float, default=2.0, help="Seconds between checks of an empty queue")
+        parser.add_argument('--fail-interrupted', action='store_true',
+                            help="First mark jobs still 'running' as failed (only when no other worker is running)")
+
+    def handle(self, *args, **options):
+        kinds = options['kind']
+        if options['poll'] <= 0:
+            raise CommandError("--poll must be positive.")
+
+        if options['fail_interrupted']:
+            count = fail_interrupted_jobs(kinds)
+            self.stdout.write(f"Marked {count} interrupted jobs as failed")
+
+        self.stdout.write(f"Waiting for {', '.join(kinds) if kinds else 'all'} jobs")
+        try:
+            while True:
+                close_old_connections()
+                job_id = next_queued_job_id(kinds)
+                if job_id is None:
+                    if options['once']:
+                        return
+                    time.sleep(options['poll'])
+                    continue
+
+                started = time.monotonic()
+                job = run_job(job_id)
+                if job is None:
+                    # Another worker claimed it first
+                    continue
+
+                elapsed = time.monotonic() - started
+                if job.status == BackgroundJob.COMPLETED:
+                    self.stdout.write(self.style.SUCCESS(f"{job} finished in {elapsed:.1f}s"))
+                else:
+                    self.stdout.write(self.style.ERROR(f"{job} failed after {elapsed:.1f}s: {job.error.splitlines()[0]}"))
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,13 @@
+# ResultManagement/middleware.py
+from .recompute import coalesce_overall_results
+
+
+class OverallResultRecomputeMiddleware:
+    """Coalesce overall-result recomputes triggered anywhere in a request"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with coalesce_overall_results():
+            return self.get_response(request)
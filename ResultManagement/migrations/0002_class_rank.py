@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-17 01:45
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ResultManagement', '0001_initial'),
+        ('management', '0002_teacher_user'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ClassRank',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rank', models.PositiveIntegerField(blank=True, null=True)),
+                ('students_ranked', models.PositiveIntegerField(default=0)),
+                ('subject_standings', models.JSONField(blank=True, default=dict)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('classroom', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='class_ranks', to='management.class')),
+                ('examination', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='class_ranks', to='management.examination')),
+                ('student', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='class_ranks', to='management.student')),
+            ],
+            options={
+                'unique_together': {('examination', 'classroom', 'student')},
+            },
+        ),
+    ]
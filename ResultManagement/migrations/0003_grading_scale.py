@@ -0,0 +1,43 @@
+# Generated by Django 5.2.18 on 2026-10-17 01:46
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ResultManagement', '0002_class_rank'),
+        ('management', '0002_teacher_user'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GradingScale',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100)),
+                ('kind', models.CharField(choices=[('subject', 'Subject (percentage)'), ('overall', 'Overall (CGPA)')], default='subject', max_length=10)),
+                ('is_default', models.BooleanField(default=False)),
+                ('fail_grade', models.CharField(default='F', max_length=5)),
+                ('fail_grade_point', models.DecimalField(decimal_places=2, default=0, max_digits=3)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('classes', models.ManyToManyField(blank=True, related_name='grading_scales', to='management.class')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='GradeBoundary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('min_value', models.DecimalField(decimal_places=2, max_digits=5)),
+                ('grade', models.CharField(max_length=5)),
+                ('grade_point', models.DecimalField(blank=True, decimal_places=2, max_digits=3, null=True)),
+                ('scale', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='boundaries', to='ResultManagement.gradingscale')),
+            ],
+            options={
+                'ordering': ['-min_value'],
+                'unique_together': {('scale', 'min_value')},
+            },
+        ),
+    ]
@@ -0,0 +1,57 @@
+from decimal import Decimal
+
+from django.db import migrations
+
+
+SUBJECT_SCALE = [
+    ('90', 'A+', '4.00'),
+    ('80', 'A', '3.70'),
+    ('70', 'B+', '3.30'),
+    ('60', 'B', '3.00'),
+    ('50', 'C+', '2.70'),
+    ('40', 'C', '2.30'),
+    ('0', 'D', '2.00'),
+]
+
+OVERALL_SCALE = [
+    ('3.8', 'A+', None),
+    ('3.5', 'A', None),
+    ('3.0', 'B+', None),
+    ('2.7', 'B', None),
+    ('2.3', 'C+', None),
+    ('2.0', 'C', None),
+    ('0', 'F', None),
+]
+
+
+def create_default_scales(apps, schema_editor):
+    GradingScale = apps.get_model('ResultManagement', 'GradingScale')
+    GradeBoundary = apps.get_model('ResultManagement', 'GradeBoundary')
+
+    for name, kind, ladder in (
+        ('Default subject scale', 'subject', SUBJECT_SCALE),
+        ('Default overall scale', 'overall', OVERALL_SCALE),
+    ):
+        if GradingScale.objects.filter(kind=kind, is_default=True).exists():
+            continue
+        scale = GradingScale.objects.create(name=name, kind=kind, is_default=True)
+        GradeBoundary.objects.bulk_create([
+            GradeBoundary(
+                scale=scale,
+                min_value=Decimal(min_value),
+                grade=grade,
+                grade_point=Decimal(grade_point) if grade_point else None,
+            )
+            for min_value, grade, grade_point in ladder
+        ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ResultManagement', '0003_grading_scale'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_default_scales, migrations.RunPython.noop),
+    ]
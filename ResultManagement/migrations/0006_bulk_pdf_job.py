@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ResultManagement', '0005_background_job'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='backgroundjob',
+            name='kind',
+            field=models.CharField(choices=[('regrade', 'Regrade results'), ('bulk_pdf', 'Class result PDFs')], max_length=20),
+        ),
+    ]
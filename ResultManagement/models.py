@@ -1,7 +1,10 @@
 # ResultManagement/models.py
 from django.db import models
+from django.contrib.auth.models import User
 from django.core.validators import MinValueValidator, MaxValueValidator
 from management.models import Class, Subject, Student, Teacher, Examination
+from django.db.models import Count, F, Max, Q, Sum, Value
+from django.db.models.functions import Coalesce
 from decimal import Decimal, ROUND_HALF_UP
 
 class ExamConfiguration(models.Model):
@@ -71,51 +74,35 @@ class StudentResult(models.Model):
         """Calculate total marks, percentage, grade, and pass status"""
         if not self.exam_config:
             return
-            
-        # Calculate total marks
-        theory = self.theory_marks or 0
-        practical = self.practical_marks or 0
-        self.total_marks = theory + practical
-        
-        # Calculate percentage
-        full_marks = self.exam_config.full_theory_marks + (self.exam_config.full_practical_marks or 0)
-        if full_marks > 0:
-            self.percentage = (self.total_marks / full_marks) * 100
-        else:
-            self.percentage = 0
-            
-        # Check pass status
-        self.is_theory_passed = theory >= self.exam_config.pass_theory_marks
-        if self.exam_config.has_practical:
-            self.is_practical_passed = practical >= self.exam_config.pass_practical_marks
-        else:
-            self.is_practical_passed = True
-            
-        self.is_passed = self.is_theory_passed and self.is_practical_passed
-        
-        # Calculate grade and grade point (4.0 scale)
-        self.grade, self.grade_point = self.calculate_grade_and_gpa()
+
+        from .grading import calculate_result
+        fields = calculate_result(self.exam_config, self.theory_marks, self.practical_marks)
+        for field, value in fields.items():
+            setattr(self, field, value)
     
     def calculate_grade_and_gpa(self):
         """Calculate grade and GPA based on percentage"""
-        percentage = float(self.percentage or 0)
-        
-        if not self.is_passed:
-            return 'F', Decimal('0.00')
-        elif percentage >= 90:
-            return 'A+', Decimal('4.00')
-        elif percentage >= 80:
-            return 'A', Decimal('3.70')
-        elif percentage >= 70:
-            return 'B+', Decimal('3.30')
-        elif percentage >= 60:
-            return 'B', Decimal('3.00')
-        elif percentage >= 50:
-            return 'C+', Decimal('2.70')
-        elif percentage >= 40:
-            return 'C', Decimal('2.30')
-        else:
-            return 'D', Decimal('2.00')
+        from .grading import get_grading_scale
+        classroom_id = self.exam_config.classroom_id if self.exam_config_id else None
+        return get_grading_scale('subject', classroom_id).grade(self.percentage, self.is_passed)
+    
+    def as_dict(self):
+        def decimal(value):
+            return str(value) if value is not None else None
+
+        return {
+            'student_id': self.student_id,
+            'theory_marks': decimal(self.theory_marks),
+            'practical_marks': decimal(self.practical_marks),
+            'total_marks': decimal(self.total_marks),
+            'percentage': decimal(self.percentage),
+            'grade': self.grade,
+            'grade_point': decimal(self.grade_point),
+            'is_passed': self.is_passed,
+            'is_theory_passed': self.is_theory_passed,
+            'is_practical_passed': self.is_practical_passed,
+            'version': self.updated_at.isoformat() if self.updated_at else None,
+        }
     
     def __str__(self):
         return f"{self.student} - {self.subject.name} - {self.examination.name}"
@@ -156,26 +143,71 @@ class StudentOverallResult(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    # Fields derived from the student's subject results
+    CALCULATED_FIELDS = [
+        'total_subjects', 'subjects_passed', 'subjects_failed',
+        'total_grade_points', 'cgpa', 'overall_grade',
+        'total_marks_obtained', 'total_full_marks', 'overall_percentage',
+        'is_promoted', 'updated_at',
+    ]
+    
     class Meta:
         unique_together = ('examination', 'student')
     
+    @staticmethod
+    def subject_result_totals():
+        """Aggregates over a student's subject results that make up the overall result"""
+        marks_field = models.DecimalField(max_digits=8, decimal_places=2)
+        points_field = models.DecimalField(max_digits=6, decimal_places=2)
+        return {
+            'total_subjects': Count('id'),
+            'subjects_passed': Count('id', filter=Q(is_passed=True)),
+            'total_marks_obtained': Coalesce(
+                Sum('total_marks', output_field=marks_field), Value(Decimal('0')), output_field=marks_field
+            ),
+            'total_full_marks': Coalesce(
+                Sum(F('exam_config__full_theory_marks') + F('exam_config__full_practical_marks'), output_field=marks_field),
+                Value(Decimal('0')), output_field=marks_field
+            ),
+            'total_grade_points': Coalesce(
+                Sum('grade_point', output_field=points_field), Value(Decimal('0')), output_field=points_field
+            ),
+            'graded_subjects': Count('grade_point'),
+            'classroom_id': Max('exam_config__classroom_id'),
+        }
+    
+    @classmethod
+    def aggregate_subject_results(cls, examination, student_ids=None):
+        """
+        Subject result totals for many students of an examination in one
+        GROUP BY student_id query, keyed by student id
+        """
+        subject_results = StudentResult.objects.filter(examination=examination)
+        if student_ids is not None:
+            subject_results = subject_results.filter(student_id__in=student_ids)
+        
+        rows = subject_results.order_by().values('student_id').annotate(**cls.subject_result_totals())
+        return {row['student_id']: row for row in rows}
+    
     def calculate_overall_result(self):
         """Calculate overall result based on individual subject results"""
-        subject_results = StudentResult.objects.filter(
+        totals = StudentResult.objects.filter(
             examination=self.examination,
             student=self.student
-        )
+        ).aggregate(**self.subject_result_totals())
         
-        self.total_subjects = subject_results.count()
-        self.subjects_passed = subject_results.filter(is_passed=True).count()
+        self.apply_subject_totals(totals)
+        self.save()
+    
+    def apply_subject_totals(self, totals):
+        """Set the overall statistics from one row of subject result totals"""
+        self.total_subjects = totals['total_subjects']
+        self.subjects_passed = totals['subjects_passed']
         self.subjects_failed = self.total_subjects - self.subjects_passed
         
         # Calculate totals
-        self.total_marks_obtained = sum(result.total_marks or 0 for result in subject_results)
-        self.total_full_marks = sum(
-            (result.exam_config.full_theory_marks or 0) + (result.exam_config.full_practical_marks or 0)
-            for result in subject_results
-        )
+        self.total_marks_obtained = totals['total_marks_obtained']
+        self.total_full_marks = totals['total_full_marks']
         
         # Calculate overall percentage
         if self.total_full_marks > 0:
@@ -184,39 +216,161 @@ class StudentOverallResult(models.Model):
             self.overall_percentage = 0
             
         # Calculate CGPA
-        valid_results = subject_results.filter(grade_point__isnull=False)
-        if valid_results.exists():
-            self.total_grade_points = sum(result.grade_point or 0 for result in valid_results)
-            self.cgpa = self.total_grade_points / valid_results.count()
+        self.total_grade_points = totals['total_grade_points']
+        if totals['graded_subjects']:
+            self.cgpa = self.total_grade_points / totals['graded_subjects']
             self.cgpa = self.cgpa.quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
         else:
             self.cgpa = Decimal('0.00')
             
         # Determine overall grade
-        self.overall_grade = self.get_overall_grade()
+        self.overall_grade = self.get_overall_grade(totals.get('classroom_id'))
         
         # Determine promotion status (passed if no failed subjects)
         self.is_promoted = self.subjects_failed == 0
-        
-        self.save()
     
-    def get_overall_grade(self):
+    def get_overall_grade(self, classroom_id=None):
         """Get overall grade based on CGPA"""
-        cgpa = float(self.cgpa or 0)
-        if cgpa >= 3.8:
-            return 'A+'
-        elif cgpa >= 3.5:
-            return 'A'
-        elif cgpa >= 3.0:
-            return 'B+'
-        elif cgpa >= 2.7:
-            return 'B'
-        elif cgpa >= 2.3:
-            return 'C+'
-        elif cgpa >= 2.0:
-            return 'C'
-        else:
-            return 'F'
+        from .grading import get_grading_scale
+        grade, _ = get_grading_scale('overall', classroom_id).lookup(self.cgpa)
+        return grade
+    
+    def __str__(self):
+        return f"{self.student} - {self.examination.name} - CGPA: {self.cgpa}"
+
+class ClassRank(models.Model):
+    """
+    Materialized class standing of a student in an examination: overall rank
+    in the class plus, per subject, the student's position and the class
+    highest and average marks. Rebuilt whenever the class's results change.
+    """
+    examination = models.ForeignKey(Examination, on_delete=models.CASCADE, related_name='class_ranks')
+    classroom = models.ForeignKey(Class, on_delete=models.CASCADE, related_name='class_ranks')
+    student = models.ForeignKey(Student, on_delete=models.CASCADE, related_name='class_ranks')
+    
+    # Competition ranking ("1224") by CGPA, then overall percentage
+    rank = models.PositiveIntegerField(null=True, blank=True)
+    students_ranked = models.PositiveIntegerField(default=0)
+    
+    # {subject_id: {"position": 2, "highest": "95.00", "average": "71.35"}}
+    subject_standings = models.JSONField(default=dict, blank=True)
+    
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        unique_together = ('examination', 'classroom', 'student')
+    
+    def __str__(self):
+        return f"{self.student} - {self.examination.name} - Rank: {self.rank}"
+
+
+class GradingScale(models.Model):
+    """
+    A grading ladder stored as data. Subject scales map a percentage to a
+    grade and grade point; overall scales map a CGPA to an overall grade.
+    A scale linked to classes applies to those classes only, otherwise the
+    default scale of its kind is used.
+    """
+    SUBJECT = 'subject'
+    OVERALL = 'overall'
+    KIND_CHOICES = [
+        (SUBJECT, 'Subject (percentage)'),
+        (OVERALL, 'Overall (CGPA)'),
+    ]
+    
+    name = models.CharField(max_length=100)
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES, default=SUBJECT)
+    classes = models.ManyToManyField(Class, blank=True, related_name='grading_scales')
+    is_default = models.BooleanField(default=False)
+    
+    # Grade given to a failed subject regardless of its percentage
+    fail_grade = models.CharField(max_length=5, default='F')
+    fail_grade_point = models.DecimalField(max_digits=3, decimal_places=2, default=0)
+    
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"{self.name} ({self.get_kind_display()})"
+
+
+class GradeBoundary(models.Model):
+    """Lowest percentage (or CGPA) that earns a grade within a scale"""
+    scale = models.ForeignKey(GradingScale, on_delete=models.CASCADE, related_name='boundaries')
+    min_value = models.DecimalField(max_digits=5, decimal_places=2)
+    grade = models.CharField(max_length=5)
+    grade_point = models.DecimalField(max_digits=3, decimal_places=2, null=True, blank=True)
+    
+    class Meta:
+        unique_together = ('scale', 'min_value')
+        ordering = ['-min_value']
+    
+    def __str__(self):
+        return f"{self.scale.name}: {self.grade} from {self.min_value}"
+
+
+class BackgroundJob(models.Model):
+    """
+    Long-running work done outside the request that started it, with
+    progress that any web worker can read back
+    """
+    REGRADE = 'regrade'
+    BULK_PDF = 'bulk_pdf'
+    SCHOOL_PDF = 'school_pdf'
+    KIND_CHOICES = [
+        (REGRADE, 'Regrade results'),
+        (BULK_PDF, 'Class result PDFs'),
+        (SCHOOL_PDF, 'School result PDFs'),
+    ]
+    
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    COMPLETED = 'completed'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (COMPLETED, 'Completed'),
+        (FAILED, 'Failed'),
+    ]
+    
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    params = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED)
+    
+    # Progress
+    total = models.PositiveIntegerField(default=0)
+    completed = models.PositiveIntegerField(default=0)
+    result = models.JSONField(default=dict, blank=True)
+    error = models.TextField(blank=True)
+    
+    created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='result_jobs')
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        ordering = ['-created_at']
+    
+    @property
+    def progress_percent(self):
+        if not self.total:
+            return 100 if self.status == self.COMPLETED else 0
+        return round(self.completed * 100 / self.total)
+    
+    def as_dict(self):
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'status': self.status,
+            'completed': self.completed,
+            'total': self.total,
+            'progress': self.progress_percent,
+            'result': self.result,
+            'error': self.error,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None,
+        }
     
     def __str__(self):
-        return f"{self.student} - {self.examination.name} - CGPA: {self.cgpa}"
\ No newline at end of file
+        return f"{self.get_kind_display()} #{self.id} ({self.status})"
@@ -0,0 +1,219 @@
+# ResultManagement/pdf_backends.py
+"""
+Interchangeable ways of drawing a result card as PDF.
+
+- ``playwright``: the card HTML in the shared headless Chromium
+  (renderer.py). Pixel-perfect, but needs a browser process.
+- ``xhtml2pdf``: ``result_card_xhtml2pdf.html`` rendered in-process.
+- ``reportlab``: the card laid out natively with ReportLab; the cheapest.
+
+``render_with_fallback`` tries a backend and then
+``RESULT_PDF_BACKENDS['FALLBACKS']``, so cards still render when Chromium
+is unavailable.
+"""
+import logging
+import time
+from io import BytesIO
+
+from django.conf import settings
+from django.template.loader import get_template
+
+from .pdf_cache import template_version
+from .renderer import CARD_READY_SELECTOR, RendererError, RendererUnavailable, render_pdf, render_pdf_async
+
+logger = logging.getLogger(__name__)
+
+PDF_BACKEND_DEFAULTS = {
+    # Single cards, where the browser's exact rendering is worth its cost
+    'DEFAULT': 'playwright',
+    # Whole classes
+    'BULK': 'xhtml2pdf',
+    # Tried in order when the chosen backend is unavailable
+    'FALLBACKS': ['xhtml2pdf', 'reportlab'],
+    # Seconds an unavailable backend is skipped before it is tried again
+    'RETRY_AFTER': 60,
+}
+
+# name -> backend instance
+PDF_BACKENDS = {}
+
+
+class PDFBackendUnavailable(RendererError):
+    """The backend cannot render at all right now (missing package or browser)"""
+
+
+def pdf_backend_settings():
+    return {**PDF_BACKEND_DEFAULTS, **getattr(settings, 'RESULT_PDF_BACKENDS', {})}
+
+
+def register_backend(cls):
+    PDF_BACKENDS[cls.name] = cls()
+    return cls
+
+
+class PDFBackend:
+    """Draws a result card context as PDF bytes"""
+    name = None
+
+    def __init__(self):
+        self.unavailable_until = 0.0
+
+    def version(self):
+        """Changes whenever the same context would be drawn differently"""
+        return self.name
+
+    def available(self):
+        return time.monotonic() >= self.unavailable_until
+
+    def mark_unavailable(self, seconds):
+        self.unavailable_until = time.monotonic() + seconds
+
+    def render(self, context):
+        raise NotImplementedError
+
+    def render_many(self, contexts):
+        """
+        Every card as one document, each starting on a new page with a
+        ``[[card:<student id>]]`` marker in its text
+        """
+        raise NotImplementedError
+
+
+class HTMLBackend(PDFBackend):
+    """A backend that prints a Django template"""
+    template_name = None
+    # Extends template_name and loops its ``card`` block over ``cards``
+    class_template_name = None
+
+    def version(self):
+        return f"{self.name}:{template_version(self.template_name)}"
+
+    def render(self, context):
+        return self.render_html(get_template(self.template_name).render(context))
+
+    def render_many(self, contexts):
+        return self.render_html(get_template(self.class_template_name).render({
+            **contexts[0],
+            'cards': contexts,
+        }))
+
+    def render_html(self, html):
+        raise NotImplementedError
+
+
+@register_backend
+class PlaywrightBackend(HTMLBackend):
+    name = 'playwright'
+    template_name = 'ResultManagement/result_card_pdf.html'
+    class_template_name = 'ResultManagement/result_cards_pdf.html'
+
+    def render_html(self, html):
+        try:
+            return render_pdf(html, ready=CARD_READY_SELECTOR)
+        except RendererUnavailable as e:
+            raise PDFBackendUnavailable(str(e))
+
+    async def render_async(self, context):
+        """``render()`` for coroutines; the context must need no further queries"""
+        html = get_template(self.template_name).render(context)
+        try:
+            return await render_pdf_async(html, ready=CARD_READY_SELECTOR)
+        except RendererUnavailable as e:
+            raise PDFBackendUnavailable(str(e))
+
+
+@register_backend
+class XHTML2PDFBackend(HTMLBackend):
+    name = 'xhtml2pdf'
+    template_name = 'ResultManagement/result_card_xhtml2pdf.html'
+    class_template_name = 'ResultManagement/result_cards_xhtml2pdf.html'
+
+    def render_html(self, html):
+        try:
+            from xhtml2pdf import pisa
+        except ImportError:
+            raise PDFBackendUnavailable("The xhtml2pdf package is not installed.")
+
+        output = BytesIO()
+        try:
+            status = pisa.CreatePDF(html, dest=output, encoding='utf-8')
+        except Exception as e:
+            # Markup xhtml2pdf or the ReportLab layout under it cannot handle
+            raise RendererError(f"xhtml2pdf failed: {e!r}") from e
+        if status.err:
+            raise RendererError(f"xhtml2pdf reported {status.err} errors")
+        return output.getvalue()
+
+
+@register_backend
+class ReportLabBackend(PDFBackend):
+    name = 'reportlab'
+    # Bump when the layout below changes
+    layout_version = 1
+
+    def version(self):
+        return f"{self.name}:{self.layout_version}"
+
+    def render(self, context):
+        try:
+            from .pdf_layout import draw_result_card
+        except ImportError:
+            raise PDFBackendUnavailable("The reportlab package is not installed.")
+        return self.draw(draw_result_card, context)
+
+    def render_many(self, contexts):
+        try:
+            from .pdf_layout import draw_result_cards
+        except ImportError:
+            raise PDFBackendUnavailable("The reportlab package is not installed.")
+        return self.draw(draw_result_cards, contexts)
+
+    def draw(self, draw, cards):
+        from reportlab.platypus.doctemplate import LayoutError
+
+        try:
+            return draw(cards)
+        except (LayoutError, ValueError) as e:
+            raise RendererError(f"ReportLab could not lay out the card: {e}") from e
+
+
+def get_backend(name):
+    try:
+        return PDF_BACKENDS[name]
+    except KeyError:
+        raise ValueError(f"Unknown PDF backend {name!r}; choose from {', '.join(PDF_BACKENDS)}")
+
+
+def backend_chain(name=None, bulk=False):
+    """The chosen backend followed by the configured fallbacks, without repeats"""
+    conf = pdf_backend_settings()
+    first = name or conf['BULK' if bulk else 'DEFAULT']
+    names = [first] + [fallback for fallback in conf['FALLBACKS'] if fallback != first]
+    return [get_backend(backend_name) for backend_name in names]
+
+
+def render_with_fallback(context, render, name=None, bulk=False):
+    """
+    Draw a card with the first backend of the chain that can run, calling
+    ``render(backend, context)``. Returns ``(result, backend)``; a backend
+    found unavailable is skipped for ``RETRY_AFTER`` seconds, and one that
+    fails on this card alone leaves it to the next.
+    """
+    retry_after = pdf_backend_settings()['RETRY_AFTER']
+    errors = []
+    failed = False
+    for backend in backend_chain(name, bulk=bulk):
+        if not backend.available():
+            continue
+        try:
+            return render(backend, context), backend
+        except PDFBackendUnavailable as e:
+            logger.warning("PDF backend %s is unavailable, falling back: %s", backend.name, e)
+            backend.mark_unavailable(retry_after)
+            errors.append(f"{backend.name}: {e}")
+        except RendererError as e:
+            logger.warning("PDF backend %s failed on this card, falling back: %s", backend.name, e)
+            errors.append(f"{backend.name}: {e}")
+            failed = True
+    message = "No PDF backend could render the card. " + "; ".join(errors)
+    raise RendererError(message) if failed else PDFBackendUnavailable(message)
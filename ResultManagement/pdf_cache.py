@@ -0,0 +1,240 @@
+# ResultManagement/pdf_cache.py
+"""
+On-disk cache of rendered result card PDFs.
+
+Entries are content-addressed: the key is a hash of everything the card
+shows (the ``updated_at`` of its result rows, the subject names, the
+student's details, the school info) and the version of the backend that
+drew it. A changed row gives a new key, so a stale card is never served;
+the old entry is simply no longer read and is evicted, least recently used
+first, once the cache outgrows ``MAX_SIZE``.
+"""
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.template.loader import get_template
+
+logger = logging.getLogger(__name__)
+
+PDF_CACHE_DEFAULTS = {
+    'DIR': str(settings.BASE_DIR / '.pdf_cache'),
+    'MAX_SIZE': 500 * 1024 * 1024,
+    # Evicting trims the cache down to this fraction of MAX_SIZE
+    'TRIM_TO': 0.9,
+}
+
+# Bump to invalidate every cached card when rendering changes outside the template
+CACHE_FORMAT = 1
+
+# Re-measure the directory at least this often, since other processes write to it too
+MEASURE_EVERY = 60
+
+# Bytes written since the directory was last measured; the next eviction
+# check only walks the directory once this could have pushed it over the limit
+_written = 0
+_last_size = None
+_measured_at = 0.0
+_lock = threading.Lock()
+
+
+def pdf_cache_settings():
+    return {**PDF_CACHE_DEFAULTS, **getattr(settings, 'RESULT_PDF_CACHE', {})}
+
+
+def pdf_cache_enabled():
+    return bool(pdf_cache_settings()['MAX_SIZE'])
+
+
+def template_version(template_name):
+    """Hash of a template's source, so editing the card invalidates it"""
+    template = get_template(template_name)
+    source = getattr(getattr(template, 'template', None), 'source', '')
+    return hashlib.sha256(source.encode('utf-8')).hexdigest()[:16]
+
+
+def _timestamp(value):
+    return value.isoformat() if value else None
+
+
+def card_cache_key(context, version, options=None):
+    """
+    Cache key of a result card from its template context, without extra
+    queries. ``version`` identifies how the card is drawn (backend and
+    template source).
+    """
+    student = context['student']
+    exam = context['exam']
+    overall_result = context['overall_result']
+    class_rank = context['class_rank']
+    classroom = student.classroom
+
+    inputs = {
+        'format': CACHE_FORMAT,
+        'version': version,
+        'options': options or {},
+        'student': [
+            student.id, student.first_name, student.last_name, student.roll_number,
+            _timestamp(student.date_of_birth), student.section,
+            classroom.name if classroom else None, classroom.section if classroom else None,
+        ],
+        'exam': [exam.id, exam.name, _timestamp(exam.date)],
+        'overall': [overall_result.id, _timestamp(overall_result.updated_at)],
+        'rank': [class_rank.id, _timestamp(class_rank.updated_at)] if class_rank else None,
+        'results': [
+            [
+                result.id, _timestamp(result.updated_at), _timestamp(result.exam_config.updated_at),
+                # Subjects can be renamed without touching their results
+                result.subject_id, result.subject.name,
+            ]
+            for result in context['subject_results']
+        ],
+        'school_info': context['school_info'],
+        'attendance': [context['attendance_days'], context['total_days'], _timestamp(context['current_date'])],
+    }
+    payload = json.dumps(inputs, sort_keys=True, default=str).encode('utf-8')
+    return hashlib.sha256(payload).hexdigest()
+
+
+def _path(key):
+    return Path(pdf_cache_settings()['DIR']) / key[:2] / f"{key}.pdf"
+
+
+def get_cached_pdf(key):
+    """Cached PDF bytes, or None; a hit counts as a use for LRU eviction"""
+    if not pdf_cache_enabled():
+        return None
+    path = _path(key)
+    try:
+        data = path.read_bytes()
+    except FileNotFoundError:
+        return None
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+    return data
+
+
+def store_pdf(key, data):
+    """Write a rendered PDF to the cache, evicting old entries when it grows too big"""
+    global _written
+    if not pdf_cache_enabled():
+        return
+    path = _path(key)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # Write then rename so concurrent readers never see a partial file
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as tmp:
+            tmp.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        _remove_quietly(tmp_path)
+        raise
+
+    with _lock:
+        _written += len(data)
+    evict_if_needed()
+
+
+def _remove_quietly(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def cache_entries():
+    """(mtime, size, path) of every cached PDF"""
+    root = pdf_cache_settings()['DIR']
+    entries = []
+    try:
+        shards = list(os.scandir(root))
+    except FileNotFoundError:
+        return entries
+    for shard in shards:
+        if not shard.is_dir():
+            continue
+        for entry in os.scandir(shard.path):
+            if entry.name.endswith('.pdf'):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+    return entries
+
+
+def evict(max_size=None, trim_to=None):
+    """
+    Delete the least recently used PDFs until the cache fits in
+    ``max_size`` bytes. Returns (files removed, bytes in the cache after).
+    """
+    global _written, _last_size, _measured_at
+    conf = pdf_cache_settings()
+    max_size = conf['MAX_SIZE'] if max_size is None else max_size
+    trim_to = conf['TRIM_TO'] if trim_to is None else trim_to
+
+    entries = cache_entries()
+    total = sum(size for _, size, _ in entries)
+    removed = 0
+    if total > max_size:
+        target = max_size * trim_to
+        for _, size, path in sorted(entries):
+            if total <= target:
+                break
+            _remove_quietly(path)
+            total -= size
+            removed += 1
+        logger.info("Evicted %s cached PDFs; %s bytes remain", removed, total)
+
+    with _lock:
+        _written = 0
+        _last_size = total
+        _measured_at = time.monotonic()
+    return removed, total
+
+
+def evict_if_needed():
+    """Evict once the cache may have passed ``MAX_SIZE`` since it was last measured"""
+    max_size = pdf_cache_settings()['MAX_SIZE']
+    if (
+        _last_size is not None
+        and _last_size + _written <= max_size
+        and time.monotonic() - _measured_at < MEASURE_EVERY
+    ):
+        return
+    evict(max_size)
+
+
+def clear_pdf_cache():
+    """Remove every cached PDF; returns how many were removed"""
+    removed, _ = evict(max_size=0, trim_to=0)
+    return removed
+
+
+def cached_render(context, version, render, options=None):
+    """
+    PDF of a result card from the cache, or drawn with ``render(context)``
+    and stored. Returns (pdf bytes, whether it was cached).
+    """
+    if not pdf_cache_enabled():
+        return render(context), False
+
+    key = card_cache_key(context, version, options)
+    pdf = get_cached_pdf(key)
+    if pdf is not None:
+        return pdf, True
+
+    started = time.monotonic()
+    pdf = render(context)
+    store_pdf(key, pdf)
+    logger.debug("Rendered and cached card %s in %.2fs", key[:12], time.monotonic() - started)
+    return pdf, False
@@ -0,0 +1,282 @@
+# ResultManagement/pdf_layout.py
+"""Native ReportLab layout of the result card, matching result_card_xhtml2pdf.html"""
+from io import BytesIO
+
+from django.utils.dateformat import format as format_date
+from django.utils.html import escape
+from reportlab.lib import colors
+from reportlab.lib.enums import TA_CENTER, TA_JUSTIFY
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.styles import ParagraphStyle
+from reportlab.lib.units import cm
+from reportlab.platypus import KeepTogether, PageBreak, Paragraph, SimpleDocTemplate, Spacer, Table, TableStyle
+
+BROWN = colors.HexColor('#8B4513')
+CARD = colors.HexColor('#f4e4a6')
+PANEL = colors.HexColor('#f8f6e8')
+HEADING = colors.HexColor('#d4c5a9')
+INK = colors.HexColor('#2c3e50')
+
+MARGIN = 1 * cm
+PADDING = 15
+
+GRADING_SCALE = [
+    ('90 to 100', 'A+', 'Outstanding', '4'),
+    ('80 to below 90', 'A', 'Excellent', '3.6'),
+    ('70 to below 80', 'B+', 'Very Good', '3.2'),
+    ('60 to below 70', 'B', 'Good', '2.8'),
+    ('50 to below 60', 'C+', 'Satisfactory', '2.4'),
+    ('40 to below 50', 'C', 'Acceptable', '2'),
+    ('35 to below 40', 'D', 'Basic', '1.6'),
+    ('0 to below 35', 'NG', 'Non Graded', '0'),
+]
+
+QUALITY_MEASURES = [
+    ('Drawing', 'A+'), ('Vocal', 'A+'), ('Dance', 'A+'), ('Games', 'A+'),
+    ('Home Work', 'A+'), ('Discipline', 'A'), ('Attendance', 'A+'), ('Yoga', 'A+'),
+]
+
+STYLES = {
+    'school': ParagraphStyle('school', fontName='Helvetica-Bold', fontSize=20, leading=24, alignment=TA_CENTER, textColor=INK),
+    'centered': ParagraphStyle('centered', fontName='Helvetica', fontSize=10, leading=13, alignment=TA_CENTER, textColor=INK),
+    'title': ParagraphStyle('title', fontName='Helvetica-Bold', fontSize=12, leading=16, alignment=TA_CENTER),
+    'exam': ParagraphStyle('exam', fontName='Helvetica-Bold', fontSize=14, leading=18, alignment=TA_CENTER, textColor=INK),
+    'info': ParagraphStyle('info', fontName='Helvetica-Bold', fontSize=10, leading=14, textColor=INK),
+    'cell': ParagraphStyle('cell', fontName='Helvetica-Bold', fontSize=9, leading=11),
+    'remarks': ParagraphStyle('remarks', fontName='Helvetica', fontSize=9, leading=12, alignment=TA_JUSTIFY),
+    'marker': ParagraphStyle('marker', fontName='Helvetica', fontSize=1, leading=1, textColor=CARD),
+}
+
+
+def _number(value, places=0):
+    """Same as the template's ``floatformat`` for the values on the card"""
+    if value is None or value == '':
+        return ''
+    return f"{float(value):.{places}f}"
+
+
+def _marks_rows(context):
+    rows = [
+        ['S.N', 'Subjects', 'Full\nMarks', 'Pass\nMarks', 'Terminal Exam', '', 'Grade', 'Grade\nPoint'],
+        ['', '', '', '', 'Th', 'Pr', '', ''],
+    ]
+    for counter, result in enumerate(context['subject_results'], 1):
+        config = result.exam_config
+        if config.has_practical:
+            full_marks = config.full_theory_marks + config.full_practical_marks
+            pass_marks = config.pass_theory_marks + config.pass_practical_marks
+            practical = _number(result.practical_marks) if result.practical_marks else '-'
+        else:
+            full_marks, pass_marks = config.full_theory_marks, config.pass_theory_marks
+            practical = result.grade
+        rows.append([
+            str(counter),
+            Paragraph(escape(result.subject.name), STYLES['cell']),
+            _number(full_marks),
+            _number(pass_marks),
+            _number(result.theory_marks) if result.theory_marks else '-',
+            practical,
+            result.grade,
+            _number(result.grade_point, 1),
+        ])
+    if len(rows) == 2:
+        rows.append(['No results available', '', '', '', '', '', '', ''])
+    return rows
+
+
+def _remarks(context):
+    overall_result = context['overall_result']
+    if overall_result.extracurricular_remarks:
+        return overall_result.extracurricular_remarks
+    performance = {'A+': 'outstanding', 'A': 'excellent'}.get(overall_result.overall_grade, 'good')
+    promotion = (
+        "He/She is promoted to the next class." if overall_result.is_promoted
+        else "He/She needs to improve in some subjects."
+    )
+    return (
+        f"{context['student'].first_name} is a sincere and intelligent student. "
+        f"He/She has shown {performance} performance during this term exam. {promotion}"
+    )
+
+
+def _panel(flowable, width):
+    panel = Table([[flowable]], colWidths=[width])
+    panel.setStyle(TableStyle([
+        ('BOX', (0, 0), (-1, -1), 2, BROWN),
+        ('BACKGROUND', (0, 0), (-1, -1), PANEL),
+        ('LEFTPADDING', (0, 0), (-1, -1), 8),
+        ('RIGHTPADDING', (0, 0), (-1, -1), 8),
+    ]))
+    return panel
+
+
+def card_story(context, width):
+    """Flowables of one result card laid out ``width`` points wide"""
+    student = context['student']
+    overall_result = context['overall_result']
+    class_rank = context['class_rank']
+    classroom = student.classroom
+    school_info = context['school_info']
+
+    section = (student.section or (classroom.section if classroom else '') or 'A').upper()
+    story = [
+        Paragraph(escape(school_info['name']), STYLES['school']),
+        Paragraph(escape(school_info['address']), STYLES['centered']),
+        Paragraph(f"Phone :- {escape(school_info['phone'])}", STYLES['centered']),
+        Spacer(0, 4),
+        Paragraph('<u>MARK SHEET</u>', STYLES['title']),
+        Paragraph(escape(context['exam'].name), STYLES['exam']),
+        Spacer(0, 8),
+    ]
+
+    info = Table([
+        [
+            Paragraph(f"Name : {escape(student.first_name.upper())} {escape(student.last_name.upper())}", STYLES['info']),
+            Paragraph(f"Date Of Birth : {format_date(student.date_of_birth, 'm/d/Y')}", STYLES['info']),
+        ],
+        [
+            Paragraph(f"Class : {escape(classroom.name.upper()) if classroom else ''}", STYLES['info']),
+            Paragraph(f"Section : {escape(section)} &nbsp;&nbsp; Roll No. : {escape(student.roll_number)}", STYLES['info']),
+        ],
+    ], colWidths=[width / 2] * 2)
+    info.setStyle(TableStyle([('LEFTPADDING', (0, 0), (-1, -1), 0), ('ALIGN', (1, 0), (1, -1), 'RIGHT')]))
+    story += [info, Spacer(0, 8)]
+
+    fixed = [1.0 * cm, None, 1.6 * cm, 1.6 * cm, 1.4 * cm, 1.4 * cm, 1.4 * cm, 1.6 * cm]
+    fixed[1] = width - sum(w for w in fixed if w)
+    marks = Table(_marks_rows(context), colWidths=fixed, repeatRows=2)
+    marks.setStyle(TableStyle([
+        ('FONT', (0, 0), (-1, -1), 'Helvetica', 9),
+        ('FONT', (0, 0), (-1, 1), 'Helvetica-Bold', 9),
+        ('BACKGROUND', (0, 0), (-1, 1), HEADING),
+        ('GRID', (0, 0), (-1, -1), 0.75, BROWN),
+        ('BOX', (0, 0), (-1, -1), 2, BROWN),
+        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+        ('SPAN', (4, 0), (5, 0)),
+        *[('SPAN', (column, 0), (column, 1)) for column in (0, 1, 2, 3, 6, 7)],
+    ]))
+    if len(context['subject_results']) == 0:
+        marks.setStyle(TableStyle([('SPAN', (0, 2), (-1, 2))]))
+    story += [marks, Spacer(0, 10)]
+
+    gpa = Table([
+        ['GPA', _number(overall_result.cgpa, 2)],
+        ['Grade', overall_result.overall_grade],
+        ['Rank', class_rank.rank if class_rank and class_rank.rank else '-'],
+        ['Percentage', _number(overall_result.overall_percentage, 1)],
+        ['Attendance', f"{context['attendance_days']} / {context['total_days']}"],
+    ])
+    gpa.setStyle(TableStyle([
+        ('FONT', (0, 0), (-1, -1), 'Helvetica-Bold', 9),
+        ('GRID', (0, 0), (-1, -1), 0.75, BROWN),
+        ('BACKGROUND', (0, 0), (0, -1), HEADING),
+        ('ALIGN', (1, 0), (1, -1), 'CENTER'),
+    ]))
+    scale = Table([('Percentage', 'Grade', 'Remarks', 'GP')] + GRADING_SCALE)
+    scale.setStyle(TableStyle([
+        ('FONT', (0, 0), (-1, -1), 'Helvetica', 8),
+        ('FONT', (0, 0), (-1, 0), 'Helvetica-Bold', 8),
+        ('BACKGROUND', (0, 0), (-1, 0), HEADING),
+        ('GRID', (0, 0), (-1, -1), 0.75, BROWN),
+        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+        ('TOPPADDING', (0, 0), (-1, -1), 1.5),
+        ('BOTTOMPADDING', (0, 0), (-1, -1), 1.5),
+    ]))
+    gpa_width = width * 0.3
+    bottom = Table([[_panel(gpa, gpa_width - 4), _panel(scale, width * 0.65 - 4)]],
+                   colWidths=[gpa_width, width * 0.7])
+    bottom.setStyle(TableStyle([
+        ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+        ('LEFTPADDING', (0, 0), (-1, -1), 0),
+        ('ALIGN', (1, 0), (1, 0), 'RIGHT'),
+    ]))
+    story += [bottom, Spacer(0, 10)]
+
+    grade = overall_result.extracurricular_grade
+    quality_rows = [['Quality Measure Group', '', '', '']]
+    for left, right in zip(range(4), range(4, 8)):
+        quality_rows.append([
+            f"{left + 1}. {QUALITY_MEASURES[left][0]}", grade or QUALITY_MEASURES[left][1],
+            f"{right + 1}. {QUALITY_MEASURES[right][0]}", grade or QUALITY_MEASURES[right][1],
+        ])
+    inner = width - 32
+    quality = Table(quality_rows, colWidths=[inner * 0.36, inner * 0.14] * 2)
+    quality.setStyle(TableStyle([
+        ('FONT', (0, 0), (-1, -1), 'Helvetica', 9),
+        ('FONT', (0, 0), (-1, 0), 'Helvetica-Bold', 10),
+        ('FONT', (1, 1), (1, -1), 'Helvetica-Bold', 9),
+        ('FONT', (3, 1), (3, -1), 'Helvetica-Bold', 9),
+        ('SPAN', (0, 0), (-1, 0)),
+        ('ALIGN', (0, 0), (-1, 0), 'CENTER'),
+        ('ALIGN', (1, 1), (1, -1), 'RIGHT'),
+        ('ALIGN', (3, 1), (3, -1), 'RIGHT'),
+        ('TOPPADDING', (0, 0), (-1, -1), 1),
+        ('BOTTOMPADDING', (0, 0), (-1, -1), 1),
+    ]))
+    story += [_panel(quality, width - 16), Spacer(0, 10)]
+
+    remarks = [Paragraph('<b>Remarks:</b>', STYLES['info']), Paragraph(escape(_remarks(context)), STYLES['remarks'])]
+    story += [_panel(remarks, width - 16), Spacer(0, 30)]
+
+    signatures = Table(
+        [[f"Date: {format_date(context['current_date'], 'd/m/Y')}", 'School Seal', 'Class Teacher', 'Principal']],
+        colWidths=[width / 4] * 4
+    )
+    signatures.setStyle(TableStyle([
+        ('FONT', (0, 0), (-1, -1), 'Helvetica', 9),
+        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+        *[('LINEABOVE', (column, 0), (column, 0), 0.75, BROWN) for column in (1, 2, 3)],
+    ]))
+    story.append(KeepTogether(signatures))
+    return story
+
+
+def _draw_card_frame(canvas, doc):
+    canvas.saveState()
+    width, height = A4
+    canvas.setFillColor(CARD)
+    canvas.setStrokeColor(BROWN)
+    canvas.setLineWidth(3)
+    canvas.rect(MARGIN, MARGIN, width - 2 * MARGIN, height - 2 * MARGIN, fill=1, stroke=1)
+    # School logo in the top left corner, as on the HTML card
+    logo = 1.4 * cm
+    top = height - MARGIN - PADDING
+    canvas.setFillColor(HEADING)
+    canvas.setLineWidth(2)
+    canvas.rect(MARGIN + PADDING, top - logo, logo, logo, fill=1, stroke=1)
+    canvas.setFillColor(BROWN)
+    canvas.setFont('Helvetica-Bold', 14)
+    canvas.drawCentredString(MARGIN + PADDING + logo / 2, top - logo / 2 - 5, 'SA')
+    canvas.restoreState()
+
+
+def _build(context, stories):
+    output = BytesIO()
+    inset = MARGIN + PADDING
+    doc = SimpleDocTemplate(
+        output, pagesize=A4,
+        leftMargin=inset, rightMargin=inset, topMargin=inset, bottomMargin=inset,
+        title=f"Result - {context['student'].first_name} {context['student'].last_name}",
+    )
+    doc.build(stories(doc.width), onFirstPage=_draw_card_frame, onLaterPages=_draw_card_frame)
+    return output.getvalue()
+
+
+def draw_result_card(context):
+    """PDF bytes of one result card"""
+    return _build(context, lambda width: card_story(context, width))
+
+
+def draw_result_cards(contexts):
+    """PDF bytes of several result cards, each on its own page after a ``[[card:<id>]]`` marker"""
+    def stories(width):
+        story = []
+        for index, context in enumerate(contexts):
+            if index:
+                story.append(PageBreak())
+            story.append(Paragraph(f"[[card:{context['student'].id}]]", STYLES['marker']))
+            story += card_story(context, width)
+        return story
+
+    return _build(contexts[0], stories)
@@ -0,0 +1,227 @@
+# ResultManagement/pdf_optimize.py
+"""
+Smaller result card PDFs for bulk distribution (emailed ZIPs, archived terms).
+
+``optimize_pdf()`` rewrites a finished PDF with pypdf:
+
+- page content streams are Flate-compressed at the highest level
+- objects repeated across the pages of a class document (fonts, images,
+  graphics states) are stored once, and unreferenced objects are dropped
+- images larger than ``MAX_IMAGE_SIZE`` pixels are downsampled and
+  re-encoded as JPEG at ``IMAGE_QUALITY``
+- the ``grayscale`` profile also turns the RGB and CMYK colours of pages
+  and their form XObjects, and images, gray, for black-and-white printing
+
+Fonts need no subsetting step: Chromium embeds only the glyphs a card uses,
+and the xhtml2pdf and ReportLab cards use the standard PDF fonts, which are
+not embedded at all.
+"""
+import logging
+from io import BytesIO
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# 'none' leaves PDFs as the backend drew them
+PDF_OPTIMIZE_PROFILES = ('none', 'screen', 'grayscale')
+
+PDF_OPTIMIZE_DEFAULTS = {
+    'PROFILE': 'screen',
+    # Longest side, in pixels, of embedded images (a card is ~800px wide at screen resolution)
+    'MAX_IMAGE_SIZE': 600,
+    'IMAGE_QUALITY': 75,
+}
+
+
+def pdf_optimize_settings():
+    return {**PDF_OPTIMIZE_DEFAULTS, **getattr(settings, 'RESULT_PDF_OPTIMIZE', {})}
+
+
+def _luma(red, green, blue):
+    from pypdf.generic import FloatObject
+
+    return FloatObject(round(0.299 * red + 0.587 * green + 0.114 * blue, 4))
+
+
+def _color_family(name, color_spaces):
+    """'rgb', 'cmyk' or None for a colour space operand of cs/CS, looked up in the resources"""
+    space = color_spaces.get(name, name) if color_spaces else name
+    space = space.get_object() if hasattr(space, 'get_object') else space
+    if isinstance(space, list) and space:
+        family = space[0]
+        if family == '/ICCBased':
+            return {3: 'rgb', 4: 'cmyk'}.get(space[1].get_object().get('/N'))
+        space = family
+    return {'/DeviceRGB': 'rgb', '/CalRGB': 'rgb', '/DeviceCMYK': 'cmyk'}.get(space)
+
+
+def _gray(operands, family):
+    """The gray level of an RGB or CMYK colour's operands, or None for any other colour"""
+    try:
+        values = [float(operand) for operand in operands]
+    except (TypeError, ValueError):
+        # Pattern and separation colours
+        return None
+    if family == 'rgb' and len(values) == 3:
+        return _luma(*values)
+    if family == 'cmyk' and len(values) == 4:
+        cyan, magenta, yellow, black = values
+        return _luma(*(1 - min(1.0, value + black) for value in (cyan, magenta, yellow)))
+    return None
+
+
+# Colour operators that set a colour space of their own
+COLOR_OPERATOR_FAMILIES = {b'rg': 'rgb', b'RG': 'rgb', b'k': 'cmyk', b'K': 'cmyk', b'g': None, b'G': None}
+SET_COLOR_OPERATORS = {b'sc', b'scn', b'SC', b'SCN'}
+
+
+def _grayscale_stream(content, resources, writer, spaces, seen):
+    """
+    Operations of ``content`` with RGB and CMYK colours turned to gray,
+    recursing into the form XObjects it draws. ``spaces`` is the
+    ``(fill, stroke)`` colour families the stream starts with.
+    """
+    resources = resources.get_object() if resources else {}
+    # Indexing resolves indirect references, get() does not
+    color_spaces = resources['/ColorSpace'] if '/ColorSpace' in resources else {}
+    xobjects = resources['/XObject'] if '/XObject' in resources else {}
+    fill, stroke = spaces
+    saved = []
+    operations = []
+    for operands, operator in content.operations:
+        stroking = operator.isupper()
+        if operator == b'q':
+            saved.append((fill, stroke))
+        elif operator == b'Q' and saved:
+            fill, stroke = saved.pop()
+        elif operator in (b'cs', b'CS'):
+            family = _color_family(operands[0], color_spaces)
+            fill, stroke = (fill, family) if stroking else (family, stroke)
+        elif operator in COLOR_OPERATOR_FAMILIES or operator in SET_COLOR_OPERATORS:
+            if operator in COLOR_OPERATOR_FAMILIES:
+                family = COLOR_OPERATOR_FAMILIES[operator]
+                fill, stroke = (fill, family) if stroking else (family, stroke)
+            gray = _gray(operands, stroke if stroking else fill)
+            if gray is not None:
+                operands, operator = [gray], b'G' if stroking else b'g'
+        elif operator == b'Do' and operands[0] in xobjects:
+            reference = xobjects.raw_get(operands[0])
+            xobject = reference.get_object()
+            key = getattr(reference, 'idnum', id(xobject))
+            if xobject.get('/Subtype') == '/Form' and key not in seen:
+                seen.add(key)
+                _grayscale_form(xobject, xobject.get('/Resources', resources), writer, (fill, stroke), seen)
+        operations.append((operands, operator))
+    return operations
+
+
+def _grayscale_form(form, resources, writer, spaces, seen):
+    from pypdf.errors import PdfReadError
+    from pypdf.generic import ContentStream
+
+    content = ContentStream(form, writer)
+    content.operations = _grayscale_stream(content, resources, writer, spaces, seen)
+    try:
+        form.set_data(content.get_data())
+    except PdfReadError as e:
+        # pypdf only re-encodes Flate streams
+        logger.debug("Left a form XObject in colour: %s", e)
+
+
+def grayscale_content(page, writer):
+    """
+    Replace the RGB and CMYK fill and stroke colours of a page's content,
+    and of the form XObjects it draws, with grays. Pattern, separation and
+    indexed colours are left as they are.
+    """
+    from pypdf.generic import ContentStream
+
+    content = ContentStream(page.get_contents(), writer)
+    content.operations = _grayscale_stream(content, page.get('/Resources'), writer, (None, None), set())
+    page.replace_contents(content)
+
+
+def shrink_images(page, max_size, quality, grayscale=False):
+    """Downsample (and optionally gray) the images of a page; transparent ones are left alone"""
+    for image in page.images:
+        try:
+            if image.indirect_reference is None or '/SMask' in image.indirect_reference.get_object():
+                continue
+            picture = image.image
+            changed = False
+            if max(picture.size) > max_size:
+                picture = picture.copy()
+                picture.thumbnail((max_size, max_size))
+                changed = True
+            if grayscale and picture.mode != 'L':
+                picture = picture.convert('L')
+                changed = True
+            if changed:
+                if picture.mode not in ('L', 'RGB'):
+                    picture = picture.convert('RGB')
+                image.replace(picture, quality=quality)
+        except Exception as e:
+            logger.debug("Left image %s as it was: %s", image.name, e)
+
+
+def optimize_pdf(pdf, profile=None):
+    """
+    ``pdf`` rewritten for ``profile`` (default: the configured PROFILE).
+    Returns the original bytes when rewriting does not make it smaller,
+    except for the grayscale profile, which changes how it looks.
+    """
+    conf = pdf_optimize_settings()
+    profile = profile or conf['PROFILE']
+    if profile not in PDF_OPTIMIZE_PROFILES:
+        raise ValueError(f"Unknown PDF optimisation profile {profile!r}; choose from {', '.join(PDF_OPTIMIZE_PROFILES)}")
+    if profile == 'none':
+        return pdf
+
+    from pypdf import PdfReader, PdfWriter
+
+    grayscale = profile == 'grayscale'
+    writer = PdfWriter(clone_from=PdfReader(BytesIO(pdf)))
+    for page in writer.pages:
+        if grayscale:
+            grayscale_content(page, writer)
+        shrink_images(page, conf['MAX_IMAGE_SIZE'], conf['IMAGE_QUALITY'], grayscale)
+        page.compress_content_streams(level=9)
+    writer.compress_identical_objects(remove_duplicates=True, remove_unreferenced=True)
+
+    output = BytesIO()
+    writer.write(output)
+    optimized = output.getvalue()
+    return optimized if grayscale or len(optimized) < len(pdf) else pdf
+
+
+class PDFOptimizer:
+    """``optimize_pdf()`` with one profile, adding up the bytes saved across a job"""
+
+    def __init__(self, profile=None):
+        self.profile = profile or pdf_optimize_settings()['PROFILE']
+        if self.profile not in PDF_OPTIMIZE_PROFILES:
+            raise ValueError(f"Unknown PDF optimisation profile {self.profile!r}")
+        self.bytes_before = 0
+        self.bytes_after = 0
+
+    def __call__(self, pdf):
+        try:
+            optimized = optimize_pdf(pdf, self.profile)
+        except Exception as e:
+            # A PDF pypdf cannot rewrite is still a valid card
+            logger.warning("Could not optimise a PDF, keeping it as drawn: %s", e)
+            optimized = pdf
+        self.bytes_before += len(pdf)
+        self.bytes_after += len(optimized)
+        return optimized
+
+    def summary(self):
+        saved = self.bytes_before - self.bytes_after
+        return {
+            'profile': self.profile,
+            'bytes_before': self.bytes_before,
+            'bytes_after': self.bytes_after,
+            'bytes_saved': saved,
+            'saved_percent': round(100 * saved / self.bytes_before, 1) if self.bytes_before else 0.0,
+        }
@@ -0,0 +1,168 @@
+# ResultManagement/rankings.py
+import logging
+from collections import defaultdict
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.db import transaction
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+# ClassRank columns a rebuild writes
+RANK_FIELDS = ['rank', 'students_ranked', 'subject_standings', 'updated_at']
+
+
+def competition_ranks(scores):
+    """
+    Rank ``{key: score}`` highest first with ties sharing a rank and the next
+    rank skipped ("1224"). Returns ``{key: rank}``.
+    """
+    ranks = {}
+    previous = None
+    for position, (key, score) in enumerate(
+        sorted(scores.items(), key=lambda item: item[1], reverse=True), 1
+    ):
+        if score != previous:
+            rank = position
+            previous = score
+        ranks[key] = rank
+    return ranks
+
+
+def rebuild_class_ranks(examination_id, classroom_id):
+    """
+    Recompute the ClassRank rows of one class in an examination, writing
+    only the rows that changed. Returns how many were created, updated and
+    deleted.
+
+    This always rebuilds the whole class, even for one student's change: a
+    new total can move everybody's rank and every subject's highest and
+    average, so there is little to gain from updating one row. The cost is a
+    fixed five queries plus the writes, with the class's results held in
+    memory (a few hundred rows for a class).
+    """
+    from .models import ClassRank, StudentOverallResult, StudentResult
+
+    subject_marks = defaultdict(dict)
+    for student_id, subject_id, total_marks in StudentResult.objects.filter(
+        examination_id=examination_id,
+        exam_config__classroom_id=classroom_id
+    ).values_list('student_id', 'subject_id', 'total_marks'):
+        subject_marks[subject_id][student_id] = total_marks or Decimal('0')
+
+    student_ids = {student_id for marks in subject_marks.values() for student_id in marks}
+
+    overall_scores = {
+        student_id: (cgpa or Decimal('0'), percentage or Decimal('0'))
+        for student_id, cgpa, percentage in StudentOverallResult.objects.filter(
+            examination_id=examination_id,
+            student_id__in=student_ids
+        ).values_list('student_id', 'cgpa', 'overall_percentage')
+    }
+    ranks = competition_ranks(overall_scores)
+
+    standings = defaultdict(dict)
+    for subject_id, marks in subject_marks.items():
+        highest = max(marks.values())
+        average = (sum(marks.values()) / len(marks)).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+        for student_id, position in competition_ranks(marks).items():
+            standings[student_id][str(subject_id)] = {
+                'position': position,
+                'highest': str(highest),
+                'average': str(average),
+            }
+
+    # Only rows whose standing moved are written, so updated_at (and the card
+    # cache keys and stale-write checks built on it) stays put for the rest
+    existing = {
+        row.student_id: row
+        for row in ClassRank.objects.filter(examination_id=examination_id, classroom_id=classroom_id)
+    }
+    now = timezone.now()
+    created = []
+    changed = []
+    for student_id in student_ids:
+        values = {
+            'rank': ranks.get(student_id),
+            'students_ranked': len(ranks),
+            'subject_standings': standings[student_id],
+        }
+        row = existing.pop(student_id, None)
+        if row is None:
+            created.append(ClassRank(
+                examination_id=examination_id,
+                classroom_id=classroom_id,
+                student_id=student_id,
+                updated_at=now,
+                **values,
+            ))
+        elif any(getattr(row, field) != value for field, value in values.items()):
+            for field, value in values.items():
+                setattr(row, field, value)
+            row.updated_at = now
+            changed.append(row)
+
+    with transaction.atomic():
+        # Students no longer in the class's results
+        if existing:
+            ClassRank.objects.filter(id__in=[row.id for row in existing.values()]).delete()
+        if changed:
+            ClassRank.objects.bulk_update(changed, RANK_FIELDS)
+        if created:
+            # A concurrent rebuild may have inserted the same rows first
+            ClassRank.objects.bulk_create(
+                created,
+                update_conflicts=True,
+                unique_fields=['examination', 'classroom', 'student'],
+                update_fields=RANK_FIELDS,
+            )
+    return len(created), len(changed), len(existing)
+
+
+def rebuild_ranks_for_students(examination_id, student_ids):
+    """Recompute the class ranks of every class the given students sit in for an examination"""
+    from .models import ClassRank, StudentResult
+
+    classroom_ids = set(StudentResult.objects.filter(
+        examination_id=examination_id,
+        student_id__in=student_ids
+    ).values_list('exam_config__classroom_id', flat=True).distinct())
+
+    # Students whose results were all removed still have a stale rank row
+    classroom_ids.update(ClassRank.objects.filter(
+        examination_id=examination_id,
+        student_id__in=student_ids
+    ).values_list('classroom_id', flat=True).distinct())
+
+    for classroom_id in classroom_ids:
+        try:
+            rebuild_class_ranks(examination_id, classroom_id)
+        except Exception:
+            # Log the error but don't fail the operation that triggered it
+            logger.exception("Error updating class ranks for examination %s, class %s", examination_id, classroom_id)
+
+
+def student_class_rank(examination, student, subject_results):
+    """
+    ClassRank of ``student`` in the class ``subject_results`` were entered
+    for (the student's current class when there are none). A transferred
+    student has a rank row in each class they sat the examination in.
+    """
+    from .models import ClassRank
+
+    classroom_id = max((result.exam_config.classroom_id for result in subject_results), default=student.classroom_id)
+    return ClassRank.objects.filter(
+        examination=examination, student=student, classroom_id=classroom_id
+    ).first()
+
+
+def attach_standings(subject_results, class_rank):
+    """
+    Return ``subject_results`` as a list with each result's class position,
+    highest and average marks set as ``result.standing``
+    """
+    subject_results = list(subject_results)
+    standings = class_rank.subject_standings if class_rank else {}
+    for result in subject_results:
+        result.standing = standings.get(str(result.subject_id), {})
+    return subject_results
@@ -0,0 +1,229 @@
+# ResultManagement/recompute.py
+import logging
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+
+from django.db import transaction
+from django.utils import timezone
+
+from .analytics import invalidate_exam_analytics
+from .rankings import rebuild_class_ranks, rebuild_ranks_for_students
+
+logger = logging.getLogger(__name__)
+
+_state = threading.local()
+
+
+class _PendingRecompute:
+    """Dirty (examination_id, student_id) keys waiting for a transaction to commit"""
+
+    def __init__(self):
+        self.keys = set()
+
+    def __call__(self):
+        # Registered again by every schedule; the first run after a commit takes all the keys
+        keys, self.keys = self.keys, set()
+        if keys:
+            recompute_overall_results(keys)
+
+
+def _pending():
+    batch = getattr(_state, 'batch', None)
+    if batch is None:
+        batch = _state.batch = _PendingRecompute()
+    return batch
+
+
+def schedule_overall_recompute(keys):
+    """
+    Mark (examination_id, student_id) pairs as needing their overall result
+    rebuilt. Inside coalesce_overall_results() or an atomic() block each key is
+    recomputed once, after the block finishes or the transaction commits.
+    """
+    keys = set(keys)
+    if not keys:
+        return
+
+    collected = getattr(_state, 'collected', None)
+    if collected is not None:
+        collected.update(keys)
+        return
+
+    batch = _pending()
+    batch.keys.update(keys)
+    if not transaction.get_connection().in_atomic_block:
+        batch()
+        return
+    # Registered on every call: rolling back a savepoint or the transaction
+    # drops the callbacks registered inside it, and whichever survive find
+    # the same keys. Keys from rolled-back work may then be recomputed after
+    # a later commit, which only reads the committed marks again.
+    transaction.on_commit(batch, robust=True)
+
+
+@contextmanager
+def coalesce_overall_results():
+    """
+    Collect overall-result recomputes for the duration of the block and run
+    each (examination, student) once at the end. Bulk scripts can wrap their
+    work in this; nested uses join the outermost block.
+    """
+    if getattr(_state, 'collected', None) is not None:
+        yield
+        return
+
+    _state.collected = set()
+    try:
+        yield
+    finally:
+        keys = _state.collected
+        _state.collected = None
+        # Also when the block raised: an inner atomic() may already have
+        # committed marks before the error
+        schedule_overall_recompute(keys)
+
+
+def recompute_overall_results(keys):
+    """Rebuild StudentOverallResult for each (examination_id, student_id) key once"""
+    by_exam = defaultdict(set)
+    for examination_id, student_id in keys:
+        by_exam[examination_id].add(student_id)
+
+    for examination_id, student_ids in by_exam.items():
+        try:
+            rebuild_overall_results(examination_id, student_ids)
+        except Exception:
+            # Log the error but don't fail the operation that triggered it
+            logger.exception("Error updating overall results for examination %s", examination_id)
+        rebuild_ranks_for_students(examination_id, student_ids)
+        invalidate_exam_analytics(examination_id)
+
+
+def rebuild_overall_results(examination_id, student_ids, batch_size=500):
+    """
+    Rebuild the overall results of ``student_ids`` in one examination from a
+    single grouped aggregate query and one bulk upsert.
+    """
+    from .models import StudentOverallResult
+
+    student_ids = set(student_ids)
+    with transaction.atomic():
+        # Lock the existing rows before aggregating so a concurrent recompute
+        # for the same students waits and then writes from the newer marks
+        list(StudentOverallResult.objects.select_for_update().filter(
+            examination_id=examination_id,
+            student_id__in=student_ids
+        ).values_list('pk', flat=True))
+        totals = StudentOverallResult.aggregate_subject_results(examination_id, student_ids)
+
+        # No results left for these students, so drop their overall result
+        StudentOverallResult.objects.filter(
+            examination_id=examination_id,
+            student_id__in=student_ids - set(totals)
+        ).delete()
+
+        now = timezone.now()
+        overall_results = []
+        for student_id, student_totals in totals.items():
+            overall_result = StudentOverallResult(
+                examination_id=examination_id,
+                student_id=student_id,
+                created_at=now,
+                updated_at=now,
+            )
+            overall_result.apply_subject_totals(student_totals)
+            overall_results.append(overall_result)
+
+        # INSERT ... ON CONFLICT DO UPDATE only touches the calculated fields,
+        # so extracurricular grades entered meanwhile are kept
+        StudentOverallResult.objects.bulk_create(
+            overall_results,
+            batch_size=batch_size,
+            update_conflicts=True,
+            unique_fields=['examination', 'student'],
+            update_fields=StudentOverallResult.CALCULATED_FIELDS,
+        )
+    return overall_results
+
+
+def recompute_class_overall_results(examination_id, classroom_id, chunk_size=500):
+    """
+    Rebuild every overall result of one class in an examination, in chunks of
+    ``chunk_size`` students with one short transaction per chunk so marks
+    entry can carry on in between, then the class ranks. Returns the number
+    of students processed.
+    """
+    from .models import StudentResult
+
+    student_ids = list(StudentResult.objects.filter(
+        examination_id=examination_id,
+        exam_config__classroom_id=classroom_id
+    ).order_by('student_id').values_list('student_id', flat=True).distinct())
+
+    for start in range(0, len(student_ids), chunk_size):
+        rebuild_overall_results(examination_id, student_ids[start:start + chunk_size])
+    rebuild_class_ranks(examination_id, classroom_id)
+    return len(student_ids)
+
+
+def _recompute_class(args):
+    examination_id, classroom_id, chunk_size = args
+    return examination_id, classroom_id, recompute_class_overall_results(
+        examination_id, classroom_id, chunk_size=chunk_size
+    )
+
+
+def _init_worker():
+    import django
+    from django.apps import apps
+    from django.db import connections
+
+    if not apps.ready:
+        django.setup()
+    # Never share the parent's database connection with a forked worker
+    connections.close_all()
+
+
+def recompute_overall_results_bulk(examination_id=None, classroom_id=None, workers=1, chunk_size=500):
+    """
+    Rebuild overall results for one (examination, class), one examination, or
+    the whole school when both are omitted. With ``workers`` > 1 the classes
+    are spread across a process pool. The cached analytics of every
+    examination touched are dropped at the end.
+
+    Yields (examination_id, classroom_id, students) as each class finishes.
+    """
+    from django.db import connections
+    from .models import ExamConfiguration
+
+    configurations = ExamConfiguration.objects.all()
+    if examination_id is not None:
+        configurations = configurations.filter(examination_id=examination_id)
+    if classroom_id is not None:
+        configurations = configurations.filter(classroom_id=classroom_id)
+
+    tasks = [
+        (exam_id, class_id, chunk_size)
+        for exam_id, class_id in configurations.order_by(
+            'examination_id', 'classroom_id'
+        ).values_list('examination_id', 'classroom_id').distinct()
+    ]
+
+    try:
+        if workers <= 1 or len(tasks) <= 1:
+            for task in tasks:
+                yield _recompute_class(task)
+            return
+
+        from concurrent.futures import ProcessPoolExecutor, as_completed
+
+        connections.close_all()
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as executor:
+            futures = [executor.submit(_recompute_class, task) for task in tasks]
+            for future in as_completed(futures):
+                yield future.result()
+    finally:
+        # Once per examination after its classes, even when a class failed part way
+        for exam_id in sorted({exam_id for exam_id, _, _ in tasks}):
+            invalidate_exam_analytics(exam_id)
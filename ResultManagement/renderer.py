@@ -0,0 +1,528 @@
+# ResultManagement/renderer.py
+"""
+A long-lived headless browser that turns result card HTML into PDF bytes.
+
+``RendererServer`` runs in its own process (``manage.py run_pdf_renderer``,
+or started on demand by the first render) and keeps one warm Chromium with
+a small pool of reusable pages. Django processes call ``render_pdf()``,
+which sends the HTML over a local socket and reads back the PDF.
+
+Messages are length-prefixed frames: a JSON header, followed for renders
+by the HTML (request) or the PDF (response).
+"""
+import asyncio
+import contextlib
+import json
+import logging
+import os
+import socket
+import struct
+import subprocess
+import sys
+import time
+from pathlib import Path
+from urllib.parse import unquote, urlsplit
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Page setup shared by every result card
+PDF_OPTIONS = {
+    'format': 'A4',
+    'print_background': True,
+    'margin': {
+        'top': '10mm',
+        'bottom': '10mm',
+        'left': '8mm',
+        'right': '8mm',
+    },
+}
+
+RENDERER_DEFAULTS = {
+    # Unix socket path, or tcp://host:port where Unix sockets are unavailable
+    'ADDRESS': str(settings.BASE_DIR / '.renderer.sock'),
+    # Pages rendering at the same time
+    'PAGES': 4,
+    # Relaunch the browser after this many renders to bound its memory
+    'RESTART_AFTER': 500,
+    # Seconds a client waits for one render
+    'TIMEOUT': 60,
+    # Start the renderer process from the first render that finds none
+    'AUTOSTART': True,
+    'START_TIMEOUT': 30,
+    # Seconds between browser health checks
+    'HEALTH_INTERVAL': 30,
+    # Seconds a page may take to signal it is ready before it is printed anyway
+    'READY_TIMEOUT': 10,
+    # Cards a concurrent bulk job keeps rendering at once (default: PAGES)
+    'CONCURRENCY': None,
+}
+
+# Set by the card templates once fonts and images are ready to print
+CARD_READY_SELECTOR = 'html[data-card-ready]'
+
+FRAME = struct.Struct('!I')
+
+
+class RendererError(Exception):
+    """The renderer could not be reached or failed to render"""
+
+
+class RendererUnavailable(RendererError):
+    """No renderer process is running and none could be started"""
+
+
+def renderer_settings():
+    return {**RENDERER_DEFAULTS, **getattr(settings, 'RESULT_PDF_RENDERER', {})}
+
+
+def parse_address(address):
+    """Return ('tcp', (host, port)) or ('unix', path)"""
+    if address.startswith('tcp://'):
+        host, _, port = address[len('tcp://'):].rpartition(':')
+        return 'tcp', (host or '127.0.0.1', int(port))
+    return 'unix', address
+
+
+# ============ SERVER ============
+
+class RendererServer:
+    """Serve render requests from one browser and a bounded pool of pages"""
+
+    def __init__(self, address=None, pages=None, restart_after=None, health_interval=None):
+        conf = renderer_settings()
+        self.address = address or conf['ADDRESS']
+        self.max_pages = pages or conf['PAGES']
+        self.restart_after = restart_after or conf['RESTART_AFTER']
+        self.health_interval = health_interval or conf['HEALTH_INTERVAL']
+        self.ready_timeout = conf['READY_TIMEOUT']
+        self.asset_dirs = static_dirs()
+
+        self.playwright = None
+        self.browser = None
+        self.idle_pages = []
+        self.slots = None
+        self.restart_lock = None
+        self.server = None
+        self.stopping = False
+
+        self.started_at = time.time()
+        self.renders = 0          # since the browser was last launched
+        self.total_renders = 0
+        self.failures = 0
+        self.restarts = 0
+
+    async def launch_browser(self):
+        from playwright.async_api import async_playwright
+
+        if self.playwright is None:
+            self.playwright = await async_playwright().start()
+        return await self.playwright.chromium.launch(headless=True)
+
+    async def start_browser(self):
+        self.browser = await self.launch_browser()
+        self.idle_pages = []
+        self.renders = 0
+        logger.info("PDF renderer browser started")
+
+    def restart_reason(self):
+        if self.renders >= self.restart_after:
+            return f"{self.renders} renders"
+        if not self.browser_healthy():
+            return "browser disconnected"
+        return None
+
+    async def restart_browser_if_needed(self):
+        """Relaunch the browser once every page in use has been returned"""
+        if self.restart_reason() is None:
+            return
+        async with self.restart_lock:
+            # Another request may have restarted it while this one waited
+            reason = self.restart_reason()
+            if reason is None:
+                return
+            # Holding every slot means no render is in flight
+            for _ in range(self.max_pages):
+                await self.slots.acquire()
+            try:
+                logger.info("Restarting PDF renderer browser: %s", reason)
+                old_browser = self.browser
+                await self.start_browser()
+                self.restarts += 1
+                with contextlib.suppress(Exception):
+                    await old_browser.close()
+            finally:
+                for _ in range(self.max_pages):
+                    self.slots.release()
+
+    def browser_healthy(self):
+        return self.browser is not None and self.browser.is_connected()
+
+    async def new_page(self):
+        page = await self.browser.new_page()
+        # Card HTML is self-contained; never let a stray asset URL stall a render
+        await page.route('**/*', self.block_external_request)
+        return page
+
+    async def block_external_request(self, route):
+        if allowed_request_url(route.request.url, self.asset_dirs):
+            await route.continue_()
+        else:
+            await route.abort()
+
+    async def wait_until_ready(self, page, ready):
+        try:
+            await page.wait_for_selector(ready, state='attached', timeout=self.ready_timeout * 1000)
+        except Exception as e:
+            logger.warning("Page never matched %r, printing it as it is: %s", ready, e)
+
+    async def render(self, html, options=None, ready=None):
+        while True:
+            await self.restart_browser_if_needed()
+            await self.slots.acquire()
+            # Requests queued for a slot may find the browser due for a restart
+            if self.restart_reason() is None:
+                break
+            self.slots.release()
+
+        try:
+            page = self.idle_pages.pop() if self.idle_pages else await self.new_page()
+            try:
+                if ready:
+                    # The page says when it is ready instead of waiting on every subresource
+                    await page.set_content(html, wait_until='domcontentloaded')
+                    await self.wait_until_ready(page, ready)
+                else:
+                    await page.set_content(html, wait_until='load')
+                pdf = await page.pdf(**{**PDF_OPTIONS, **(options or {})})
+            except Exception:
+                # A page that failed may be in any state; don't reuse it
+                self.failures += 1
+                with contextlib.suppress(Exception):
+                    await page.close()
+                raise
+            self.idle_pages.append(page)
+            self.renders += 1
+            self.total_renders += 1
+            return pdf
+        finally:
+            self.slots.release()
+
+    def health(self):
+        return {
+            'ok': True,
+            'pid': os.getpid(),
+            'browser_connected': self.browser_healthy(),
+            'uptime': round(time.time() - self.started_at, 1),
+            'renders': self.renders,
+            'total_renders': self.total_renders,
+            'failures': self.failures,
+            'restarts': self.restarts,
+            'idle_pages': len(self.idle_pages),
+            'max_pages': self.max_pages,
+            'restart_after': self.restart_after,
+        }
+
+    async def handle_client(self, reader, writer):
+        try:
+            request = json.loads(await read_frame(reader))
+            command = request.get('command')
+            if command == 'ping':
+                await write_frame(writer, json.dumps(self.health()).encode())
+            elif command == 'shutdown':
+                await write_frame(writer, json.dumps({'ok': True}).encode())
+                self.stopping = True
+                self.server.close()
+            elif command == 'render':
+                html = (await read_frame(reader)).decode('utf-8')
+                try:
+                    pdf = await self.render(html, request.get('options'), request.get('ready'))
+                except Exception as e:
+                    logger.exception("PDF render failed")
+                    await write_frame(writer, json.dumps({'ok': False, 'error': str(e)}).encode())
+                else:
+                    await write_frame(writer, json.dumps({'ok': True, 'size': len(pdf)}).encode())
+                    await write_frame(writer, pdf)
+            else:
+                await write_frame(writer, json.dumps({'ok': False, 'error': f"Unknown command {command!r}"}).encode())
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+            with contextlib.suppress(Exception):
+                await writer.wait_closed()
+
+    async def health_check(self):
+        while True:
+            await asyncio.sleep(self.health_interval)
+            await self.restart_browser_if_needed()
+
+    async def serve(self, ready=None):
+        self.slots = asyncio.Semaphore(self.max_pages)
+        self.restart_lock = asyncio.Lock()
+        await self.start_browser()
+
+        kind, target = parse_address(self.address)
+        if kind == 'unix':
+            with contextlib.suppress(FileNotFoundError):
+                os.unlink(target)
+            server = await asyncio.start_unix_server(self.handle_client, path=target)
+            os.chmod(target, 0o600)
+        else:
+            server = await asyncio.start_server(self.handle_client, *target)
+        self.server = server
+
+        logger.info("PDF renderer listening on %s with %s pages", self.address, self.max_pages)
+        if ready:
+            ready()
+        health_task = asyncio.create_task(self.health_check())
+        try:
+            async with server:
+                await server.serve_forever()
+        except asyncio.CancelledError:
+            # A shutdown request closes the server, which cancels serve_forever()
+            if not self.stopping:
+                raise
+        finally:
+            health_task.cancel()
+            with contextlib.suppress(Exception):
+                await self.browser.close()
+            if self.playwright is not None:
+                with contextlib.suppress(Exception):
+                    await self.playwright.stop()
+            if kind == 'unix':
+                with contextlib.suppress(FileNotFoundError):
+                    os.unlink(target)
+
+
+def static_dirs():
+    """Directories a card may load ``file:`` assets from: STATIC_ROOT and STATICFILES_DIRS"""
+    dirs = [settings.STATIC_ROOT] if getattr(settings, 'STATIC_ROOT', None) else []
+    for entry in getattr(settings, 'STATICFILES_DIRS', []):
+        # Entries may be (prefix, path) pairs
+        dirs.append(entry[1] if isinstance(entry, (list, tuple)) else entry)
+    return [Path(directory).resolve() for directory in dirs]
+
+
+def allowed_request_url(url, asset_dirs):
+    """
+    Whether a page may fetch ``url``: inline ``data:`` URLs, and ``file:``
+    URLs inside ``asset_dirs``. Anything else would let card HTML pull in
+    remote content, or read any file on the renderer host into the PDF.
+    """
+    if url.startswith('data:'):
+        return True
+    if not url.startswith('file:'):
+        return False
+    path = Path(unquote(urlsplit(url).path)).resolve()
+    return any(path.is_relative_to(directory) for directory in asset_dirs)
+
+
+async def read_frame(reader):
+    size, = FRAME.unpack(await reader.readexactly(FRAME.size))
+    return await reader.readexactly(size)
+
+
+async def write_frame(writer, data):
+    writer.write(FRAME.pack(len(data)) + data)
+    await writer.drain()
+
+
+@contextlib.contextmanager
+def server_lock(address):
+    """
+    Hold a lock file next to a Unix socket for the server's lifetime so only
+    one renderer serves an address; yields False when another one already does.
+    """
+    kind, target = parse_address(address)
+    if kind != 'unix':
+        # A second TCP server simply fails to bind
+        yield True
+        return
+
+    import fcntl
+
+    with open(f"{target}.lock", 'w') as lock_file:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            yield False
+            return
+        yield True
+
+
+# ============ CLIENT ============
+
+def _connect(address, timeout):
+    kind, target = parse_address(address)
+    if kind == 'unix':
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(timeout)
+        try:
+            sock.connect(target)
+        except OSError:
+            sock.close()
+            raise
+        return sock
+    return socket.create_connection(target, timeout=timeout)
+
+
+def _recv_exactly(sock, size):
+    chunks = []
+    while size:
+        chunk = sock.recv(min(size, 1 << 20))
+        if not chunk:
+            raise RendererError("The PDF renderer closed the connection")
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b''.join(chunks)
+
+
+def _recv_frame(sock):
+    size, = FRAME.unpack(_recv_exactly(sock, FRAME.size))
+    return _recv_exactly(sock, size)
+
+
+def _send_frame(sock, data):
+    sock.sendall(FRAME.pack(len(data)) + data)
+
+
+# What a request fails with when the renderer is down, restarts mid-request
+# (reset or broken pipe), times out, or answers with a truncated or garbled frame
+REQUEST_ERRORS = (OSError, ValueError, struct.error)
+
+
+def _request(address, header, body=None, timeout=None):
+    with _connect(address, timeout) as sock:
+        _send_frame(sock, json.dumps(header).encode())
+        if body is not None:
+            _send_frame(sock, body)
+        response = json.loads(_recv_frame(sock))
+        if not response.get('ok'):
+            raise RendererError(response.get('error') or "The PDF renderer failed")
+        if header['command'] == 'render':
+            return _recv_frame(sock)
+        return response
+
+
+def renderer_health(address=None, timeout=5):
+    """Health report of the running renderer; RendererError if none answers"""
+    try:
+        return _request(address or renderer_settings()['ADDRESS'], {'command': 'ping'}, timeout=timeout)
+    except OSError as e:
+        raise RendererUnavailable(f"No PDF renderer is running: {e}") from e
+    except REQUEST_ERRORS as e:
+        raise RendererError(f"The PDF renderer sent a bad health report: {e!r}") from e
+
+
+def stop_renderer(address=None, timeout=5):
+    """Ask the renderer at ``address`` to exit; returns False if none answered"""
+    try:
+        _request(address or renderer_settings()['ADDRESS'], {'command': 'shutdown'}, timeout=timeout)
+    except (RendererError, *REQUEST_ERRORS):
+        return False
+    return True
+
+
+def start_renderer_process():
+    """Launch ``manage.py run_pdf_renderer`` for the configured address, detached from this process"""
+    conf = renderer_settings()
+    log_path = settings.BASE_DIR / 'pdf_renderer.log'
+    with open(log_path, 'ab') as log:
+        return subprocess.Popen(
+            [
+                sys.executable, str(settings.BASE_DIR / 'manage.py'), 'run_pdf_renderer',
+                '--address', conf['ADDRESS'], '--pages', str(conf['PAGES']),
+            ],
+            cwd=str(settings.BASE_DIR),
+            stdin=subprocess.DEVNULL,
+            stdout=log,
+            stderr=subprocess.STDOUT,
+            start_new_session=True,
+        )
+
+
+def wait_for_renderer(timeout, process=None):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            return renderer_health(timeout=2)
+        except RendererError:
+            # Exit code 0 means another process won the race to start it
+            if process is not None and process.poll():
+                raise RendererUnavailable(
+                    f"The PDF renderer exited with status {process.returncode}; see pdf_renderer.log"
+                )
+            if time.monotonic() > deadline:
+                raise RendererUnavailable(f"The PDF renderer did not start within {timeout}s")
+            time.sleep(0.2)
+
+
+def ensure_renderer():
+    """Health of the renderer, starting it first when it is not running and autostart is enabled"""
+    conf = renderer_settings()
+    try:
+        return renderer_health()
+    except RendererUnavailable:
+        if not conf['AUTOSTART']:
+            raise RendererUnavailable("No PDF renderer is running; start it with 'manage.py run_pdf_renderer'")
+
+    logger.info("Starting the PDF renderer process")
+    return wait_for_renderer(conf['START_TIMEOUT'], start_renderer_process())
+
+
+def render_pdf(html, options=None, ready=None):
+    """
+    Render result card HTML to PDF bytes with the shared renderer process,
+    starting it first when it is not running and autostart is enabled.
+    With ``ready`` (a CSS selector) the page is printed as soon as it
+    matches, rather than after its load event.
+    """
+    conf = renderer_settings()
+    header = {'command': 'render', 'options': options or {}, 'ready': ready}
+    body = html.encode('utf-8')
+    try:
+        return _request(conf['ADDRESS'], header, body, timeout=conf['TIMEOUT'])
+    except (FileNotFoundError, ConnectionRefusedError):
+        ensure_renderer()
+    except REQUEST_ERRORS as e:
+        raise RendererError(f"PDF renderer request failed: {e!r}") from e
+    try:
+        return _request(conf['ADDRESS'], header, body, timeout=conf['TIMEOUT'])
+    except REQUEST_ERRORS as e:
+        raise RendererError(f"PDF renderer request failed: {e!r}") from e
+
+
+async def _open_connection(address):
+    kind, target = parse_address(address)
+    if kind == 'unix':
+        return await asyncio.open_unix_connection(target)
+    return await asyncio.open_connection(*target)
+
+
+async def render_pdf_async(html, options=None, ready=None):
+    """
+    ``render_pdf()`` for coroutines, so one thread can keep several renders
+    in flight. Does not start the renderer; call ``ensure_renderer()`` first.
+    """
+    conf = renderer_settings()
+    header = {'command': 'render', 'options': options or {}, 'ready': ready}
+    try:
+        reader, writer = await asyncio.wait_for(_open_connection(conf['ADDRESS']), conf['TIMEOUT'])
+    except (OSError, asyncio.TimeoutError) as e:
+        raise RendererUnavailable(f"No PDF renderer is running: {e}")
+
+    try:
+        await write_frame(writer, json.dumps(header).encode())
+        await write_frame(writer, html.encode('utf-8'))
+        response = json.loads(await asyncio.wait_for(read_frame(reader), conf['TIMEOUT']))
+        if not response.get('ok'):
+            raise RendererError(response.get('error') or "The PDF renderer failed")
+        return await asyncio.wait_for(read_frame(reader), conf['TIMEOUT'])
+    except (asyncio.IncompleteReadError, asyncio.TimeoutError, *REQUEST_ERRORS) as e:
+        raise RendererError(f"PDF renderer request failed: {e!r}") from e
+    finally:
+        writer.close()
+        with contextlib.suppress(Exception):
+            await writer.wait_closed()
@@ -0,0 +1,285 @@
+# ResultManagement/school_cards.py
+"""
+Result cards of every class in an examination, for the end of term.
+
+Classes are independent, so they are sharded across a process pool one
+class per task, largest first. Each worker has its own PDF backends and,
+when cards go through Chromium, its own renderer process on a socket of its
+own, so workers never queue behind a single browser.
+
+Every class is written to ``<output>/<exam>/<class>.zip`` (or ``.pdf`` in
+combined mode) through ``write_class_output()``, which only renames the
+file into place once complete. An interrupted run is resumed by running it
+again: classes whose file already exists are skipped.
+"""
+import json
+import logging
+import os
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.db.models import Count
+from django.utils.text import slugify
+
+from .cards import BULK_PDF_MODES, bulk_pdf_dir, class_card_contexts, class_output_extension, write_class_output
+from .jobs import job_handler, update_progress
+
+logger = logging.getLogger(__name__)
+
+SCHOOL_CARDS_DEFAULTS = {
+    # Processes rendering classes at once (default: one per core)
+    'WORKERS': None,
+    'MODE': 'cards',
+    # Default: a 'school' directory under RESULT_PDF_OUTPUT_DIR
+    'OUTPUT_DIR': None,
+}
+
+MANIFEST_NAME = 'manifest.json'
+
+
+def school_cards_settings():
+    return {**SCHOOL_CARDS_DEFAULTS, **getattr(settings, 'RESULT_SCHOOL_CARDS', {})}
+
+
+def default_workers():
+    return school_cards_settings()['WORKERS'] or os.cpu_count() or 1
+
+
+def school_cards_dir(output_dir=None):
+    return Path(output_dir or school_cards_settings()['OUTPUT_DIR'] or bulk_pdf_dir() / 'school')
+
+
+def exam_output_dir(output_dir, examination):
+    return school_cards_dir(output_dir) / f"{slugify(examination.name) or 'exam'}-{examination.id}"
+
+
+def class_output_path(exam_dir, classroom, mode):
+    name = slugify(' '.join(filter(None, [classroom.name, classroom.section]))) or 'class'
+    return exam_dir / f"{name}-{classroom.id}.{class_output_extension(mode)}"
+
+
+def school_card_classes(examination_id, class_ids=None):
+    """
+    ``{classroom_id: students}`` of every class with overall results in the
+    examination, biggest class first so the longest tasks start early
+    """
+    from .models import StudentOverallResult
+
+    overall_results = StudentOverallResult.objects.filter(
+        examination_id=examination_id,
+        student__is_active=True,
+        student__classroom__isnull=False,
+    )
+    if class_ids:
+        overall_results = overall_results.filter(student__classroom_id__in=class_ids)
+
+    rows = overall_results.values('student__classroom_id').annotate(
+        students=Count('id')
+    ).order_by('-students', 'student__classroom_id')
+    return {row['student__classroom_id']: row['students'] for row in rows}
+
+
+def generate_class_cards(args):
+    """Write one class's cards; runs in a pool worker. Returns its summary."""
+    from management.models import Class, Examination
+
+    examination_id, classroom_id, path, mode, backend, optimize = args
+    started = time.monotonic()
+    examination = Examination.objects.get(id=examination_id)
+    classroom = Class.objects.get(id=classroom_id)
+    cards = class_card_contexts(examination, classroom)
+
+    summary = {'class_id': classroom_id, 'file': Path(path).name, 'cards': len(cards), 'skipped': False}
+    if cards:
+        summary.update(write_class_output(cards, Path(path), mode, backend, optimize=optimize))
+    summary['seconds'] = round(time.monotonic() - started, 3)
+    return summary
+
+
+def uses_renderer(backend=None, mode=None):
+    from .pdf_backends import backend_chain
+
+    return mode == 'concurrent' or backend_chain(backend, bulk=True)[0].name == 'playwright'
+
+
+def _init_worker(backend=None, slots=None, mode=None):
+    from queue import Empty
+    from .recompute import _init_worker as init_django
+
+    init_django()
+    if not uses_renderer(backend, mode):
+        return
+
+    from multiprocessing.util import Finalize
+    from .renderer import parse_address, renderer_settings, stop_renderer
+
+    conf = renderer_settings()
+    kind, target = parse_address(conf['ADDRESS'])
+    if kind != 'unix':
+        # A TCP renderer is shared; its PAGES bound how many workers render at once
+        return
+    # Numbered by slot rather than pid so reruns reuse the same sockets
+    try:
+        slot = slots.get_nowait()
+    except (AttributeError, Empty):
+        slot = f"pid{os.getpid()}"
+    address = f"{target}.{slot}"
+    # Outside concurrent mode a worker renders one card at a time, so its renderer needs one page
+    pages = conf['PAGES'] if mode == 'concurrent' else 1
+    settings.RESULT_PDF_RENDERER = {**getattr(settings, 'RESULT_PDF_RENDERER', {}), 'ADDRESS': address, 'PAGES': pages}
+    Finalize(None, stop_renderer, args=(address,), exitpriority=10)
+
+
+def write_manifest(exam_dir, manifest):
+    path = exam_dir / MANIFEST_NAME
+    partial_path = path.with_name(f"{path.name}.part")
+    partial_path.write_text(json.dumps(manifest, indent=2, sort_keys=True))
+    os.replace(partial_path, path)
+
+
+def generate_school_cards(examination_id, mode=None, backend=None, workers=None,
+                          class_ids=None, output_dir=None, force=False, optimize=None):
+    """
+    Write the result cards of every class of an examination (or only
+    ``class_ids``) as a file per class, spread over ``workers`` processes,
+    with PDFs shrunk by the ``optimize`` profile. Classes whose file
+    already exists are skipped unless ``force``.
+
+    Yields the summary of each class as it finishes, skipped ones first. A
+    class that fails is recorded in the manifest with ``failed`` and its
+    ``error`` and the rest carry on.
+    """
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+    from django.db import connections
+    from management.models import Class, Examination
+
+    conf = school_cards_settings()
+    mode = mode or conf['MODE']
+    if mode not in BULK_PDF_MODES:
+        raise ValueError(f"Unknown bulk PDF mode {mode!r}")
+    workers = workers or default_workers()
+
+    examination = Examination.objects.get(id=examination_id)
+    class_sizes = school_card_classes(examination_id, class_ids)
+    classrooms = Class.objects.in_bulk(list(class_sizes))
+    exam_dir = exam_output_dir(output_dir, examination)
+    exam_dir.mkdir(parents=True, exist_ok=True)
+
+    manifest_path = exam_dir / MANIFEST_NAME
+    manifest = json.loads(manifest_path.read_text()) if manifest_path.exists() else {}
+    manifest.update({'exam_id': examination.id, 'exam': examination.name})
+    manifest.setdefault('classes', {})
+
+    tasks = []
+    for classroom_id, students in class_sizes.items():
+        path = class_output_path(exam_dir, classrooms[classroom_id], mode)
+        if path.exists() and not force:
+            yield {
+                **manifest['classes'].get(str(classroom_id), {}),
+                'class_id': classroom_id, 'file': path.name, 'cards': students, 'skipped': True,
+            }
+            continue
+        tasks.append((examination_id, classroom_id, str(path), mode, backend, optimize))
+
+    def finished(summary):
+        manifest['classes'][str(summary['class_id'])] = {
+            **summary, 'class': str(classrooms[summary['class_id']]), 'mode': mode,
+        }
+        write_manifest(exam_dir, manifest)
+        return summary
+
+    def failed(task, error):
+        # Recorded and passed over; its file was never written, so the next run retries it
+        _, classroom_id, path, *_ = task
+        logger.error("Result cards of class %s failed: %r", classroom_id, error)
+        return finished({
+            'class_id': classroom_id, 'file': Path(path).name, 'cards': class_sizes[classroom_id],
+            'skipped': False, 'failed': True, 'error': str(error) or repr(error),
+        })
+
+    if workers <= 1 or len(tasks) <= 1:
+        for task in tasks:
+            try:
+                summary = generate_class_cards(task)
+            except Exception as e:
+                yield failed(task, e)
+            else:
+                yield finished(summary)
+        return
+
+    import multiprocessing
+
+    workers = min(workers, len(tasks))
+    slots = multiprocessing.Queue()
+    for slot in range(workers):
+        slots.put(slot)
+
+    connections.close_all()
+    with ProcessPoolExecutor(
+        max_workers=workers, initializer=_init_worker, initargs=(backend, slots, mode)
+    ) as executor:
+        futures = {executor.submit(generate_class_cards, task): task for task in tasks}
+        for future in as_completed(futures):
+            try:
+                summary = future.result()
+            except Exception as e:
+                yield failed(futures[future], e)
+            else:
+                yield finished(summary)
+
+
+@job_handler('school_pdf')
+def run_school_pdf_job(job):
+    """
+    Background job: result cards of every class of ``params['exam_id']``
+    into the school cards directory, resuming an earlier interrupted run
+    """
+    from management.models import Examination
+
+    params = job.params
+    examination = Examination.objects.get(id=params['exam_id'])
+    total = sum(school_card_classes(examination.id, params.get('class_ids')).values())
+    update_progress(job, 0, total)
+
+    started = time.monotonic()
+    workers = params.get('workers') or default_workers()
+    done = rendered = pdfs = skipped = classes = failed_classes = 0
+    bytes_before = bytes_after = 0
+    errors = []
+    for summary in generate_school_cards(
+        examination.id, mode=params.get('mode'), backend=params.get('backend'),
+        workers=workers, class_ids=params.get('class_ids'), force=params.get('force', False),
+        optimize=params.get('optimize'),
+    ):
+        classes += 1
+        done += summary['cards']
+        if summary['skipped']:
+            skipped += 1
+        elif summary.get('failed'):
+            failed_classes += 1
+            errors.append(f"Class {summary['class_id']}: {summary['error']}")
+        else:
+            rendered += summary['cards']
+            pdfs += summary.get('pdfs', 0)
+            errors.extend(summary.get('errors', []))
+            optimization = summary.get('optimization', {})
+            bytes_before += optimization.get('bytes_before', 0)
+            bytes_after += optimization.get('bytes_after', 0)
+        update_progress(job, done)
+
+    seconds = time.monotonic() - started
+    return {
+        'directory': str(exam_output_dir(None, examination)),
+        'classes': classes,
+        'skipped_classes': skipped,
+        'failed_classes': failed_classes,
+        'cards': rendered,
+        'pdfs': pdfs,
+        'errors': errors,
+        'bytes_before_optimization': bytes_before,
+        'bytes_saved': bytes_before - bytes_after,
+        'workers': workers,
+        'seconds': round(seconds, 2),
+        'cards_per_second': round(rendered / seconds, 2) if seconds else None,
+    }
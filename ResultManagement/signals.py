@@ -1,42 +1,31 @@
 # ResultManagement/signals.py
-from django.db.models.signals import post_save, post_delete
+from django.db.models.signals import post_save, post_delete, m2m_changed
 from django.dispatch import receiver
-from .models import StudentResult, StudentOverallResult
+from .models import ExamConfiguration, StudentResult, GradingScale, GradeBoundary
+from .grading import bump_scale_version, invalidate_thresholds
+from .recompute import schedule_overall_recompute
 
 @receiver(post_save, sender=StudentResult)
 def update_overall_result_on_save(sender, instance, created, **kwargs):
     """Update overall result when a student result is saved"""
-    try:
-        overall_result, created = StudentOverallResult.objects.get_or_create(
-            examination=instance.examination,
-            student=instance.student
-        )
-        overall_result.calculate_overall_result()
-    except Exception as e:
-        # Log the error but don't fail the save operation
-        print(f"Error updating overall result: {e}")
+    schedule_overall_recompute([(instance.examination_id, instance.student_id)])
 
 @receiver(post_delete, sender=StudentResult)
 def update_overall_result_on_delete(sender, instance, **kwargs):
-    """Update overall result when a student result is deleted"""
-    try:
-        overall_result = StudentOverallResult.objects.filter(
-            examination=instance.examination,
-            student=instance.student
-        ).first()
-        
-        if overall_result:
-            # Check if there are any remaining results for this student in this exam
-            remaining_results = StudentResult.objects.filter(
-                examination=instance.examination,
-                student=instance.student
-            ).exists()
-            
-            if remaining_results:
-                overall_result.calculate_overall_result()
-            else:
-                # No results left, delete the overall result
-                overall_result.delete()
-    except Exception as e:
-        # Log the error but don't fail the delete operation
-        print(f"Error updating overall result on delete: {e}")
\ No newline at end of file
+    """Update (or remove) overall result when a student result is deleted"""
+    schedule_overall_recompute([(instance.examination_id, instance.student_id)])
+
+@receiver(post_save, sender=GradingScale)
+@receiver(post_delete, sender=GradingScale)
+@receiver(post_save, sender=GradeBoundary)
+@receiver(post_delete, sender=GradeBoundary)
+@receiver(m2m_changed, sender=GradingScale.classes.through)
+def invalidate_grading_scales(sender, **kwargs):
+    """Recompile grading scales in every process after any change"""
+    bump_scale_version()
+
+@receiver(post_save, sender=ExamConfiguration)
+@receiver(post_delete, sender=ExamConfiguration)
+def invalidate_exam_config_thresholds(sender, instance, **kwargs):
+    """Drop the cached marks thresholds of a configuration after any change"""
+    invalidate_thresholds(instance.id)
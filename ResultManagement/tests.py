@@ -1,3 +1,1709 @@
-from django.test import TestCase
+import asyncio
+import csv
+import datetime
+import json
+import os
+import statistics
+import tempfile
+import threading
+import time
+import zipfile
+from collections import Counter
+from concurrent.futures import Future
+from decimal import ROUND_HALF_UP, Decimal
+from io import BytesIO, StringIO
+from pathlib import Path
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.contrib.messages import get_messages
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test import Client, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from pypdf import PdfReader, PdfWriter
+from pypdf.generic import ArrayObject, ContentStream, DecodedStreamObject, DictionaryObject, NameObject, NumberObject
+from reportlab.platypus.doctemplate import LayoutError
+
+from management.models import Class, Subject, Student, Teacher, Examination, ClassSubject
+from . import recompute
+from .analytics import cache_key as analytics_cache_key, compute_exam_analytics, get_exam_analytics
+from .benchmark import STAGES, compare_reports, markdown_report, parse_size
+from .cards import (
+    bulk_pdf_path, card_filename, class_card_contexts, split_class_document, write_card_zip, write_class_output,
+)
+from .grading import DEFAULT_OVERALL_SCALE, DEFAULT_SUBJECT_SCALE, CompiledScale, get_grading_scale, grade_marks_sheet
+from .exports import EXPORT_COLUMNS, export_results_csv
+from .imports import ImportFileError, import_marks_file
+from .jobs import claim_job, enqueue_job, fail_interrupted_jobs, run_job
+from .models import BackgroundJob, ClassRank, ExamConfiguration, StudentOverallResult, StudentResult
+from .pdf_backends import (
+    PDF_BACKENDS, PDFBackendUnavailable, PlaywrightBackend, backend_chain, render_with_fallback,
+)
+from .pdf_cache import cache_entries, cached_render, card_cache_key, clear_pdf_cache, get_cached_pdf, store_pdf
+from .pdf_optimize import optimize_pdf
+from .rankings import student_class_rank
+from .renderer import (
+    CARD_READY_SELECTOR, FRAME, RendererError, RendererServer, RendererUnavailable, allowed_request_url,
+    read_frame, render_pdf, render_pdf_async, renderer_health, stop_renderer,
+)
+from .school_cards import MANIFEST_NAME, exam_output_dir, generate_school_cards
+
+
+# Keeps cache writes out of the development cache directory
+TEST_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+def create_students(classroom, size):
+    return [
+        Student.objects.create(
+            first_name=f'Student{number}', last_name=classroom.name, roll_number=str(number),
+            date_of_birth=datetime.date(2012, 1, 1), father_name='Father', mother_name='Mother',
+            permanent_address='Address', student_contact='9800000000', classroom=classroom,
+        )
+        for number in range(1, size + 1)
+    ]
+
+
+def create_config(examination, classroom, subject, practical=True):
+    """Exam configuration of 75 theory (pass 30) + 25 practical (pass 10), or 100 theory (pass 40)"""
+    ClassSubject.objects.get_or_create(classroom=classroom, subject=subject)
+    if practical:
+        return ExamConfiguration.objects.create(
+            examination=examination, classroom=classroom, subject=subject,
+            full_theory_marks=75, pass_theory_marks=30,
+            has_practical=True, full_practical_marks=25, pass_practical_marks=10,
+        )
+    return ExamConfiguration.objects.create(
+        examination=examination, classroom=classroom, subject=subject,
+        full_theory_marks=100, pass_theory_marks=40,
+    )
+
+
+# ============ GRADING ============
+
+class CompiledScaleTests(SimpleTestCase):
+    """Grades change exactly at each boundary's lowest value"""
+
+    scale = CompiledScale(DEFAULT_SUBJECT_SCALE)
+
+    def test_boundaries(self):
+        cases = [
+            (100, 'A+'), (90, 'A+'), (Decimal('89.99'), 'A'), (80, 'A'),
+            (Decimal('40.00'), 'C'), (Decimal('39.99'), 'D'), (0, 'D'),
+        ]
+        for percentage, grade in cases:
+            with self.subTest(percentage=percentage):
+                self.assertEqual(self.scale.lookup(percentage)[0], grade)
+
+    def test_below_the_lowest_boundary_and_missing_values_get_the_lowest_grade(self):
+        self.assertEqual(self.scale.lookup(-5), ('D', Decimal('2.00')))
+        self.assertEqual(self.scale.lookup(None), ('D', Decimal('2.00')))
+
+    def test_failed_results_get_the_fail_grade(self):
+        self.assertEqual(self.scale.grade(95, is_passed=False), ('F', Decimal('0.00')))
+
+    def test_grade_many_matches_lookup(self):
+        percentages = [0, Decimal('39.99'), 40, 75, 90, None]
+        passed = [True, True, False, True, True, True]
+        self.assertEqual(
+            self.scale.grade_many(percentages, passed),
+            [self.scale.grade(percentage, is_passed) for percentage, is_passed in zip(percentages, passed)],
+        )
+        self.assertEqual(self.scale.grade_many(percentages), [self.scale.lookup(percentage) for percentage in percentages])
+        self.assertEqual(self.scale.grade_many([]), [])
+
+
+class GradeMarksSheetTests(TestCase):
+    """Batch grading stores exactly what a per-row StudentResult.save() does"""
+
+    # (theory, practical) -> (total, percentage, grade, grade point, passed) under 75/30 + 25/10
+    EXPECTED = [
+        ((Decimal('75'), Decimal('25')), (Decimal('100.00'), Decimal('100.00'), 'A+', Decimal('4.00'), True)),
+        ((Decimal('60'), Decimal('20')), (Decimal('80.00'), Decimal('80.00'), 'A', Decimal('3.70'), True)),
+        ((Decimal('30'), Decimal('10')), (Decimal('40.00'), Decimal('40.00'), 'C', Decimal('2.30'), True)),
+        ((Decimal('29.50'), Decimal('25')), (Decimal('54.50'), Decimal('54.50'), 'F', Decimal('0.00'), False)),
+        ((Decimal('70'), Decimal('9')), (Decimal('79.00'), Decimal('79.00'), 'F', Decimal('0.00'), False)),
+        ((None, None), (Decimal('0.00'), Decimal('0.00'), 'F', Decimal('0.00'), False)),
+    ]
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.subjects = [Subject.objects.create(name=name) for name in ('English', 'Maths')]
+        cls.examination = Examination.objects.create(
+            name='First Terminal', subject=cls.subjects[0], date=datetime.date(2025, 1, 1)
+        )
+        cls.classroom = Class.objects.create(name='Five')
+        cls.students = create_students(cls.classroom, len(cls.EXPECTED))
+        cls.configs = [create_config(cls.examination, cls.classroom, subject) for subject in cls.subjects]
+
+    def graded(self, config):
+        return [
+            (result.total_marks, result.percentage, result.grade, result.grade_point, result.is_passed)
+            for result in StudentResult.objects.filter(exam_config=config).order_by('student_id')
+        ]
+
+    def test_sheet_matches_saving_row_by_row(self):
+        batch_config, row_config = self.configs
+        marks = {student: entry for student, (entry, _) in zip(self.students, self.EXPECTED)}
+        grade_marks_sheet(batch_config, marks)
+        for student, (theory, practical) in marks.items():
+            StudentResult(
+                examination=self.examination, student=student, subject=row_config.subject,
+                exam_config=row_config, theory_marks=theory, practical_marks=practical,
+            ).save()
+
+        self.assertEqual(self.graded(batch_config), [expected for _, expected in self.EXPECTED])
+        self.assertEqual(self.graded(batch_config), self.graded(row_config))
+
+    def test_regrading_a_sheet_updates_rows_with_one_statement(self):
+        config = self.configs[0]
+        grade_marks_sheet(config, {student: (Decimal('20'), Decimal('5')) for student in self.students})
+        with CaptureQueriesContext(connection) as queries:
+            grade_marks_sheet(config, {student: (Decimal('70'), Decimal('20')) for student in self.students})
+
+        writes = [query['sql'] for query in queries if query['sql'].startswith('INSERT')]
+        self.assertEqual(len(writes), 1)
+        self.assertEqual(StudentResult.objects.filter(exam_config=config).count(), len(self.students))
+        self.assertEqual({row[2] for row in self.graded(config)}, {'A+'})
+
+
+# ============ OVERALL RESULTS ============
+
+class OverallRecomputeTestCase(TestCase):
+    """A class with three subjects configured and no marks yet"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.subjects = [Subject.objects.create(name=name) for name in ('English', 'Maths', 'Science')]
+        cls.examination = Examination.objects.create(
+            name='First Terminal', subject=cls.subjects[0], date=datetime.date(2025, 1, 1)
+        )
+        cls.classroom = Class.objects.create(name='Six')
+        cls.students = create_students(cls.classroom, 12)
+        cls.configs = [create_config(cls.examination, cls.classroom, subject) for subject in cls.subjects]
+
+    def save_row_by_row(self, students, theory=Decimal('50'), practical=Decimal('20')):
+        for config in self.configs:
+            for student in students:
+                StudentResult(
+                    examination=self.examination, student=student, subject=config.subject,
+                    exam_config=config, theory_marks=theory, practical_marks=practical,
+                ).save()
+
+    def overall(self, student):
+        return StudentOverallResult.objects.filter(examination=self.examination, student=student).first()
+
+
+class CoalescedRecomputeTests(OverallRecomputeTestCase):
+    """Saves inside a transaction rebuild each student's overall result once, after commit"""
+
+    def test_each_student_is_recomputed_once_per_transaction(self):
+        students = self.students[:2]
+        with mock.patch('ResultManagement.recompute.rebuild_overall_results',
+                        wraps=recompute.rebuild_overall_results) as rebuild:
+            with self.captureOnCommitCallbacks(execute=True):
+                with transaction.atomic():
+                    self.save_row_by_row(students)
+                self.assertIsNone(self.overall(students[0]))
+
+        rebuild.assert_called_once_with(self.examination.id, {student.id for student in students})
+        self.assertEqual(self.overall(students[0]).total_subjects, 3)
+        self.assertEqual(self.overall(students[1]).total_marks_obtained, Decimal('210.00'))
+
+    def test_a_rolled_back_savepoint_does_not_drop_later_saves(self):
+        first, second = self.students[:2]
+        with self.captureOnCommitCallbacks(execute=True):
+            try:
+                with transaction.atomic():
+                    self.save_row_by_row([first])
+                    raise ValueError
+            except ValueError:
+                pass
+            self.save_row_by_row([second])
+
+        self.assertIsNone(self.overall(first))
+        self.assertEqual(self.overall(second).total_subjects, 3)
+
+    def test_recompute_queries_do_not_grow_with_students(self):
+        def recompute_queries(students):
+            with self.captureOnCommitCallbacks() as callbacks:
+                self.save_row_by_row(students)
+            with CaptureQueriesContext(connection) as queries:
+                for callback in callbacks:
+                    callback()
+            return len(queries)
+
+        # Keys left pending by other tests are flushed by the first commit
+        recompute_queries(self.students[:1])
+        self.assertEqual(recompute_queries(self.students[1:4]), recompute_queries(self.students[4:]))
+
+    def test_a_coalesce_block_that_raises_still_schedules_committed_changes(self):
+        student = self.students[0]
+        with self.captureOnCommitCallbacks(execute=True):
+            with self.assertRaises(ValueError):
+                with recompute.coalesce_overall_results():
+                    with transaction.atomic():
+                        grade_marks_sheet(self.configs[0], {student: (Decimal('60'), Decimal('20'))})
+                    raise ValueError
+
+        self.assertEqual(self.overall(student).total_marks_obtained, Decimal('80.00'))
+
+
+class OverallAggregateTests(OverallRecomputeTestCase):
+    """The aggregate overall result matches summing the subject results in Python"""
+
+    MARKS = [
+        (Decimal('75'), Decimal('25')), (Decimal('31.25'), Decimal('12')), (Decimal('20'), Decimal('24')),
+        (None, Decimal('10')), (Decimal('66.66'), None), (Decimal('45'), Decimal('15.50')),
+    ]
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        with cls.captureOnCommitCallbacks(execute=True):
+            for offset, config in enumerate(cls.configs):
+                grade_marks_sheet(config, {
+                    student: cls.MARKS[(number + offset) % len(cls.MARKS)]
+                    for number, student in enumerate(cls.students[:6])
+                })
+
+    def summed(self, student):
+        """The overall result as calculate_overall_result() worked it out before the aggregate query"""
+        results = list(StudentResult.objects.filter(examination=self.examination, student=student).select_related('exam_config'))
+        obtained = sum((result.total_marks or 0 for result in results), Decimal('0'))
+        full = sum((result.exam_config.full_theory_marks + result.exam_config.full_practical_marks for result in results), Decimal('0'))
+        points = [result.grade_point for result in results if result.grade_point is not None]
+        cgpa = (sum(points) / len(points)).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP) if points else Decimal('0.00')
+        passed = sum(result.is_passed for result in results)
+        return {
+            'total_subjects': len(results),
+            'subjects_passed': passed,
+            'subjects_failed': len(results) - passed,
+            'total_marks_obtained': obtained,
+            'total_full_marks': full,
+            'overall_percentage': (obtained / full * 100).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP) if full else Decimal('0.00'),
+            'total_grade_points': sum(points, Decimal('0')),
+            'cgpa': cgpa,
+            'overall_grade': CompiledScale(DEFAULT_OVERALL_SCALE).lookup(cgpa)[0],
+            'is_promoted': passed == len(results),
+        }
+
+    def stored(self, student):
+        overall = self.overall(student)
+        return {field: getattr(overall, field) for field in self.summed(student)}
+
+    def test_rebuilt_results_match_summing_in_python(self):
+        for student in self.students[:6]:
+            with self.subTest(student=student.roll_number):
+                self.assertEqual(self.stored(student), self.summed(student))
+
+    def test_calculate_overall_result_issues_one_aggregate_query(self):
+        student = self.students[0]
+        StudentOverallResult.objects.filter(student=student).delete()
+        overall = StudentOverallResult(examination=self.examination, student=student)
+        # Compile the grading scales first; a test with other cache settings may have left them stale
+        get_grading_scale('overall', self.classroom.id)
+        with CaptureQueriesContext(connection) as queries:
+            overall.calculate_overall_result()
+
+        self.assertEqual(len([query for query in queries if query['sql'].startswith('SELECT')]), 1)
+        self.assertEqual(self.stored(student), self.summed(student))
+
+    def test_students_without_results_get_empty_totals(self):
+        overall = StudentOverallResult(examination=self.examination, student=self.students[-1])
+        overall.calculate_overall_result()
+        self.assertEqual((overall.total_subjects, overall.cgpa, overall.overall_percentage), (0, Decimal('0.00'), 0))
+
+    def test_one_grouped_query_totals_a_whole_class(self):
+        with self.assertNumQueries(1):
+            totals = StudentOverallResult.aggregate_subject_results(self.examination.id)
+        self.assertEqual(set(totals), {student.id for student in self.students[:6]})
+        self.assertTrue(all(row['total_subjects'] == 3 for row in totals.values()))
+
+
+@override_settings(CACHES=TEST_CACHES)
+class BulkRecomputeTests(OverallRecomputeTestCase):
+    """recompute_overall_results_bulk rebuilds whole classes, examinations or the school"""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.other_classroom = Class.objects.create(name='Nine')
+        other_students = create_students(cls.other_classroom, 3)
+        other_config = create_config(cls.examination, cls.other_classroom, cls.subjects[0])
+        with cls.captureOnCommitCallbacks(execute=True):
+            for number, config in enumerate(cls.configs):
+                grade_marks_sheet(config, {
+                    student: (Decimal(30 + 3 * index + number), Decimal(15)) for index, student in enumerate(cls.students)
+                })
+            grade_marks_sheet(other_config, {student: (Decimal('70'), Decimal('25')) for student in other_students})
+
+    def corrupt(self):
+        """Overwrite every overall result, as a bug or a manual edit might"""
+        StudentOverallResult.objects.update(total_subjects=0, cgpa=Decimal('0.00'), overall_grade='', is_promoted=False)
+
+    def snapshot(self):
+        return sorted(StudentOverallResult.objects.values_list(
+            'student_id', 'total_subjects', 'total_marks_obtained', 'cgpa', 'overall_grade', 'is_promoted',
+        ))
+
+    def test_examination_recompute_restores_every_class_in_chunks(self):
+        expected = self.snapshot()
+        self.corrupt()
+        cache.set(analytics_cache_key(self.examination.id), {'stale': True})
+
+        done = list(recompute.recompute_overall_results_bulk(examination_id=self.examination.id, chunk_size=5))
+
+        self.assertEqual(sorted(done), sorted([
+            (self.examination.id, self.classroom.id, 12), (self.examination.id, self.other_classroom.id, 3),
+        ]))
+        self.assertEqual(self.snapshot(), expected)
+        self.assertIsNone(cache.get(analytics_cache_key(self.examination.id)))
+
+    def test_class_recompute_leaves_other_classes_alone(self):
+        self.corrupt()
+        done = list(recompute.recompute_overall_results_bulk(
+            examination_id=self.examination.id, classroom_id=self.classroom.id,
+        ))
+
+        self.assertEqual(done, [(self.examination.id, self.classroom.id, 12)])
+        self.assertFalse(StudentOverallResult.objects.filter(student__classroom=self.classroom, total_subjects=0).exists())
+        self.assertEqual(
+            StudentOverallResult.objects.filter(student__classroom=self.other_classroom, total_subjects=0).count(), 3
+        )
+
+    def test_command_reports_what_it_rebuilt(self):
+        self.corrupt()
+        output = StringIO()
+        call_command('recompute_overall_results', exam=self.examination.id, stdout=output)
+
+        self.assertIn("Recomputed 15 overall results across 2 classes", output.getvalue())
+        self.assertFalse(StudentOverallResult.objects.filter(total_subjects=0).exists())
+
+
+class ClassRankTests(OverallRecomputeTestCase):
+    """Saving marks rebuilds the class ranks and standings"""
+
+    def grade(self, marks):
+        with self.captureOnCommitCallbacks(execute=True):
+            for config in self.configs:
+                grade_marks_sheet(config, {student: (theory, Decimal('20')) for student, theory in marks.items()})
+
+    def ranks(self, classroom=None):
+        return dict(ClassRank.objects.filter(
+            examination=self.examination, classroom=classroom or self.classroom
+        ).values_list('student_id', 'rank'))
+
+    def test_tied_students_share_a_rank_and_the_next_is_skipped(self):
+        first, second, third, fourth = self.students[:4]
+        self.grade({first: Decimal('70'), second: Decimal('60'), third: Decimal('60'), fourth: Decimal('40')})
+
+        self.assertEqual(self.ranks(), {first.id: 1, second.id: 2, third.id: 2, fourth.id: 4})
+        standing = ClassRank.objects.get(student=fourth).subject_standings[str(self.subjects[0].id)]
+        self.assertEqual(standing, {'position': 4, 'highest': '90.00', 'average': '77.50'})
+
+    def test_students_whose_results_are_removed_lose_their_rank(self):
+        first, second = self.students[:2]
+        self.grade({first: Decimal('70'), second: Decimal('60')})
+        with self.captureOnCommitCallbacks(execute=True):
+            StudentResult.objects.filter(student=first).delete()
+
+        self.assertEqual(self.ranks(), {second.id: 1})
+        self.assertEqual(ClassRank.objects.get(student=second).students_ranked, 1)
+
+    def test_one_save_costs_the_same_queries_in_a_class_of_fifty(self):
+        def save_queries(students):
+            self.grade({student: Decimal(20 + index) for index, student in enumerate(students)})
+            result = StudentResult.objects.get(student=students[0], exam_config=self.configs[0])
+            result.theory_marks = Decimal('74')
+            with CaptureQueriesContext(connection) as queries:
+                with self.captureOnCommitCallbacks(execute=True):
+                    result.save()
+            return len(queries)
+
+        small = save_queries(self.students[:5])
+        classroom = Class.objects.create(name='Ten')
+        self.configs = [create_config(self.examination, classroom, subject) for subject in self.subjects]
+        students = create_students(classroom, 50)
+        large = save_queries(students)
+
+        self.assertEqual(small, large)
+        self.assertLessEqual(large, 15)
+        standing = ClassRank.objects.get(classroom=classroom, student=students[0]).subject_standings
+        self.assertEqual(standing[str(self.subjects[0].id)]['position'], 1)
+
+    def test_cards_use_the_rank_of_the_class_the_results_were_entered_for(self):
+        student = self.students[0]
+        self.grade({student: Decimal('50')})
+        new_classroom = Class.objects.create(name='Seven')
+        ClassRank.objects.create(examination=self.examination, classroom=new_classroom, student=student, rank=9)
+        student.classroom = new_classroom
+        student.save()
+
+        results = list(StudentResult.objects.filter(student=student).select_related('exam_config'))
+        self.assertEqual(student_class_rank(self.examination, student, results).classroom, self.classroom)
+        self.assertEqual(student_class_rank(self.examination, student, []).classroom, new_classroom)
+
+
+# ============ EXPORTS ============
+
+@override_settings(CACHES=TEST_CACHES)
+class ExportResultsTests(OverallRecomputeTestCase):
+    """The CSV export lists each subject result with its student's overall result and rank"""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.user = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        cls.other_classroom = Class.objects.create(name='Nine')
+        cls.other_students = create_students(cls.other_classroom, 2)
+        other_config = create_config(cls.examination, cls.other_classroom, cls.subjects[0])
+        with cls.captureOnCommitCallbacks(execute=True):
+            for config in cls.configs:
+                grade_marks_sheet(config, {
+                    student: (Decimal(70 - index), Decimal('20')) for index, student in enumerate(cls.students[:4])
+                })
+            grade_marks_sheet(other_config, {student: (Decimal('40'), Decimal('5')) for student in cls.other_students})
+
+    def rows(self, **filters):
+        lines = list(export_results_csv(self.examination.id, **filters))
+        return [dict(zip([header for header, _ in EXPORT_COLUMNS], row)) for row in csv.reader(lines[1:])]
+
+    def test_one_row_per_subject_result_with_overall_and_rank(self):
+        rows = self.rows()
+
+        self.assertEqual(len(rows), 14)
+        first = next(row for row in rows if row['Class'] == 'Six' and row['Roll No.'] == '1' and row['Subject'] == 'Maths')
+        self.assertEqual(
+            (first['Total Marks'], first['Full Marks'], first['Passed'], first['Overall Marks'], first['Rank']),
+            ('90.00', '100', 'Yes', '270.00', '1'),
+        )
+        failed = next(row for row in rows if row['Class'] == 'Nine')
+        self.assertEqual((failed['Passed'], failed['Promoted'], failed['Rank']), ('No', 'No', '1'))
+        self.assertEqual([row['Class'] for row in rows], sorted(row['Class'] for row in rows))
+
+    def test_class_and_subject_filters(self):
+        self.assertEqual({row['Class'] for row in self.rows(classroom_id=self.other_classroom.id)}, {'Nine'})
+        rows = self.rows(classroom_id=self.classroom.id, subject_id=self.subjects[1].id)
+        self.assertEqual([(row['Roll No.'], row['Subject']) for row in rows], [(str(number), 'Maths') for number in range(1, 5)])
+
+    def test_a_student_ranked_in_two_classes_is_listed_once(self):
+        student = self.students[0]
+        ClassRank.objects.create(examination=self.examination, classroom=self.other_classroom, student=student, rank=7)
+        rows = [row for row in self.rows() if row['First Name'] == student.first_name and row['Class'] == 'Six']
+        self.assertEqual([row['Rank'] for row in rows], ['1', '1', '1'])
+
+    def test_the_export_is_read_with_one_query(self):
+        with self.assertNumQueries(1):
+            list(export_results_csv(self.examination.id, chunk_size=5))
+
+    def test_view_streams_a_named_csv_and_rejects_bad_filters(self):
+        self.client.force_login(self.user)
+        url = reverse('result:export_results', args=[self.examination.id])
+
+        response = self.client.get(url, {'class': self.classroom.id})
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="results_first-terminal_six.csv"')
+        self.assertEqual(len(b''.join(response.streaming_content).decode().splitlines()), 13)
+        self.assertEqual(self.client.get(url, {'class': 'six'}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'class': 999}).status_code, 404)
+
+
+# ============ ANALYTICS ============
+
+@override_settings(CACHES=TEST_CACHES)
+class ExamAnalyticsTests(OverallRecomputeTestCase):
+    """The vectorized statistics match working them out row by row in Python"""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        with cls.captureOnCommitCallbacks(execute=True):
+            for number, config in enumerate(cls.configs):
+                grade_marks_sheet(config, {
+                    student: (Decimal(min(20 + 5 * index + number, 75)), Decimal(6 + (index + number) % 12))
+                    for index, student in enumerate(cls.students)
+                })
+
+    def subject_entry(self, analytics, config):
+        (class_entry,) = analytics['classes']
+        return next(entry for entry in class_entry['subjects'] if entry['subject_id'] == config.subject_id)
+
+    def assertStatistics(self, entry, values, passed):
+        self.assertEqual(entry['count'], len(values))
+        self.assertAlmostEqual(entry['mean'], statistics.mean(values), delta=0.01)
+        self.assertAlmostEqual(entry['median'], statistics.median(values), delta=0.01)
+        self.assertAlmostEqual(entry['std'], statistics.pstdev(values), delta=0.01)
+        self.assertAlmostEqual(entry['highest'], max(values), delta=0.01)
+        self.assertAlmostEqual(entry['lowest'], min(values), delta=0.01)
+        self.assertAlmostEqual(entry['pass_rate'], sum(passed) / len(passed) * 100, delta=0.1)
+        self.assertEqual(entry['histogram'], [
+            sum(min(int(value // 10), 9) == bucket for value in values) for bucket in range(10)
+        ])
+
+    def test_subject_statistics_match_python(self):
+        analytics = compute_exam_analytics(self.examination.id)
+
+        self.assertEqual(analytics['results'], 36)
+        for config in self.configs:
+            with self.subTest(subject=config.subject.name):
+                results = list(StudentResult.objects.filter(exam_config=config))
+                entry = self.subject_entry(analytics, config)
+                self.assertStatistics(
+                    entry, [float(result.percentage) for result in results], [result.is_passed for result in results]
+                )
+                self.assertEqual(entry['grades'], dict(Counter(result.grade for result in results)))
+
+    def test_class_statistics_use_each_students_overall_percentage(self):
+        (class_entry,) = compute_exam_analytics(self.examination.id)['classes']
+
+        overall = []
+        promoted = []
+        for student in self.students:
+            results = list(StudentResult.objects.filter(student=student).select_related('exam_config'))
+            obtained = sum(float(result.total_marks) for result in results)
+            full = sum(float(result.exam_config.full_theory_marks + result.exam_config.full_practical_marks) for result in results)
+            overall.append(obtained / full * 100)
+            promoted.append(all(result.is_passed for result in results))
+
+        self.assertEqual(class_entry['students'], 12)
+        self.assertStatistics(dict(class_entry, count=class_entry['students']), overall, promoted)
+        self.assertEqual(sum(class_entry['grades'].values()), 36)
+
+    def test_an_examination_without_results_has_no_classes(self):
+        examination = Examination.objects.create(name='Final', subject=self.subjects[0], date=datetime.date(2025, 3, 1))
+        analytics = compute_exam_analytics(examination.id)
+        self.assertEqual((analytics['results'], analytics['classes']), (0, []))
+
+    def test_statistics_are_cached_until_marks_change(self):
+        first = get_exam_analytics(self.examination.id)
+        with self.assertNumQueries(0):
+            self.assertEqual(get_exam_analytics(self.examination.id), first)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            grade_marks_sheet(self.configs[0], {self.students[0]: (Decimal('75'), Decimal('25'))})
+
+        entry = self.subject_entry(get_exam_analytics(self.examination.id), self.configs[0])
+        self.assertEqual(entry['highest'], 100.0)
+
+
+# ============ VIEW RESULTS ============
+
+class ViewResultsQueryCountTests(TestCase):
+    """view_results must not issue queries per student"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        cls.subjects = [Subject.objects.create(name=name) for name in ('English', 'Maths', 'Science')]
+        cls.examination = Examination.objects.create(
+            name='First Terminal', subject=cls.subjects[0], date=datetime.date(2025, 1, 1)
+        )
+
+    def create_class(self, name, size):
+        classroom = Class.objects.create(name=name)
+        students = [
+            Student.objects.create(
+                first_name=f'Student{number}', last_name=name, roll_number=str(number),
+                date_of_birth=datetime.date(2012, 1, 1), father_name='Father', mother_name='Mother',
+                permanent_address='Address', student_contact='9800000000', classroom=classroom,
+            )
+            for number in range(1, size + 1)
+        ]
+        with self.captureOnCommitCallbacks(execute=True):
+            for subject in self.subjects:
+                ClassSubject.objects.create(classroom=classroom, subject=subject)
+                config = ExamConfiguration.objects.create(
+                    examination=self.examination, classroom=classroom, subject=subject,
+                    full_theory_marks=75, pass_theory_marks=30,
+                    has_practical=True, full_practical_marks=25, pass_practical_marks=10,
+                )
+                grade_marks_sheet(config, {student: (50, 20) for student in students})
+        return classroom
+
+    def count_queries(self, classroom):
+        self.client.force_login(self.user)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('result:view_results'), {
+                'exam': self.examination.id,
+                'class': classroom.id,
+            })
+        self.assertEqual(response.status_code, 200)
+        return len(queries), response
+
+    def test_query_count_does_not_grow_with_class_size(self):
+        small, small_response = self.count_queries(self.create_class('Small', 3))
+        large, large_response = self.count_queries(self.create_class('Large', 30))
+
+        self.assertEqual(len(small_response.context['results']), 3)
+        self.assertEqual(len(large_response.context['results']), 30)
+        self.assertEqual(len(large_response.context['results'][0]['subject_results']), 3)
+        self.assertIsNotNone(large_response.context['results'][0]['overall_result'])
+        self.assertEqual(small, large)
+
+    def test_results_are_paginated(self):
+        classroom = self.create_class('Paged', 60)
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('result:view_results'), {
+            'exam': self.examination.id,
+            'class': classroom.id,
+            'page': 2,
+        })
+        self.assertEqual(response.context['page'].paginator.count, 60)
+        self.assertEqual(len(response.context['results']), 10)
+
+
+# ============ MARKS ENTRY ============
+
+class MarksSheetTestCase(TestCase):
+    """A class of three students with theory marks entered for one subject"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        cls.subject = Subject.objects.create(name='English')
+        cls.examination = Examination.objects.create(
+            name='First Terminal', subject=cls.subject, date=datetime.date(2025, 1, 1)
+        )
+        cls.classroom = Class.objects.create(name='Eight')
+        cls.students = create_students(cls.classroom, 3)
+        with cls.captureOnCommitCallbacks(execute=True):
+            ClassSubject.objects.create(classroom=cls.classroom, subject=cls.subject)
+            cls.config = ExamConfiguration.objects.create(
+                examination=cls.examination, classroom=cls.classroom, subject=cls.subject,
+                full_theory_marks=100, pass_theory_marks=40,
+            )
+            grade_marks_sheet(cls.config, {student: (Decimal('50.00'), None) for student in cls.students})
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def stored(self):
+        return {
+            result.student_id: result
+            for result in StudentResult.objects.filter(exam_config=self.config)
+        }
+
+
+class MarksEntryTests(MarksSheetTestCase):
+    """Saving the marks sheet writes only changed rows and never overwrites newer edits"""
+
+    def post_sheet(self, marks, versions):
+        data = {}
+        for student in self.students:
+            data[f'theory_{student.id}'] = str(marks[student])
+            data[f'version_{student.id}'] = versions[student.id].isoformat()
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('result:enter_marks', args=[self.config.id]), data)
+        return [str(message) for message in get_messages(response.wsgi_request)]
+
+    def test_only_changed_rows_are_saved(self):
+        before = self.stored()
+        first, second, third = self.students
+        messages = self.post_sheet(
+            {first: '50.00', second: '72.50', third: '50.00'},
+            {student_id: result.updated_at for student_id, result in before.items()},
+        )
+
+        after = self.stored()
+        self.assertEqual(after[second.id].theory_marks, Decimal('72.50'))
+        self.assertEqual(after[second.id].grade, 'B+')
+        self.assertGreater(after[second.id].updated_at, before[second.id].updated_at)
+        self.assertEqual(after[first.id].updated_at, before[first.id].updated_at)
+        self.assertEqual(after[third.id].updated_at, before[third.id].updated_at)
+        self.assertIn("Marks saved for 1 students (2 unchanged).", messages)
+
+    def test_rows_changed_since_loading_are_not_overwritten(self):
+        loaded = {student_id: result.updated_at for student_id, result in self.stored().items()}
+        first, second, third = self.students
+        # Someone else saves a mark for the first student after the sheet was opened
+        with self.captureOnCommitCallbacks(execute=True):
+            grade_marks_sheet(self.config, {first: (Decimal('91.00'), None)})
+
+        messages = self.post_sheet({first: '30.00', second: '60.00', third: '50.00'}, loaded)
+
+        after = self.stored()
+        self.assertEqual(after[first.id].theory_marks, Decimal('91.00'))
+        self.assertEqual(after[second.id].theory_marks, Decimal('60.00'))
+        self.assertTrue(any('changed by someone else' in message and str(first) in message for message in messages))
+
+
+class AutosaveTests(MarksSheetTestCase):
+    """Autosave writes the cells it is sent and rejects those edited since they were loaded"""
+
+    def autosave(self, cells):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                reverse('result:autosave_marks', args=[self.config.id]),
+                json.dumps({'cells': cells}), content_type='application/json',
+            )
+        return response
+
+    def statuses(self, response):
+        return {row['student_id']: row for row in response.json()['results']}
+
+    def test_changed_cells_are_saved_and_return_their_new_version(self):
+        first, second = self.students[:2]
+        stored = self.stored()
+        response = self.autosave([
+            {'student': first.id, 'theory': '81', 'version': stored[first.id].updated_at.isoformat()},
+            {'student': second.id, 'theory': '50.00', 'version': stored[second.id].updated_at.isoformat()},
+        ])
+
+        self.assertEqual(response.json()['saved'], 1)
+        rows = self.statuses(response)
+        self.assertEqual((rows[first.id]['status'], rows[first.id]['grade']), ('saved', 'A'))
+        self.assertEqual(rows[first.id]['version'], self.stored()[first.id].updated_at.isoformat())
+        self.assertEqual(rows[second.id]['status'], 'unchanged')
+
+    def test_a_stale_version_returns_the_stored_values(self):
+        student = self.students[0]
+        loaded = self.stored()[student.id].updated_at.isoformat()
+        self.autosave([{'student': student.id, 'theory': '70', 'version': loaded}])
+
+        rows = self.statuses(self.autosave([{'student': student.id, 'theory': '20', 'version': loaded}]))
+
+        self.assertEqual(rows[student.id]['status'], 'stale')
+        self.assertEqual(rows[student.id]['theory_marks'], '70.00')
+        self.assertEqual(self.stored()[student.id].theory_marks, Decimal('70.00'))
+
+    def test_a_new_row_is_saved_without_a_version(self):
+        student = create_students(self.classroom, 4)[-1]
+        rows = self.statuses(self.autosave([{'student': student.id, 'theory': '45', 'version': ''}]))
+
+        self.assertEqual(rows[student.id]['status'], 'saved')
+        self.assertEqual(self.stored()[student.id].theory_marks, Decimal('45'))
+
+    def test_invalid_marks_are_reported_per_cell(self):
+        first, second = self.students[:2]
+        stored = self.stored()
+        rows = self.statuses(self.autosave([
+            {'student': first.id, 'theory': '101', 'version': stored[first.id].updated_at.isoformat()},
+            {'student': second.id, 'theory': '60', 'version': stored[second.id].updated_at.isoformat()},
+        ]))
+
+        self.assertEqual(rows[first.id]['status'], 'invalid')
+        self.assertIn('between 0 and 100', rows[first.id]['error'])
+        self.assertEqual(rows[second.id]['status'], 'saved')
+        self.assertEqual(self.stored()[first.id].theory_marks, Decimal('50.00'))
+
+    def test_students_outside_the_class_and_oversized_requests_are_rejected(self):
+        outsider = create_students(Class.objects.create(name='Nine'), 1)[0]
+        self.assertEqual(self.autosave([{'student': outsider.id, 'theory': '50'}]).status_code, 400)
+        cells = [{'student': self.students[0].id, 'theory': '50'}] * 101
+        self.assertEqual(self.autosave(cells).status_code, 400)
+        self.assertEqual(self.autosave([]).status_code, 400)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class MarksValidationTests(MarksSheetTestCase):
+    """The marks sheet checks pass/fail status in bulk for the teachers of the subject"""
+
+    def validate(self, data, client=None):
+        return (client or self.client).post(
+            reverse('result:validate_marks_batch'), json.dumps(data), content_type='application/json'
+        )
+
+    def other_teacher(self):
+        user = User.objects.create_user('teacher', 'teacher@example.com', 'password')
+        Teacher.objects.create(user=user, full_name='Other Teacher', date_joined=datetime.date(2020, 1, 1))
+        client = Client()
+        client.force_login(user)
+        return client
+
+    def test_each_row_gets_its_status(self):
+        response = self.validate({'config_id': self.config.id, 'rows': [
+            {'student': 1, 'theory': '75'}, {'student': 2, 'theory': '20'},
+            {'student': 3, 'theory': '120'}, {'student': 4, 'theory': ''},
+        ]}).json()
+
+        self.assertEqual(
+            [(row['student'], row['overall_status']) for row in response['rows']],
+            [(1, 'pass'), (2, 'fail'), (3, 'invalid'), (4, 'pass')],
+        )
+        self.assertEqual(response['thresholds']['pass_theory'], 40.0)
+
+    def test_thresholds_are_sent_only_when_the_page_is_out_of_date(self):
+        version = self.validate({'config_id': self.config.id, 'rows': []}).json()['version']
+        self.assertNotIn('thresholds', self.validate({'config_id': self.config.id, 'version': version, 'rows': []}).json())
+
+        self.config.pass_theory_marks = 60
+        with self.captureOnCommitCallbacks(execute=True):
+            self.config.save()
+        response = self.validate({'config_id': self.config.id, 'version': version, 'rows': [{'theory': '50'}]}).json()
+        self.assertEqual(response['thresholds']['pass_theory'], 60.0)
+        self.assertEqual(response['rows'][0]['overall_status'], 'fail')
+
+    def test_malformed_requests_are_rejected(self):
+        for data in ({'config_id': 'x', 'rows': []}, {'config_id': self.config.id, 'rows': ['50']},
+                     {'config_id': self.config.id, 'rows': {'theory': '50'}}):
+            with self.subTest(data=data):
+                self.assertEqual(self.validate(data).status_code, 400)
+        self.assertEqual(self.validate({'config_id': 0, 'rows': []}).status_code, 404)
+
+    def test_teachers_of_other_subjects_are_denied(self):
+        client = self.other_teacher()
+        self.assertEqual(self.validate({'config_id': self.config.id, 'rows': []}, client).status_code, 403)
+        response = client.post(
+            reverse('result:check_marks_status'), json.dumps({'config_id': self.config.id, 'theory_marks': '50'}),
+            content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 403)
+
+    def test_single_mark_checks_require_a_csrf_token(self):
+        client = Client(enforce_csrf_checks=True)
+        client.force_login(self.user)
+        response = client.post(
+            reverse('result:check_marks_status'), json.dumps({'config_id': self.config.id, 'theory_marks': '50'}),
+            content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 403)
+
+        response = self.client.post(
+            reverse('result:check_marks_status'), json.dumps({'config_id': self.config.id, 'theory_marks': '30'}),
+            content_type='application/json',
+        )
+        self.assertEqual(response.json()['overall_status'], 'fail')
+
+
+class ThresholdRegradeTests(MarksSheetTestCase):
+    """Changing a configuration's thresholds regrades its results in the background"""
+
+    def save_configuration(self, pass_theory):
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.client.post(
+                reverse('result:exam_configuration_create', args=[self.examination.id, self.classroom.id]),
+                {f'full_theory_{self.subject.id}': '100', f'pass_theory_{self.subject.id}': pass_theory},
+            )
+        return callbacks
+
+    def test_changed_threshold_enqueues_a_regrade(self):
+        callbacks = self.save_configuration('60')
+
+        job = BackgroundJob.objects.get(kind=BackgroundJob.REGRADE)
+        self.assertEqual(job.params, {'config_ids': [self.config.id]})
+        self.assertEqual(job.status, BackgroundJob.QUEUED)
+        # The job starts only once the request's transaction commits
+        self.assertEqual(len(callbacks), 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            job = run_job(job.id)
+        self.assertEqual(job.status, BackgroundJob.COMPLETED, job.error)
+        self.assertEqual(job.result['results_regraded'], 3)
+        self.assertFalse(any(result.is_passed for result in self.stored().values()))
+
+    def test_unchanged_thresholds_enqueue_nothing(self):
+        self.save_configuration('40')
+        self.assertFalse(BackgroundJob.objects.filter(kind=BackgroundJob.REGRADE).exists())
+
+
+class MarksImportTests(MarksSheetTestCase):
+    """A dry run reports what an import would save without writing it"""
+
+    def upload(self):
+        lines = ['Roll Number,Theory', '1,50', '2,65.5', '3,20', '4,70', '2,10', '1,abc']
+        return SimpleUploadedFile('marks.csv', '\n'.join(lines).encode())
+
+    def test_dry_run_saves_nothing(self):
+        before = self.stored()
+        report = import_marks_file(self.upload(), [self.config], dry_run=True)
+
+        self.assertEqual((report['rows'], report['valid'], report['error_rows']), (6, 3, 3))
+        self.assertEqual((report['saved'], report['would_save'], report['unchanged']), (0, 2, 1))
+        after = self.stored()
+        self.assertEqual(
+            {student_id: (result.theory_marks, result.updated_at) for student_id, result in after.items()},
+            {student_id: (result.theory_marks, result.updated_at) for student_id, result in before.items()},
+        )
+
+    def test_import_saves_changed_rows(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            report = import_marks_file(self.upload(), [self.config])
+
+        self.assertEqual((report['saved'], report['would_save'], report['unchanged']), (2, 2, 1))
+        self.assertEqual((report['passed'], report['failed']), (1, 1))
+        stored = self.stored()
+        self.assertEqual(stored[self.students[1].id].theory_marks, Decimal('65.50'))
+        self.assertFalse(stored[self.students[2].id].is_passed)
+        self.assertEqual(
+            [error['line'] for error in report['errors']],
+            [5, 6, 7],
+        )
+
+    def test_a_malformed_csv_is_a_file_error(self):
+        lines = ['Roll Number,Theory', '1,50', '2,' + 'x' * (csv.field_size_limit() + 1)]
+        upload = SimpleUploadedFile('marks.csv', '\n'.join(lines).encode())
+        with self.assertRaisesMessage(ImportFileError, "malformed near line 3"):
+            import_marks_file(upload, [self.config])
+        self.assertEqual({result.theory_marks for result in self.stored().values()}, {Decimal('50.00')})
+
+
+# ============ PDF RENDERER ============
+
+class FakeRendererServer(RendererServer):
+    """Serves the renderer protocol with canned PDFs instead of a browser"""
+
+    async def render(self, html, options=None, ready=None):
+        if html == 'fail':
+            raise RuntimeError("Page crashed")
+        self.renders += 1
+        return json.dumps({'html': html, 'options': options, 'ready': ready}).encode()
+
+
+class RendererProtocolTests(SimpleTestCase):
+    """Clients and the renderer process exchange length-prefixed frames over a socket"""
+
+    def setUp(self):
+        directory = self.enterContext(tempfile.TemporaryDirectory())
+        self.address = os.path.join(directory, 'renderer.sock')
+        self.enterContext(override_settings(
+            RESULT_PDF_RENDERER={'ADDRESS': self.address, 'AUTOSTART': False, 'TIMEOUT': 5},
+        ))
+
+    def serve(self, handle_client=None):
+        """Listen on the test address from an event loop in another thread"""
+        self.server = FakeRendererServer(address=self.address)
+        loop = asyncio.new_event_loop()
+
+        async def listen():
+            self.server.server = await asyncio.start_unix_server(
+                handle_client or self.server.handle_client, path=self.address
+            )
+
+        loop.run_until_complete(listen())
+        thread = threading.Thread(target=loop.run_forever)
+        thread.start()
+
+        async def close():
+            self.server.server.close()
+            # Let the connection handlers finish closing their sockets
+            tasks = asyncio.all_tasks() - {asyncio.current_task()}
+            if tasks:
+                await asyncio.wait(tasks, timeout=5)
+
+        def stop():
+            asyncio.run_coroutine_threadsafe(close(), loop).result(5)
+            loop.call_soon_threadsafe(loop.stop)
+            thread.join()
+            loop.close()
+        self.addCleanup(stop)
+
+    def test_render_round_trip(self):
+        self.serve()
+        pdf = json.loads(render_pdf('<p>card</p>', {'scale': 0.9}, ready=CARD_READY_SELECTOR))
+        self.assertEqual(pdf, {'html': '<p>card</p>', 'options': {'scale': 0.9}, 'ready': CARD_READY_SELECTOR})
+
+        pdf = json.loads(asyncio.run(render_pdf_async('<p>async</p>')))
+        self.assertEqual((pdf['html'], pdf['ready']), ('<p>async</p>', None))
+
+    def test_render_failures_are_reported_to_the_client(self):
+        self.serve()
+        with self.assertRaisesMessage(RendererError, "Page crashed"):
+            render_pdf('fail')
+        with self.assertRaisesMessage(RendererError, "Page crashed"):
+            asyncio.run(render_pdf_async('fail'))
+
+    def test_health_and_shutdown(self):
+        self.serve()
+        render_pdf('<p>card</p>')
+        health = renderer_health()
+        self.assertEqual((health['ok'], health['renders'], health['pid']), (True, 1, os.getpid()))
+
+        self.assertTrue(stop_renderer())
+        # The server answers before it stops listening
+        deadline = time.monotonic() + 5
+        while not self.server.stopping and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertTrue(self.server.stopping)
+        with self.assertRaises(RendererUnavailable):
+            renderer_health()
+
+    def test_a_truncated_response_is_a_renderer_error(self):
+        async def handle_client(reader, writer):
+            await read_frame(reader)
+            await read_frame(reader)
+            writer.write(FRAME.pack(100) + b'{"ok": tr')
+            writer.close()
+
+        self.serve(handle_client)
+        with self.assertRaisesMessage(RendererError, "closed the connection"):
+            render_pdf('<p>card</p>')
+
+    def test_no_renderer_without_autostart(self):
+        with self.assertRaises(RendererUnavailable):
+            render_pdf('<p>card</p>')
+        with self.assertRaises(RendererUnavailable):
+            asyncio.run(render_pdf_async('<p>card</p>'))
+        self.assertFalse(stop_renderer())
+
+    def test_pages_may_only_fetch_inline_and_static_assets(self):
+        static = Path(self.address).parent
+        cases = [
+            ('data:image/png;base64,AAAA', True),
+            ((static / 'logo.png').as_uri(), True),
+            ((static / 'css' / '..' / 'logo.png').as_uri(), True),
+            (f"file://{static}/../secret.txt", False),
+            ('file:///etc/passwd', False),
+            ('https://example.com/logo.png', False),
+        ]
+        for url, allowed in cases:
+            with self.subTest(url=url):
+                self.assertEqual(allowed_request_url(url, [static.resolve()]), allowed)
+
+
+# ============ CLASS DOCUMENTS ============
+
+def class_document(*pages):
+    """PDF whose pages show the given text, standing in for a rendered class document"""
+    from reportlab.pdfgen import canvas
+
+    output = BytesIO()
+    document = canvas.Canvas(output)
+    for text in pages:
+        document.drawString(72, 720, text)
+        document.showPage()
+    document.save()
+    return output.getvalue()
+
+
+class SplitClassDocumentTests(SimpleTestCase):
+    """Each card of a class document becomes its own PDF, whatever its length"""
+
+    cards = [(SimpleNamespace(id=student_id), {}) for student_id in (4, 7, 9)]
+
+    def split(self, pdf):
+        from pypdf import PdfReader
+
+        return [
+            (student.id, len(PdfReader(BytesIO(card)).pages))
+            for student, card in split_class_document(pdf, self.cards)
+        ]
+
+    def test_a_page_per_card(self):
+        pdf = class_document('[[card:4]]', '[[card:7]]', '[[card:9]]')
+        self.assertEqual(self.split(pdf), [(4, 1), (7, 1), (9, 1)])
+
+    def test_cards_spanning_pages_keep_their_pages(self):
+        pdf = class_document('[[card:4]]', '[[card:7]]', 'continued', 'continued', '[[card:9]]')
+        self.assertEqual(self.split(pdf), [(4, 1), (7, 3), (9, 1)])
+
+    def test_a_document_not_starting_with_a_card_is_rejected(self):
+        pdf = class_document('cover', '[[card:4]]', '[[card:7]]', '[[card:9]]')
+        with self.assertRaisesMessage(RendererError, "does not start with a card marker"):
+            self.split(pdf)
+
+    def test_missing_cards_are_rejected(self):
+        pdf = class_document('[[card:4]]', 'continued', '[[card:9]]', 'continued')
+        with self.assertRaisesMessage(RendererError, "Found 2 of 3 cards"):
+            self.split(pdf)
+
+
+# ============ BULK PDF JOBS ============
+
+class BulkPDFJobTestCase(TestCase):
+    """A class of twelve students with results, writing job output to a temporary directory"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.subject = Subject.objects.create(name='English')
+        cls.examination = Examination.objects.create(
+            name='First Terminal', subject=cls.subject, date=datetime.date(2025, 1, 1)
+        )
+        cls.classroom = Class.objects.create(name='Seven')
+        students = create_students(cls.classroom, 12)
+        with cls.captureOnCommitCallbacks(execute=True):
+            ClassSubject.objects.create(classroom=cls.classroom, subject=cls.subject)
+            cls.config = ExamConfiguration.objects.create(
+                examination=cls.examination, classroom=cls.classroom, subject=cls.subject,
+                full_theory_marks=100, pass_theory_marks=40,
+            )
+            grade_marks_sheet(cls.config, {student: (number * 5, None) for number, student in enumerate(students, 1)})
+
+    def setUp(self):
+        output_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(output_dir.cleanup)
+        self.enterContext(override_settings(
+            RESULT_PDF_OUTPUT_DIR=output_dir.name,
+            RESULT_PDF_CACHE={'MAX_SIZE': 0},
+        ))
+        self.enterContext(mock.patch('ResultManagement.cards.ensure_renderer'))
+
+
+class BulkPDFJobLifecycleTests(BulkPDFJobTestCase):
+    """A bulk PDF request queues a job whose progress and ZIP are read back from the database"""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.admin = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        cls.teacher = User.objects.create_user('teacher', 'teacher@example.com', 'password')
+        Teacher.objects.create(user=cls.teacher, full_name='Class Teacher', date_joined=datetime.date(2020, 1, 1))
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.admin)
+
+    def request_pdfs(self, **data):
+        with self.captureOnCommitCallbacks() as callbacks:
+            response = self.client.post(
+                reverse('result:generate_class_results_pdf_playwright', args=[self.examination.id, self.classroom.id]),
+                {'backend': 'reportlab', 'optimize': 'none', **data},
+            )
+        return response, callbacks
+
+    def test_a_request_queues_one_job_and_starts_it_after_commit(self):
+        response, callbacks = self.request_pdfs()
+
+        job = BackgroundJob.objects.get(kind=BackgroundJob.BULK_PDF)
+        self.assertRedirects(response, reverse('result:bulk_pdf_job', args=[job.id]))
+        self.assertEqual(job.status, BackgroundJob.QUEUED)
+        self.assertEqual(job.params, {
+            'exam_id': self.examination.id, 'class_id': self.classroom.id, 'backend': 'reportlab', 'optimize': 'none',
+        })
+        self.assertEqual(len(callbacks), 1)
+
+        # The same request while the job is unfinished reuses it
+        self.request_pdfs()
+        self.assertEqual(BackgroundJob.objects.count(), 1)
+        self.request_pdfs(mode='combined')
+        self.assertEqual(BackgroundJob.objects.count(), 2)
+
+    def test_a_finished_job_reports_progress_and_serves_its_zip(self):
+        self.request_pdfs()
+        job = run_job(BackgroundJob.objects.get().id)
+
+        self.assertEqual(job.status, BackgroundJob.COMPLETED, job.error)
+        self.assertEqual((job.completed, job.total, job.progress_percent), (12, 12, 100))
+        self.assertEqual((job.result['pdfs'], job.result['backends']), (12, {'reportlab': 12}))
+        self.assertIsNone(run_job(job.id))
+
+        status = self.client.get(reverse('result:job_status', args=[job.id])).json()
+        self.assertEqual((status['status'], status['progress']), ('completed', 100))
+
+        response = self.client.get(reverse('result:download_bulk_pdf', args=[job.id]))
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="First Terminal_Seven_results.zip"')
+        with zipfile.ZipFile(BytesIO(b''.join(response.streaming_content))) as zip_file:
+            self.assertEqual(len(zip_file.namelist()), 12)
+
+    def test_a_failing_job_records_its_error_and_has_no_download(self):
+        job = enqueue_job(BackgroundJob.BULK_PDF, {
+            'exam_id': self.examination.id, 'class_id': self.classroom.id, 'mode': 'sideways',
+        }, user=self.admin, start=False)
+        job = run_job(job.id)
+
+        self.assertEqual(job.status, BackgroundJob.FAILED)
+        self.assertIn("Unknown bulk PDF mode 'sideways'", job.error)
+        self.assertIsNotNone(job.finished_at)
+        self.assertEqual(self.client.get(reverse('result:download_bulk_pdf', args=[job.id])).status_code, 404)
+
+    def test_jobs_are_private_to_the_user_who_queued_them(self):
+        self.request_pdfs()
+        job = BackgroundJob.objects.get()
+
+        self.client.force_login(self.teacher)
+        self.assertEqual(self.client.get(reverse('result:job_status', args=[job.id])).status_code, 403)
+
+    def test_jobs_left_running_by_a_dead_worker_are_failed(self):
+        job = enqueue_job(BackgroundJob.BULK_PDF, {}, start=False)
+        self.assertTrue(claim_job(job.id))
+        self.assertFalse(claim_job(job.id))
+
+        self.assertEqual(fail_interrupted_jobs(), 1)
+        job.refresh_from_db()
+        self.assertEqual(job.status, BackgroundJob.FAILED)
+
+
+class ClassZipOutputTests(BulkPDFJobTestCase):
+    """Class ZIPs hold each card's PDF as rendered, stored uncompressed, and appear only once complete"""
+
+    def setUp(self):
+        super().setUp()
+        self.cards = class_card_contexts(self.examination, self.classroom)
+        self.path = Path(self.enterContext(tempfile.TemporaryDirectory())) / 'class.zip'
+
+    def write(self, **kwargs):
+        render = mock.patch('ResultManagement.pdf_backends.ReportLabBackend.render',
+                            lambda backend, context: f"%PDF card {context['student'].roll_number}".encode())
+        with render:
+            return write_class_output(self.cards, self.path, 'cards', 'reportlab', optimize='none', **kwargs)
+
+    def test_each_card_is_stored_uncompressed_under_its_student(self):
+        summary = self.write()
+
+        self.assertEqual((summary['pdfs'], summary['backends']), (12, {'reportlab': 12}))
+        with zipfile.ZipFile(self.path) as zip_file:
+            entries = zip_file.infolist()
+            self.assertEqual([entry.filename for entry in entries], [card_filename(student) for student, _ in self.cards])
+            self.assertEqual({entry.compress_type for entry in entries}, {zipfile.ZIP_STORED})
+            student = self.cards[3][0]
+            self.assertEqual(zip_file.read(card_filename(student)), f"%PDF card {student.roll_number}".encode())
+
+    def test_progress_is_reported_in_steps(self):
+        progress = []
+        self.write(on_progress=progress.append)
+        self.assertEqual(progress, [5, 10, 12])
+
+    def test_an_interrupted_write_leaves_no_file(self):
+        def interrupt(done):
+            raise KeyboardInterrupt
+
+        with self.assertRaises(KeyboardInterrupt):
+            self.write(on_progress=interrupt)
+        self.assertEqual(list(self.path.parent.iterdir()), [])
+
+
+class ConcurrentBulkPDFJobTests(BulkPDFJobTestCase):
+    """The concurrent bulk mode renders in an event loop but saves progress outside it"""
+
+    def run_concurrent_job(self, render_async):
+        self.enterContext(mock.patch.object(PlaywrightBackend, 'render_async', render_async))
+        job = enqueue_job(BackgroundJob.BULK_PDF, {
+            'exam_id': self.examination.id, 'class_id': self.classroom.id,
+            'mode': 'concurrent', 'concurrency': 4, 'optimize': 'none',
+        }, start=False)
+        return run_job(job.id)
+
+    def test_job_completes_with_full_progress(self):
+        async def render_async(backend, context):
+            await asyncio.sleep(0)
+            return f"%PDF card {context['student'].roll_number}".encode()
+
+        job = self.run_concurrent_job(render_async)
+
+        self.assertEqual(job.status, BackgroundJob.COMPLETED, job.error)
+        self.assertEqual((job.completed, job.total), (12, 12))
+        self.assertEqual(job.result['pdfs'], 12)
+        self.assertEqual(job.result['concurrency'], 4)
+        with zipfile.ZipFile(bulk_pdf_path(job)) as zip_file:
+            self.assertEqual(len(zip_file.namelist()), 12)
+
+    def test_failed_cards_are_reported_and_the_rest_written(self):
+        async def render_async(backend, context):
+            if context['student'].roll_number == '3':
+                raise RendererError("Page crashed")
+            return b"%PDF card"
+
+        job = self.run_concurrent_job(render_async)
+
+        self.assertEqual(job.status, BackgroundJob.COMPLETED, job.error)
+        self.assertEqual(job.completed, 12)
+        self.assertEqual(job.result['pdfs'], 11)
+        self.assertEqual(len(job.result['errors']), 1)
+
+
+
+class InlineExecutor:
+    """Stands in for the process pool, running each class in this process as it is submitted"""
+
+    def __init__(self, max_workers=None, initializer=None, initargs=()):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def submit(self, fn, *args):
+        future = Future()
+        try:
+            future.set_result(fn(*args))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+
+class SchoolCardsTests(BulkPDFJobTestCase):
+    """School runs write a file per class, record each in the manifest and resume where they stopped"""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.other_classroom = Class.objects.create(name='Eight')
+        students = create_students(cls.other_classroom, 3)
+        with cls.captureOnCommitCallbacks(execute=True):
+            config = create_config(cls.examination, cls.other_classroom, cls.subject, practical=False)
+            grade_marks_sheet(config, {student: (60, None) for student in students})
+
+    def setUp(self):
+        super().setUp()
+        self.output_dir = self.enterContext(tempfile.TemporaryDirectory())
+        self.enterContext(mock.patch(
+            'ResultManagement.pdf_backends.ReportLabBackend.render',
+            lambda backend, context: f"%PDF card {context['student'].roll_number}".encode(),
+        ))
+
+    def generate(self, **kwargs):
+        return {
+            summary['class_id']: summary
+            for summary in generate_school_cards(
+                self.examination.id, mode='cards', backend='reportlab', optimize='none',
+                output_dir=self.output_dir, **{'workers': 1, **kwargs},
+            )
+        }
+
+    def manifest(self):
+        exam_dir = exam_output_dir(self.output_dir, self.examination)
+        return json.loads((exam_dir / MANIFEST_NAME).read_text())['classes']
+
+    def fail_class(self, classroom):
+        """Make write_class_output fail for the cards of ``classroom`` only"""
+        def write(cards, path, *args, **kwargs):
+            if path.name.endswith(f"-{classroom.id}.zip"):
+                raise RuntimeError("disk full")
+            return write_class_output(cards, path, *args, **kwargs)
+        return mock.patch('ResultManagement.school_cards.write_class_output', write)
+
+    def test_each_class_is_written_and_recorded(self):
+        summaries = self.generate()
+
+        self.assertEqual(list(summaries), [self.classroom.id, self.other_classroom.id])
+        self.assertEqual([summaries[c]['cards'] for c in summaries], [12, 3])
+        manifest = self.manifest()
+        entry = manifest[str(self.other_classroom.id)]
+        self.assertEqual((entry['class'], entry['mode'], entry['pdfs'], entry['skipped']), ('Eight', 'cards', 3, False))
+        exam_dir = exam_output_dir(self.output_dir, self.examination)
+        self.assertTrue((exam_dir / entry['file']).exists())
+
+    def test_a_rerun_skips_written_classes_unless_forced(self):
+        self.generate()
+
+        with mock.patch('ResultManagement.school_cards.write_class_output') as write:
+            summaries = self.generate()
+        write.assert_not_called()
+        self.assertTrue(all(summary['skipped'] for summary in summaries.values()))
+        # Skipped classes report what the manifest recorded for them
+        self.assertEqual(summaries[self.classroom.id]['pdfs'], 12)
+
+        summaries = self.generate(force=True)
+        self.assertFalse(any(summary['skipped'] for summary in summaries.values()))
+
+    def test_a_failed_class_is_recorded_and_the_rest_carry_on(self):
+        with self.fail_class(self.classroom):
+            summaries = self.generate()
+
+        self.assertEqual(summaries[self.classroom.id]['error'], "disk full")
+        self.assertEqual(summaries[self.other_classroom.id]['pdfs'], 3)
+        entry = self.manifest()[str(self.classroom.id)]
+        self.assertEqual((entry['failed'], entry['error'], entry['cards']), (True, "disk full", 12))
+
+        # The failed class has no file, so the next run renders it and only it
+        summaries = self.generate()
+        self.assertEqual(summaries[self.classroom.id]['pdfs'], 12)
+        self.assertTrue(summaries[self.other_classroom.id]['skipped'])
+        self.assertNotIn('failed', self.manifest()[str(self.classroom.id)])
+
+    def test_a_failed_class_in_the_pool_does_not_stop_the_others(self):
+        self.enterContext(mock.patch('concurrent.futures.ProcessPoolExecutor', InlineExecutor))
+        self.enterContext(mock.patch('django.db.connections.close_all'))
+
+        with self.fail_class(self.other_classroom):
+            summaries = self.generate(workers=2)
+
+        self.assertEqual(summaries[self.classroom.id]['pdfs'], 12)
+        self.assertTrue(summaries[self.other_classroom.id]['failed'])
+        self.assertTrue(self.manifest()[str(self.other_classroom.id)]['failed'])
+
+    def test_job_result_counts_failed_classes(self):
+        job = enqueue_job(BackgroundJob.SCHOOL_PDF, {'exam_id': self.examination.id, 'workers': 1, 'optimize': 'none',
+                                         'backend': 'reportlab'}, start=False)
+        with self.fail_class(self.other_classroom), \
+                override_settings(RESULT_SCHOOL_CARDS={'OUTPUT_DIR': self.output_dir}):
+            job = run_job(job.id)
+
+        self.assertEqual(job.status, BackgroundJob.COMPLETED, job.error)
+        self.assertEqual((job.result['classes'], job.result['failed_classes'], job.result['cards']), (2, 1, 12))
+        self.assertEqual(job.result['errors'], [f"Class {self.other_classroom.id}: disk full"])
+
+
+# ============ PDF CACHE ============
+
+class PDFCacheTests(BulkPDFJobTestCase):
+    """Rendered cards are reused until something they show changes"""
+
+    def setUp(self):
+        super().setUp()
+        self.cache_dir = self.enterContext(tempfile.TemporaryDirectory())
+        self.enterContext(override_settings(RESULT_PDF_CACHE={'DIR': self.cache_dir, 'MAX_SIZE': 10 * 1024}))
+        clear_pdf_cache()
+
+    def card(self):
+        return class_card_contexts(self.examination, self.classroom)[0][1]
+
+    def test_a_second_render_is_served_from_the_cache(self):
+        render = mock.Mock(return_value=b'%PDF card')
+
+        self.assertEqual(cached_render(self.card(), 'v1', render), (b'%PDF card', False))
+        self.assertEqual(cached_render(self.card(), 'v1', render), (b'%PDF card', True))
+        render.assert_called_once()
+        self.assertEqual(cached_render(self.card(), 'v2', render), (b'%PDF card', False))
+
+    def test_changes_to_what_the_card_shows_change_the_key(self):
+        key = card_cache_key(self.card(), 'v1')
+        self.assertEqual(card_cache_key(self.card(), 'v1'), key)
+
+        Subject.objects.filter(id=self.subject.id).update(name='English Language')
+        renamed = card_cache_key(self.card(), 'v1')
+        self.assertNotEqual(renamed, key)
+
+        student = self.card()['student']
+        with self.captureOnCommitCallbacks(execute=True):
+            grade_marks_sheet(self.config, {student: (Decimal('99'), None)})
+        self.assertNotIn(card_cache_key(self.card(), 'v1'), (key, renamed))
+
+    def test_least_recently_used_cards_are_evicted(self):
+        for name in ('a', 'b', 'c'):
+            store_pdf(name * 64, b'x' * 3000)
+            time.sleep(0.01)
+        # Reading a card counts as using it
+        get_cached_pdf('a' * 64)
+
+        # Past MAX_SIZE, trimmed to 90% of it by dropping the oldest
+        store_pdf('d' * 64, b'x' * 3000)
+
+        self.assertEqual(
+            [get_cached_pdf(name * 64) is not None for name in 'abcd'],
+            [True, False, True, True],
+        )
+        self.assertEqual(clear_pdf_cache(), 3)
+
+    def test_a_disabled_cache_always_renders(self):
+        render = mock.Mock(return_value=b'%PDF card')
+        with override_settings(RESULT_PDF_CACHE={'DIR': self.cache_dir, 'MAX_SIZE': 0}):
+            cached_render(self.card(), 'v1', render)
+            cached_render(self.card(), 'v1', render)
+        self.assertEqual(render.call_count, 2)
+        self.assertEqual(cache_entries(), [])
+
+
+# ============ PDF BACKENDS ============
+
+class PDFBackendFallbackTests(BulkPDFJobTestCase):
+    """A card is drawn by the first backend of the chain that can draw it"""
+
+    def setUp(self):
+        super().setUp()
+        self.enterContext(override_settings(RESULT_PDF_BACKENDS={
+            'DEFAULT': 'playwright', 'BULK': 'xhtml2pdf', 'FALLBACKS': ['xhtml2pdf', 'reportlab'], 'RETRY_AFTER': 60,
+        }))
+        for backend in PDF_BACKENDS.values():
+            self.addCleanup(setattr, backend, 'unavailable_until', 0.0)
+        self.cards = class_card_contexts(self.examination, self.classroom)
+
+    def test_the_chain_starts_with_the_chosen_backend(self):
+        self.assertEqual([backend.name for backend in backend_chain()], ['playwright', 'xhtml2pdf', 'reportlab'])
+        self.assertEqual([backend.name for backend in backend_chain(bulk=True)], ['xhtml2pdf', 'reportlab'])
+        self.assertEqual([backend.name for backend in backend_chain('reportlab')], ['reportlab', 'xhtml2pdf'])
+        with self.assertRaises(ValueError):
+            backend_chain('wkhtmltopdf')
+
+    def test_an_unavailable_backend_is_skipped_until_retry(self):
+        tried = []
+
+        def render(backend, context):
+            tried.append(backend.name)
+            if backend.name == 'playwright':
+                raise PDFBackendUnavailable("No browser")
+            return backend.name
+
+        self.assertEqual(render_with_fallback({}, render)[0], 'xhtml2pdf')
+        self.assertFalse(PDF_BACKENDS['playwright'].available())
+        # Not even tried while it is marked unavailable
+        self.assertEqual(render_with_fallback({}, render)[0], 'xhtml2pdf')
+        self.assertEqual(tried, ['playwright', 'xhtml2pdf', 'xhtml2pdf'])
+
+    def test_a_card_one_backend_cannot_draw_falls_back_without_disabling_it(self):
+        def render(backend, context):
+            if backend.name == 'xhtml2pdf':
+                raise RendererError("Unsupported markup")
+            return backend.name
+
+        self.assertEqual(render_with_fallback({}, render, bulk=True)[0], 'reportlab')
+        self.assertTrue(PDF_BACKENDS['xhtml2pdf'].available())
+
+    def test_the_error_says_whether_any_backend_failed_on_the_card(self):
+        def unavailable(backend, context):
+            raise PDFBackendUnavailable("Missing")
+
+        with self.assertRaises(PDFBackendUnavailable):
+            render_with_fallback({}, unavailable, bulk=True)
+
+        for backend in PDF_BACKENDS.values():
+            backend.unavailable_until = 0.0
+
+        def failing(backend, context):
+            if backend.name == 'xhtml2pdf':
+                raise PDFBackendUnavailable("Missing")
+            raise RendererError("Layout")
+
+        with self.assertRaisesMessage(RendererError, "xhtml2pdf: Missing; reportlab: Layout") as raised:
+            render_with_fallback({}, failing, bulk=True)
+        self.assertNotIsInstance(raised.exception, PDFBackendUnavailable)
+
+    def test_in_process_backends_draw_real_cards(self):
+        for name in ('xhtml2pdf', 'reportlab'):
+            with self.subTest(backend=name):
+                self.assertTrue(PDF_BACKENDS[name].render(self.cards[0][1]).startswith(b'%PDF'))
+
+    def test_layout_failures_become_renderer_errors(self):
+        with mock.patch('xhtml2pdf.pisa.CreatePDF', side_effect=ValueError("bad width")):
+            with self.assertRaisesMessage(RendererError, "bad width"):
+                PDF_BACKENDS['xhtml2pdf'].render(self.cards[0][1])
+        with mock.patch('ResultManagement.pdf_layout.draw_result_card', side_effect=LayoutError("too large")):
+            with self.assertRaisesMessage(RendererError, "too large"):
+                PDF_BACKENDS['reportlab'].render(self.cards[0][1])
+
+    def test_a_card_no_backend_can_draw_is_left_out_of_the_zip(self):
+        broken = self.cards[2][0]
+
+        def pisa(html, dest, encoding):
+            if broken.first_name in html:
+                raise ValueError("bad width")
+            dest.write(b'%PDF xhtml2pdf')
+            return SimpleNamespace(err=0)
+
+        def draw(context):
+            raise LayoutError("too large")
+
+        path = Path(self.enterContext(tempfile.TemporaryDirectory())) / 'cards.zip'
+        with mock.patch('xhtml2pdf.pisa.CreatePDF', pisa), mock.patch('ResultManagement.pdf_layout.draw_result_card', draw):
+            summary = write_card_zip(self.cards, path)
+
+        self.assertEqual((summary['pdfs'], summary['failed_students']), (11, [broken.id]))
+        self.assertIn(f"({broken.roll_number}): No PDF backend could render the card", summary['errors'][0])
+        with zipfile.ZipFile(path) as zip_file:
+            self.assertEqual(len(zip_file.namelist()), 11)
+
+
+# ============ BENCHMARK ============
+
+class BenchmarkReportTests(SimpleTestCase):
+    """Benchmark class sizes parse strictly, and reports compare runs and render as Markdown"""
+
+    def result(self, ms_per_card, **kwargs):
+        return {
+            'students': 50, 'subjects': 6, 'backend': 'reportlab', 'mode': 'cards',
+            'cards': 50, 'seconds': ms_per_card / 20, 'ms_per_card': ms_per_card,
+            'stages': {stage: 0.1 for stage in STAGES}, 'output_bytes': 1000,
+            'peak_rss_mb': 80.0, 'rss_growth_mb': 4.5, **kwargs,
+        }
+
+    def report(self, *results):
+        return {'created_at': '2026-01-01T00:00:00', 'python': '3.11', 'platform': 'Linux',
+                'cpus': 4, 'samples': 10, 'results': list(results)}
+
+    def test_parse_size(self):
+        self.assertEqual(parse_size('50x6'), (50, 6))
+        self.assertEqual(parse_size('40X8'), (40, 8))
+        self.assertEqual(parse_size('30'), (30, 1))
+        for value in ('x6', '50xsix', 'fifty', '0x6', '50x0'):
+            with self.subTest(value=value), self.assertRaises(ValueError):
+                parse_size(value)
+
+    def test_results_are_compared_with_the_same_case_of_the_baseline(self):
+        baseline = self.report(self.result(10.0), self.result(4.0, mode='combined'))
+        report = compare_reports(self.report(
+            self.result(15.0), self.result(2.0, mode='combined'), self.result(3.0, backend='xhtml2pdf'),
+        ), baseline)
+
+        self.assertEqual([result.get('vs_baseline') for result in report['results']], [1.5, 0.5, None])
+
+    def test_markdown_has_a_row_per_result(self):
+        report = compare_reports(
+            self.report(self.result(12.0), {**self.result(0), 'mode': 'split', 'error': 'PDFBackendUnavailable: gone'}),
+            self.report(self.result(10.0)),
+        )
+        lines = markdown_report(report).splitlines()
+
+        header, rule, *rows = lines[4:]
+        self.assertEqual(header.count('|'), rule.count('|'))
+        self.assertEqual(rows[0].split(' | ')[:6], ['| 50x6', 'reportlab', 'cards', '50', '0.60', '12.0'])
+        self.assertTrue(rows[0].endswith('| 1.20x |'))
+        self.assertIn('| split | PDFBackendUnavailable: gone |', rows[1])
+        self.assertEqual(rows[1].count('|'), header.count('|'))
+
+
+# ============ PDF OPTIMISATION ============
+
+def colour_document(page_content, form_content):
+    """A one page PDF drawing ``page_content``, whose form XObject /Fm0 draws ``form_content``"""
+    writer = PdfWriter()
+    page = writer.add_blank_page(100, 100)
+    form = DecodedStreamObject()
+    form.set_data(form_content)
+    form.update({
+        NameObject('/Type'): NameObject('/XObject'),
+        NameObject('/Subtype'): NameObject('/Form'),
+        NameObject('/BBox'): ArrayObject([NumberObject(0), NumberObject(0), NumberObject(10), NumberObject(10)]),
+    })
+    page[NameObject('/Resources')] = DictionaryObject({
+        NameObject('/ColorSpace'): DictionaryObject({NameObject('/CS0'): NameObject('/DeviceRGB')}),
+        NameObject('/XObject'): DictionaryObject({NameObject('/Fm0'): writer._add_object(form.flate_encode())}),
+    })
+    content = DecodedStreamObject()
+    content.set_data(page_content)
+    page.replace_contents(content)
+    output = BytesIO()
+    writer.write(output)
+    return output.getvalue()
+
+
+class PDFOptimizeTests(SimpleTestCase):
+    """The grayscale profile turns every RGB and CMYK colour gray, including those drawn by forms"""
+
+    COLOUR_OPERATORS = {b'g', b'G', b'rg', b'RG', b'k', b'K', b'sc', b'SC', b'scn', b'SCN'}
+
+    def colours(self, content, reader):
+        return [
+            (operator, [float(operand) for operand in operands])
+            for operands, operator in ContentStream(content, reader).operations
+            if operator in self.COLOUR_OPERATORS
+        ]
+
+    def operations(self, pdf):
+        """The colour operations of the page and of its form"""
+        reader = PdfReader(BytesIO(pdf))
+        page = reader.pages[0]
+        return (
+            self.colours(page.get_contents(), reader),
+            self.colours(page['/Resources']['/XObject']['/Fm0'], reader),
+        )
+
+    def test_grayscale_replaces_every_kind_of_colour(self):
+        pdf = colour_document(
+            b"q /CS0 CS 1 0 0 SCN 0 0 10 10 re S Q 0 0 1 0 k 0.2 0.5 0.3 RG /Fm0 Do",
+            b"0 1 0 rg 0 0 5 5 re f /CS0 cs 0 0 1 sc 0 0 2 2 re f",
+        )
+
+        page, form = self.operations(optimize_pdf(pdf, 'grayscale'))
+
+        self.assertEqual(page, [(b'G', [0.299]), (b'g', [0.886]), (b'G', [0.3875])])
+        self.assertEqual(form, [(b'g', [0.587]), (b'g', [0.114])])
+
+    def test_colour_spaces_follow_the_graphics_state(self):
+        # After Q the stroke colour space is the default gray again, so one operand is left alone
+        pdf = colour_document(b"q /CS0 CS 1 0 0 SCN Q 0.5 SCN /DeviceCMYK cs 0 0 0 1 sc", b"")
+
+        page, _ = self.operations(optimize_pdf(pdf, 'grayscale'))
+
+        self.assertEqual(page, [(b'G', [0.299]), (b'SCN', [0.5]), (b'g', [0.0])])
+
+    def test_pattern_colours_are_left_alone(self):
+        pdf = colour_document(b"/Pattern cs /P0 scn 0 0 10 10 re f", b"")
+        reader = PdfReader(BytesIO(optimize_pdf(pdf, 'grayscale')))
+        operations = ContentStream(reader.pages[0].get_contents(), reader).operations
+
+        self.assertIn((['/P0'], b'scn'), operations)
+
+    def test_other_profiles_keep_colours(self):
+        pdf = colour_document(b"1 0 0 rg 0 0 10 10 re f", b"")
+
+        self.assertIs(optimize_pdf(pdf, 'none'), pdf)
+        page, _ = self.operations(optimize_pdf(pdf, 'screen'))
+        self.assertEqual(page, [(b'rg', [1.0, 0.0, 0.0])])
+        with self.assertRaises(ValueError):
+            optimize_pdf(pdf, 'sepia')
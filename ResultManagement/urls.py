@@ -13,6 +13,9 @@ urlpatterns = [
     # Marks Entry URLs
     path('marks/', views.marks_entry_dashboard, name='marks_entry_dashboard'),
     path('marks/enter/<int:config_id>/', views.enter_marks, name='enter_marks'),
+    path('marks/autosave/<int:config_id>/', views.autosave_marks, name='autosave_marks'),
+    path('marks/import/<int:config_id>/', views.import_marks, name='import_marks'),
+    path('marks/import/<int:exam_id>/<int:class_id>/', views.import_exam_marks, name='import_exam_marks'),
     
     # Extracurricular Grades URLs
     path('extracurricular/', views.extracurricular_grades_dashboard, name='extracurricular_grades_dashboard'),
@@ -20,9 +23,16 @@ urlpatterns = [
     
     # Results View URLs
     path('view/', views.view_results, name='view_results'),
+    path('export/<int:exam_id>/', views.export_results, name='export_results'),
+
+    # Analytics URLs
+    path('analytics/', views.analytics_dashboard, name='analytics_dashboard'),
+    path('analytics/<int:exam_id>/json/', views.exam_analytics_json, name='exam_analytics_json'),
     
     # AJAX URLs
     path('ajax/check-marks/', views.check_marks_status, name='check_marks_status'),
+    path('ajax/validate-marks/', views.validate_marks_batch, name='validate_marks_batch'),
+    path('ajax/jobs/<int:job_id>/', views.job_status, name='job_status'),
 
     # Result PDF generation
     path('pdf/<int:student_id>/<int:exam_id>/', views.generate_result_pdf, name='generate_result_pdf'),
@@ -31,6 +41,8 @@ urlpatterns = [
 
     # Add to urls.py
     path('bulk-pdf-playwright/<int:exam_id>/<int:class_id>/', views.generate_class_results_pdf, name='generate_class_results_pdf_playwright'),
+    path('bulk-pdf/jobs/<int:job_id>/', views.bulk_pdf_job, name='bulk_pdf_job'),
+    path('bulk-pdf/jobs/<int:job_id>/download/', views.download_bulk_pdf, name='download_bulk_pdf'),
 
     # Optional: Progress tracking
     path('bulk-pdf-progress/<int:exam_id>/<int:class_id>/',  views.bulk_pdf_progress,  name='bulk_pdf_progress'),
@@ -1,16 +1,37 @@
 # ResultManagement/views.py
 from django.shortcuts import render, redirect, get_object_or_404
+from django.urls import reverse
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.contrib import messages
-from django.http import JsonResponse, HttpResponseForbidden
-from django.db.models import Q
+from django.core.exceptions import PermissionDenied
+from django.http import FileResponse, Http404, HttpResponse, JsonResponse, HttpResponseBadRequest, HttpResponseForbidden, StreamingHttpResponse
+from django.db import transaction
+from django.core.paginator import Paginator
+from django.db.models import Prefetch, Q, prefetch_related_objects
 from django.views.decorators.http import require_http_methods
-from django.views.decorators.csrf import csrf_exempt
+from django.utils.dateparse import parse_datetime
+from django.utils.text import slugify
 import json
+import logging
 from decimal import Decimal
 
 from management.models import Class, Subject, Student, Teacher, Examination, ClassSubject
-from .models import ExamConfiguration, StudentResult, StudentOverallResult
+from .models import ExamConfiguration, StudentResult, StudentOverallResult, ClassRank, BackgroundJob
+from .analytics import get_exam_analytics
+from .cards import BULK_PDF_MODES, bulk_pdf_path, card_context, render_card
+from .exports import export_results_csv
+from .grading import (
+    check_marks, diff_marks_sheet, get_thresholds, grade_marks_sheet, parse_marks,
+    threshold_payload, thresholds,
+)
+from .imports import MAX_REPORTED_ERRORS, ImportFileError, import_marks_file
+from .jobs import enqueue_job
+from .pdf_backends import PDF_BACKENDS
+from .pdf_optimize import PDF_OPTIMIZE_PROFILES
+from .rankings import attach_standings, student_class_rank
+from .renderer import RendererError, render_pdf
+
+logger = logging.getLogger(__name__)
 
 def is_admin_or_teacher(user):
     """Check if user is admin or a teacher"""
@@ -20,6 +41,12 @@ def is_admin(user):
     """Check if user is admin"""
     return user.is_superuser
 
+# Students shown per page of the results table
+RESULTS_PER_PAGE = 50
+
+# Cells accepted by one autosave request
+MAX_AUTOSAVE_CELLS = 100
+
 def get_teacher(user):
     """Get teacher instance from user"""
     try:
@@ -27,6 +54,21 @@ def get_teacher(user):
     except Teacher.DoesNotExist:
         return None
 
+def can_enter_marks(user, config):
+    """Check if user is admin or teaches the subject of an exam configuration"""
+    return teaches_subject(user, config.classroom_id, config.subject_id)
+
+def teaches_subject(user, classroom_id, subject_id):
+    """Check if user is admin or teaches a subject to a class"""
+    if user.is_superuser:
+        return True
+    teacher = get_teacher(user)
+    return teacher is not None and ClassSubject.objects.filter(
+        classroom_id=classroom_id,
+        subject_id=subject_id,
+        teacher=teacher
+    ).exists()
+
 # ============ EXAM CONFIGURATION VIEWS ============
 
 @login_required
@@ -95,6 +137,11 @@ def exam_configuration_create(request, exam_id, class_id):
     if request.method == 'POST':
         created_count = 0
         updated_count = 0
+        changed_config_ids = []
+        previous_thresholds = {
+            config.subject_id: thresholds(config)
+            for config in ExamConfiguration.objects.filter(examination=examination, classroom=classroom)
+        }
         
         for class_subject in class_subjects:
             subject = class_subject.subject
@@ -127,11 +174,19 @@ def exam_configuration_create(request, exam_id, class_id):
                 created_count += 1
             else:
                 updated_count += 1
+                if previous_thresholds.get(subject.id) != thresholds(config):
+                    changed_config_ids.append(config.id)
         
         if created_count > 0 or updated_count > 0:
             messages.success(request, f"Configuration saved! Created: {created_count}, Updated: {updated_count}")
         else:
             messages.warning(request, "No configurations were saved. Please check your inputs.")
+        
+        # Existing results were graded against the old thresholds; regrade
+        # them in the background instead of making this request wait
+        if StudentResult.objects.filter(exam_config_id__in=changed_config_ids).exists():
+            job = enqueue_job(BackgroundJob.REGRADE, {'config_ids': changed_config_ids}, user=request.user)
+            messages.info(request, f"Existing results are being regraded in the background (job #{job.id}).")
             
         return redirect('result:exam_configuration_list')
     
@@ -202,10 +257,11 @@ def enter_marks(request, config_id):
     students = Student.objects.filter(
         classroom=config.classroom,
         is_active=True
-    ).order_by('roll_number')
+    ).select_related('classroom').order_by('roll_number')
     
     if request.method == 'POST':
-        saved_count = 0
+        marks = {}
+        versions = {}
         
         for student in students:
             theory_marks = request.POST.get(f'theory_{student.id}')
@@ -234,30 +290,28 @@ def enter_marks(request, config_id):
             else:
                 practical_marks = None
             
-            # Save or update result
-            result, created = StudentResult.objects.update_or_create(
-                examination=config.examination,
-                student=student,
-                subject=config.subject,
-                defaults={
-                    'exam_config': config,
-                    'theory_marks': theory_marks,
-                    'practical_marks': practical_marks,
-                    'entered_by': teacher if teacher else None,
-                }
-            )
-            saved_count += 1
+            marks[student] = (theory_marks, practical_marks)
+            
+            # The updated_at the row was loaded with, to detect edits made since
+            version = request.POST.get(f'version_{student.id}')
+            if version is not None:
+                versions[student.id] = parse_datetime(version) if version else None
+        
+        # Only rows that differ from the stored marks are graded and written,
+        # in one bulk upsert; overall results for just those students are
+        # recomputed once when it commits
+        with transaction.atomic():
+            changed, unchanged_count, stale = diff_marks_sheet(config, marks, versions)
+            saved_count = len(grade_marks_sheet(config, changed, entered_by=teacher if teacher else None))
         
         if saved_count > 0:
-            messages.success(request, f"Marks saved for {saved_count} students.")
-            
-            # Update overall results for affected students
-            for student in students:
-                overall_result, created = StudentOverallResult.objects.get_or_create(
-                    examination=config.examination,
-                    student=student
-                )
-                overall_result.calculate_overall_result()
+            messages.success(request, f"Marks saved for {saved_count} students ({unchanged_count} unchanged).")
+        elif not stale:
+            messages.info(request, "No changes to save.")
+        if stale:
+            messages.warning(request, "Marks for {} were changed by someone else after this sheet was opened and were not saved. Please review them.".format(
+                ', '.join(str(student) for student in stale)
+            ))
         
         return redirect('result:enter_marks', config_id=config_id)
     
@@ -268,14 +322,87 @@ def enter_marks(request, config_id):
         subject=config.subject,
         student__in=students
     ):
-        existing_results[result.student.id] = result
+        existing_results[result.student_id] = result
     
     return render(request, 'ResultManagement/enter_marks.html', {
         'config': config,
+        'thresholds': threshold_payload(config),
         'students': students,
         'existing_results': existing_results,
     })
 
+@login_required
+@user_passes_test(is_admin_or_teacher)
+def import_marks(request, config_id):
+    """Import marks for one exam configuration from a CSV or XLSX file"""
+    config = get_object_or_404(
+        ExamConfiguration.objects.select_related('examination', 'classroom', 'subject'),
+        id=config_id
+    )
+    if not can_enter_marks(request.user, config):
+        messages.error(request, "You don't have permission to enter marks for this subject.")
+        return redirect('result:marks_entry_dashboard')
+    
+    return marks_import(request, [config], config.examination, config.classroom, config=config)
+
+@login_required
+@user_passes_test(is_admin_or_teacher)
+def import_exam_marks(request, exam_id, class_id):
+    """Import marks for every subject of a class in an examination from one file"""
+    examination = get_object_or_404(Examination, id=exam_id)
+    classroom = get_object_or_404(Class, id=class_id)
+    configs = ExamConfiguration.objects.filter(
+        examination=examination,
+        classroom=classroom
+    ).select_related('subject').order_by('subject__name')
+    
+    # Teachers only import the subjects they teach
+    if not request.user.is_superuser:
+        configs = configs.filter(subject__in=ClassSubject.objects.filter(
+            classroom=classroom,
+            teacher=get_teacher(request.user)
+        ).values('subject'))
+    
+    configs = list(configs)
+    if not configs:
+        messages.error(request, "There are no subjects you can import marks for in this class.")
+        return redirect('result:marks_entry_dashboard')
+    
+    return marks_import(request, configs, examination, classroom)
+
+def marks_import(request, configs, examination, classroom, config=None):
+    """Shared upload form and report of the marks import views"""
+    report = None
+    
+    if request.method == 'POST':
+        upload = request.FILES.get('file')
+        if not upload:
+            messages.error(request, "Choose a CSV or XLSX file to import.")
+        else:
+            try:
+                report = import_marks_file(
+                    upload, configs,
+                    entered_by=get_teacher(request.user),
+                    dry_run=request.POST.get('dry_run') == 'on',
+                    per_subject=config is None,
+                )
+            except ImportFileError as e:
+                messages.error(request, str(e))
+            else:
+                if report['dry_run']:
+                    messages.info(request, f"Checked {report['rows']} rows: {report['would_save']} results would be saved; nothing was saved.")
+                else:
+                    messages.success(request, f"Imported {report['valid']} rows: {report['saved']} results saved, {report['unchanged']} unchanged.")
+    
+    return render(request, 'ResultManagement/import_marks.html', {
+        'config': config,
+        'configs': configs,
+        'examination': examination,
+        'classroom': classroom,
+        'report': report,
+        'max_reported_errors': MAX_REPORTED_ERRORS,
+    })
+
 # ============ EXTRACURRICULAR GRADES VIEWS ============
 
 @login_required
@@ -369,31 +496,50 @@ def view_results(request):
     results = []
     examination = None
     classroom = None
+    page = None
     
     if exam_id and class_id:
         examination = get_object_or_404(Examination, id=exam_id)
         classroom = get_object_or_404(Class, id=class_id)
         
-        # Get all students and their results
-        students = Student.objects.filter(classroom=classroom, is_active=True).order_by('roll_number')
-        
-        for student in students:
-            # Get overall result
-            overall_result = StudentOverallResult.objects.filter(
+        # One page of students, their subject results prefetched and their
+        # overall results and ranks joined from one query each
+        students = Student.objects.filter(
+            classroom=classroom, is_active=True
+        ).select_related('classroom').order_by('roll_number', 'id')
+        page = Paginator(students, RESULTS_PER_PAGE).get_page(request.GET.get('page'))
+        page_students = list(page.object_list)
+        prefetch_related_objects(page_students, Prefetch(
+            'results',
+            queryset=StudentResult.objects.filter(
+                examination=examination
+            ).select_related('subject', 'exam_config').order_by('subject__name'),
+            to_attr='exam_results',
+        ))
+
+        student_ids = [student.id for student in page_students]
+        overall_results = {
+            overall_result.student_id: overall_result
+            for overall_result in StudentOverallResult.objects.filter(
                 examination=examination,
-                student=student
-            ).first()
-            
-            # Get subject results
-            subject_results = StudentResult.objects.filter(
+                student_id__in=student_ids
+            )
+        }
+        class_ranks = {
+            class_rank.student_id: class_rank
+            for class_rank in ClassRank.objects.filter(
                 examination=examination,
-                student=student
-            ).select_related('subject', 'exam_config')
-            
+                classroom=classroom,
+                student_id__in=student_ids
+            )
+        }
+
+        for student in page_students:
             results.append({
                 'student': student,
-                'overall_result': overall_result,
-                'subject_results': subject_results,
+                'overall_result': overall_results.get(student.id),
+                'subject_results': student.exam_results,
+                'class_rank': class_ranks.get(student.id),
             })
     
     return render(request, 'ResultManagement/view_results.html', {
@@ -402,60 +548,214 @@ def view_results(request):
         'examination': examination,
         'classroom': classroom,
         'results': results,
+        'page': page,
     })
 
+@login_required
+@user_passes_test(is_admin_or_teacher)
+def export_results(request, exam_id):
+    """Stream the subject and overall results of an examination as CSV"""
+    examination = get_object_or_404(Examination, id=exam_id)
+    try:
+        class_id = int(request.GET['class']) if request.GET.get('class') else None
+        subject_id = int(request.GET['subject']) if request.GET.get('subject') else None
+    except ValueError:
+        return HttpResponseBadRequest("The class and subject filters must be ids.")
+    classroom = get_object_or_404(Class, id=class_id) if class_id else None
+    subject = get_object_or_404(Subject, id=subject_id) if subject_id else None
+    
+    filename = '_'.join(
+        slugify(str(part)) for part in ('results', examination.name, classroom, subject) if part
+    )
+    response = StreamingHttpResponse(
+        export_results_csv(
+            examination.id,
+            classroom_id=classroom.id if classroom else None,
+            subject_id=subject.id if subject else None,
+        ),
+        content_type='text/csv',
+    )
+    response['Content-Disposition'] = f'attachment; filename="{filename}.csv"'
+    return response
+
+# ============ ANALYTICS VIEWS ============
+
+@login_required
+@user_passes_test(is_admin_or_teacher)
+def analytics_dashboard(request):
+    """Subject and class performance statistics for an examination"""
+    examinations = Examination.objects.all().order_by('-date')
+
+    exam_id = request.GET.get('exam')
+    examination = None
+    analytics = None
+
+    if exam_id:
+        examination = get_object_or_404(Examination, id=exam_id)
+        analytics = get_exam_analytics(examination.id)
+
+    return render(request, 'ResultManagement/analytics_dashboard.html', {
+        'examinations': examinations,
+        'examination': examination,
+        'analytics': analytics,
+    })
+
+@login_required
+@user_passes_test(is_admin_or_teacher)
+def exam_analytics_json(request, exam_id):
+    """JSON view of the cached statistics of an examination"""
+    examination = get_object_or_404(Examination, id=exam_id)
+    return JsonResponse(get_exam_analytics(examination.id))
+
 # ============ AJAX VIEWS ============
 
-@csrf_exempt
 @login_required
+@user_passes_test(is_admin_or_teacher)
+def job_status(request, job_id):
+    """AJAX view to poll the progress of a background job"""
+    job = get_object_or_404(BackgroundJob, id=job_id)
+    if not request.user.is_superuser and job.created_by_id != request.user.id:
+        return JsonResponse({'error': 'Access denied'}, status=403)
+    return JsonResponse(job.as_dict())
+
+@login_required
+@user_passes_test(is_admin_or_teacher)
+@require_http_methods(["POST"])
+def autosave_marks(request, config_id):
+    """
+    AJAX view to save a few changed cells of the marks sheet.
+
+    Expects ``{"cells": [{"student": id, "theory": .., "practical": ..,
+    "version": updated_at}]}`` where ``version`` is the ``updated_at`` the
+    row was loaded with (empty for a new row). Cells whose row changed since
+    are rejected as stale and returned with the stored values instead.
+    """
+    config = get_object_or_404(ExamConfiguration.objects.select_related('classroom'), id=config_id)
+    if not can_enter_marks(request.user, config):
+        return JsonResponse({'error': 'Access denied'}, status=403)
+    
+    try:
+        cells = json.loads(request.body).get('cells')
+    except (ValueError, AttributeError):
+        cells = None
+    if not isinstance(cells, list) or not cells:
+        return JsonResponse({'error': 'No cells to save'}, status=400)
+    if len(cells) > MAX_AUTOSAVE_CELLS:
+        return JsonResponse({'error': f'At most {MAX_AUTOSAVE_CELLS} cells can be saved at once'}, status=400)
+    
+    student_ids = set(Student.objects.filter(
+        classroom=config.classroom,
+        is_active=True,
+        id__in=[cell.get('student') for cell in cells if isinstance(cell, dict) and isinstance(cell.get('student'), int)]
+    ).values_list('id', flat=True))
+    
+    marks = {}
+    versions = {}
+    statuses = {}
+    for cell in cells:
+        student_id = cell.get('student') if isinstance(cell, dict) else None
+        if student_id not in student_ids:
+            return JsonResponse({'error': f'Student {student_id} is not in {config.classroom}'}, status=400)
+        try:
+            theory_marks = parse_marks(cell.get('theory'), config.full_theory_marks, 'Theory')
+            practical_marks = parse_marks(cell.get('practical'), config.full_practical_marks, 'Practical') if config.has_practical else None
+            versions[student_id] = parse_datetime(str(cell.get('version') or ''))
+        except ValueError as e:
+            statuses[student_id] = {'status': 'invalid', 'error': str(e)}
+            continue
+        marks[student_id] = (theory_marks, practical_marks)
+    
+    with transaction.atomic():
+        changed, _, stale = diff_marks_sheet(config, marks, versions)
+        grade_marks_sheet(config, changed, entered_by=get_teacher(request.user))
+    
+    for student_id in marks:
+        if student_id in changed:
+            statuses[student_id] = {'status': 'saved'}
+        elif student_id in stale:
+            statuses[student_id] = {'status': 'stale', 'error': 'Changed by someone else since it was loaded'}
+        else:
+            statuses[student_id] = {'status': 'unchanged'}
+    
+    stored = {
+        result.student_id: result
+        for result in StudentResult.objects.filter(
+            examination_id=config.examination_id,
+            subject_id=config.subject_id,
+            student_id__in=statuses
+        )
+    }
+    results = []
+    for student_id, status in statuses.items():
+        result = stored.get(student_id)
+        results.append({
+            'student_id': student_id,
+            **(result.as_dict() if result else {'version': None}),
+            **status,
+        })
+    
+    return JsonResponse({'saved': len(changed), 'results': results})
+
+@login_required
+@user_passes_test(is_admin_or_teacher)
 def check_marks_status(request):
     """AJAX view to check if marks are pass/fail in real-time"""
     if request.method == 'POST':
-        data = json.loads(request.body)
-        config_id = data.get('config_id')
-        theory_marks = data.get('theory_marks')
-        practical_marks = data.get('practical_marks')
-        
         try:
-            config = ExamConfiguration.objects.get(id=config_id)
-        except ExamConfiguration.DoesNotExist:
+            data = json.loads(request.body)
+            payload = get_thresholds(int(data.get('config_id')))
+        except (ValueError, TypeError, AttributeError):
+            return JsonResponse({'error': 'Invalid request'}, status=400)
+        if payload is None:
             return JsonResponse({'error': 'Invalid configuration'})
+        if not teaches_subject(request.user, payload['classroom_id'], payload['subject_id']):
+            return JsonResponse({'error': 'Access denied'}, status=403)
         
-        response = {
-            'theory_status': 'pass',
-            'practical_status': 'pass',
-            'overall_status': 'pass'
-        }
-        
-        # Check theory marks
-        if theory_marks is not None and theory_marks != '':
-            try:
-                theory_marks = float(theory_marks)
-                if theory_marks < float(config.pass_theory_marks):
-                    response['theory_status'] = 'fail'
-            except (ValueError, TypeError):
-                response['theory_status'] = 'invalid'
-        
-        # Check practical marks
-        if config.has_practical:
-            if practical_marks is not None and practical_marks != '':
-                try:
-                    practical_marks = float(practical_marks)
-                    if practical_marks < float(config.pass_practical_marks):
-                        response['practical_status'] = 'fail'
-                except (ValueError, TypeError):
-                    response['practical_status'] = 'invalid'
-        
-        # Overall status
-        if response['theory_status'] == 'fail' or response['practical_status'] == 'fail':
-            response['overall_status'] = 'fail'
-        elif response['theory_status'] == 'invalid' or response['practical_status'] == 'invalid':
-            response['overall_status'] = 'invalid'
-        
-        return JsonResponse(response)
+        return JsonResponse(check_marks(payload, data.get('theory_marks'), data.get('practical_marks')))
     
     return JsonResponse({'error': 'Invalid request method'})
 
+@login_required
+@user_passes_test(is_admin_or_teacher)
+@require_http_methods(["POST"])
+def validate_marks_batch(request):
+    """
+    AJAX view to check a whole marks grid in one request.
+
+    Expects ``{"config_id": id, "version": .., "rows": [{"student": id,
+    "theory": .., "practical": ..}]}`` and returns the status of each row.
+    The current thresholds are included when ``version`` is out of date so
+    the page can keep checking marks locally.
+    """
+    try:
+        data = json.loads(request.body)
+        rows = data.get('rows') or []
+        config_id = int(data.get('config_id'))
+    except (ValueError, TypeError, AttributeError):
+        return JsonResponse({'error': 'Invalid request'}, status=400)
+    if not isinstance(rows, list) or not all(isinstance(row, dict) for row in rows):
+        return JsonResponse({'error': 'Invalid request'}, status=400)
+    
+    payload = get_thresholds(config_id)
+    if payload is None:
+        return JsonResponse({'error': 'Invalid configuration'}, status=404)
+    if not teaches_subject(request.user, payload['classroom_id'], payload['subject_id']):
+        return JsonResponse({'error': 'Access denied'}, status=403)
+    
+    response = {
+        'version': payload['version'],
+        'rows': [
+            {
+                'student': row.get('student'),
+                **check_marks(payload, row.get('theory'), row.get('practical')),
+            }
+            for row in rows
+        ],
+    }
+    if data.get('version') != payload['version']:
+        response['thresholds'] = payload
+    return JsonResponse(response)
+
 
 
 
@@ -487,10 +787,13 @@ def view_result_html(request, student_id, exam_id):
     if not overall_result:
         return HttpResponse("No results found for this student in this exam.", status=404)
     
-    subject_results = StudentResult.objects.filter(
+    subject_results = list(StudentResult.objects.filter(
         student=student,
         examination=exam
-    ).select_related('subject', 'exam_config').order_by('subject__name')
+    ).select_related('subject', 'exam_config').order_by('subject__name'))
+    
+    class_rank = student_class_rank(exam, student, subject_results)
+    subject_results = attach_standings(subject_results, class_rank)
     
     school_info = {
         'name': 'Siddhartha Academy',
@@ -503,6 +806,7 @@ def view_result_html(request, student_id, exam_id):
         'exam': exam,
         'overall_result': overall_result,
         'subject_results': subject_results,
+        'class_rank': class_rank,
         'school_info': school_info,
         'attendance_days': 59,
         'total_days': 67,
@@ -513,11 +817,6 @@ def view_result_html(request, student_id, exam_id):
 
 
 
-# Add to views.py
-from playwright.sync_api import sync_playwright
-import tempfile
-import os
-
 @login_required
 def generate_result_pdf(request, student_id, exam_id):
     """Generate PDF using Playwright - exact HTML rendering"""
@@ -533,601 +832,116 @@ def generate_result_pdf(request, student_id, exam_id):
         messages.error(request, "No results found for this student.")
         return redirect('result:view_results')
     
-    subject_results = StudentResult.objects.filter(
+    subject_results = list(StudentResult.objects.filter(
         student=student, examination=exam
-    ).select_related('subject', 'exam_config').order_by('subject__name')
+    ).select_related('subject', 'exam_config').order_by('subject__name'))
     
-    context = {
-        'student': student,
-        'exam': exam,
-        'overall_result': overall_result,
-        'subject_results': subject_results,
-        'school_info': {
-            'name': 'Siddhartha Academy',
-            'address': 'Sallaghari,Srijana Nagar-Bhaktapur',
-            'phone': '01- 6615178'
-        },
-        'attendance_days': 59,
-        'total_days': 67,
-        'current_date': exam.date,
-    }
+    class_rank = student_class_rank(exam, student, subject_results)
+    context = card_context(student, exam, overall_result, subject_results, class_rank)
     
-    # Use your existing HTML template
-    template = get_template('ResultManagement/result_card_pdf.html')
-    html_content = template.render(context)
+    backend = request.GET.get('backend') or None
+    if backend is not None and backend not in PDF_BACKENDS:
+        messages.error(request, f"Unknown PDF backend '{backend}'.")
+        return redirect('result:view_results')
     
     try:
-        with sync_playwright() as p:
-            browser = p.chromium.launch()
-            page = browser.new_page()
-            
-            # Set page content
-            page.set_content(html_content)
-            
-            # Generate PDF with exact HTML rendering
-            pdf_bytes = page.pdf(
-                format='A4',
-                print_background=True,  # Include background colors/images
-                margin={
-                    'top': '10mm',
-                    'bottom': '10mm',
-                    'left': '8mm',
-                    'right': '8mm'
-                }
-            )
-            
-            browser.close()
-            
-            filename = f"result_{student.first_name}_{student.last_name}_{student.roll_number}.pdf"
-            response = HttpResponse(pdf_bytes, content_type='application/pdf')
-            response['Content-Disposition'] = f'attachment; filename="{filename}"'
-            return response
-            
-    except Exception as e:
+        # Served from the PDF cache unless something on the card changed
+        pdf_bytes, _, _ = render_card(context, backend)
+    except RendererError as e:
         messages.error(request, f"PDF generation failed: {str(e)}")
         return redirect('result:view_results')
-    
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
 
+    filename = f"result_{student.first_name}_{student.last_name}_{student.roll_number}.pdf"
+    response = HttpResponse(pdf_bytes, content_type='application/pdf')
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
 
-
-
-
-
-
-
-
-# Updated views.py - Playwright Bulk PDF Generation
-
-from playwright.sync_api import sync_playwright
-import zipfile
-from io import BytesIO
-from django.http import HttpResponse
-from django.contrib import messages
-from django.shortcuts import get_object_or_404, redirect
-from django.template.loader import get_template
-from django.contrib.auth.decorators import login_required, user_passes_test
 
 @login_required
 @user_passes_test(is_admin)
+@require_http_methods(["POST"])
 def generate_class_results_pdf(request, exam_id, class_id):
-    """Generate PDF for all students in a class using Playwright - FIXED ASYNC ISSUE"""
+    """Queue a background job that renders every result card of a class into a ZIP"""
     
     examination = get_object_or_404(Examination, id=exam_id)
     classroom = get_object_or_404(Class, id=class_id)
     
-    # Get all students with results - DEBUG: Print count
-    students = Student.objects.filter(
-        classroom=classroom,
-        is_active=True,
-        overall_results__examination=examination
-    ).order_by('roll_number')
-    
-    print(f"DEBUG: Found {students.count()} students")
-    
-    if not students:
+    if not StudentOverallResult.objects.filter(
+        examination=examination, student__classroom=classroom, student__is_active=True
+    ).exists():
         messages.error(request, "No students with results found for this class and exam.")
         return redirect('result:view_results')
     
-    # CRITICAL FIX: Gather ALL data BEFORE starting Playwright
-    # This prevents async context issues
-    students_data = []
-    
-    for student in students:
-        overall_result = StudentOverallResult.objects.filter(
-            student=student, examination=examination
-        ).first()
-        
-        if overall_result:
-            subject_results = StudentResult.objects.filter(
-                student=student, examination=examination
-            ).select_related('subject', 'exam_config').order_by('subject__name')
-            
-            # Convert QuerySet to list to avoid async issues
-            subject_results_list = list(subject_results)
-            
-            student_data = {
-                'student': student,
-                'overall_result': overall_result,
-                'subject_results': subject_results_list,
-                'context': {
-                    'student': student,
-                    'exam': examination,
-                    'overall_result': overall_result,
-                    'subject_results': subject_results_list,
-                    'school_info': {
-                        'name': 'Siddhartha Academy',
-                        'address': 'Sallaghari,Srijana Nagar-Bhaktapur',
-                        'phone': '01- 6615178'
-                    },
-                    'attendance_days': 59,
-                    'total_days': 67,
-                    'current_date': examination.date,
-                }
-            }
-            students_data.append(student_data)
-    
-    print(f"DEBUG: Prepared data for {len(students_data)} students")
-    
-    if not students_data:
-        messages.error(request, "No students have complete result data.")
-        return redirect('result:view_results')
-    
-    zip_filename = f"{examination.name}_{classroom.name}_results.zip"
-    pdf_count = 0
-    error_count = 0
-    
-    try:
-        # Create zip file in memory
-        zip_buffer = BytesIO()
-        
-        with sync_playwright() as p:
-            # Launch browser once for all PDFs (more efficient)
-            browser = p.chromium.launch(headless=True)
-            print("DEBUG: Browser launched")
-            
-            with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
-                
-                for student_data in students_data:
-                    try:
-                        student = student_data['student']
-                        context = student_data['context']
-                        
-                        print(f"DEBUG: Processing student {student.first_name} {student.last_name}")
-                        
-                        # Render HTML using pre-gathered data
-                        template = get_template('ResultManagement/result_card_pdf.html')
-                        html_content = template.render(context)
-                        
-                        print(f"DEBUG: HTML content length: {len(html_content)}")
-                        
-                        # Create new page for this student
-                        page = browser.new_page()
-                        
-                        # Set page content with timeout
-                        page.set_content(html_content, wait_until='domcontentloaded', timeout=30000)
-                        
-                        # Wait a bit more for any dynamic content
-                        page.wait_for_timeout(1000)
-                        
-                        # Generate PDF with exact HTML rendering
-                        pdf_bytes = page.pdf(
-                            format='A4',
-                            print_background=True,  # Include background colors/images
-                            margin={
-                                'top': '10mm',
-                                'bottom': '10mm',
-                                'left': '8mm',
-                                'right': '8mm'
-                            }
-                        )
-                        
-                        print(f"DEBUG: Generated PDF size: {len(pdf_bytes)} bytes")
-                        
-                        # Close the page
-                        page.close()
-                        
-                        # Validate PDF bytes
-                        if len(pdf_bytes) > 0:
-                            # Add PDF to ZIP with student name
-                            pdf_filename = f"{student.first_name}_{student.last_name}_{student.roll_number}.pdf"
-                            zip_file.writestr(pdf_filename, pdf_bytes)
-                            pdf_count += 1
-                            print(f"DEBUG: Added {pdf_filename} to ZIP")
-                        else:
-                            print(f"ERROR: Empty PDF generated for {student}")
-                            error_count += 1
-                            
-                    except Exception as e:
-                        # Log error but continue with other students
-                        print(f"ERROR generating PDF for {student_data['student']}: {str(e)}")
-                        import traceback
-                        traceback.print_exc()
-                        error_count += 1
-                        continue
-            
-            # Close browser
-            browser.close()
-            print(f"DEBUG: Browser closed. Generated {pdf_count} PDFs, {error_count} errors")
-        
-        # Check if ZIP has content
-        zip_buffer.seek(0)
-        zip_size = len(zip_buffer.getvalue())
-        print(f"DEBUG: ZIP file size: {zip_size} bytes")
-        
-        if zip_size <= 22:  # Empty ZIP file is ~22 bytes
-            messages.error(request, f"No PDFs were generated successfully. Check server logs for details. Processed {len(students_data)} students, {error_count} errors.")
-            return redirect('result:view_results')
-        
-        zip_buffer.seek(0)
-        response = HttpResponse(zip_buffer.getvalue(), content_type='application/zip')
-        response['Content-Disposition'] = f'attachment; filename="{zip_filename}"'
-        
-        messages.success(request, f"Generated {pdf_count} PDFs successfully!")
-        return response
-        
-    except Exception as e:
-        print(f"CRITICAL ERROR: {str(e)}")
-        import traceback
-        traceback.print_exc()
-        messages.error(request, f"Bulk PDF generation failed: {str(e)}")
-        return redirect('result:view_results')
-
+    params = {'exam_id': examination.id, 'class_id': classroom.id}
+    backend = request.POST.get('backend')
+    if backend in PDF_BACKENDS:
+        params['backend'] = backend
+    mode = request.POST.get('mode')
+    if mode in BULK_PDF_MODES:
+        params['mode'] = mode
+    optimize = request.POST.get('optimize')
+    if optimize in PDF_OPTIMIZE_PROFILES:
+        params['optimize'] = optimize
+    
+    # Reuse an unfinished job for the same output instead of rendering it twice
+    job = next((
+        job for job in BackgroundJob.objects.filter(
+            kind=BackgroundJob.BULK_PDF,
+            status__in=[BackgroundJob.QUEUED, BackgroundJob.RUNNING],
+            params__exam_id=examination.id,
+            params__class_id=classroom.id,
+        ) if job.params == params
+    ), None)
+    if job is None:
+        job = enqueue_job(BackgroundJob.BULK_PDF, params, user=request.user)
+    return redirect('result:bulk_pdf_job', job_id=job.id)
+
+
+def get_bulk_pdf_job(request, job_id):
+    job = get_object_or_404(BackgroundJob, id=job_id, kind=BackgroundJob.BULK_PDF)
+    if not request.user.is_superuser and job.created_by_id != request.user.id:
+        raise PermissionDenied
+    return job
 
-# ALTERNATIVE SIMPLE VERSION - Add this as backup
-
-@login_required
-@user_passes_test(is_admin)
-def generate_class_results_pdf_simple(request, exam_id, class_id):
-    """Simplified version for debugging"""
-    
-    examination = get_object_or_404(Examination, id=exam_id)
-    classroom = get_object_or_404(Class, id=class_id)
-    
-    # Simplified query - get ALL active students first
-    students = Student.objects.filter(
-        classroom=classroom,
-        is_active=True
-    ).order_by('roll_number')
-    
-    print(f"DEBUG: Found {students.count()} active students in {classroom.name}")
-    
-    if not students:
-        messages.error(request, "No active students found in this class.")
-        return redirect('result:view_results')
-    
-    # Filter students who actually have results
-    students_with_results = []
-    for student in students:
-        overall_result = StudentOverallResult.objects.filter(
-            student=student, examination=examination
-        ).first()
-        if overall_result:
-            students_with_results.append(student)
-    
-    print(f"DEBUG: Found {len(students_with_results)} students with results")
-    
-    if not students_with_results:
-        messages.error(request, f"No students have results for {examination.name} in {classroom.name}")
-        return redirect('result:view_results')
-    
-    # Try to generate just ONE PDF first
-    try:
-        student = students_with_results[0]  # Test with first student
-        
-        with sync_playwright() as p:
-            browser = p.chromium.launch(headless=True)
-            page = browser.new_page()
-            
-            # Get student data
-            overall_result = StudentOverallResult.objects.filter(
-                student=student, examination=examination
-            ).first()
-            
-            subject_results = StudentResult.objects.filter(
-                student=student, examination=examination
-            ).select_related('subject', 'exam_config').order_by('subject__name')
-            
-            context = {
-                'student': student,
-                'exam': examination,
-                'overall_result': overall_result,
-                'subject_results': subject_results,
-                'school_info': {
-                    'name': 'Siddhartha Academy',
-                    'address': 'Sallaghari,Srijana Nagar-Bhaktapur',
-                    'phone': '01- 6615178'
-                },
-                'attendance_days': 59,
-                'total_days': 67,
-                'current_date': examination.date,
-            }
-            
-            # Test HTML rendering
-            template = get_template('ResultManagement/result_card_pdf.html')
-            html_content = template.render(context)
-            
-            print(f"DEBUG: HTML content length: {len(html_content)}")
-            
-            # Set content and generate PDF
-            page.set_content(html_content, wait_until='domcontentloaded')
-            pdf_bytes = page.pdf(format='A4', print_background=True)
-            
-            browser.close()
-            
-            # Return single PDF for testing
-            if len(pdf_bytes) > 0:
-                filename = f"test_{student.first_name}_{student.last_name}.pdf"
-                response = HttpResponse(pdf_bytes, content_type='application/pdf')
-                response['Content-Disposition'] = f'attachment; filename="{filename}"'
-                messages.success(request, f"Test PDF generated successfully! Size: {len(pdf_bytes)} bytes")
-                return response
-            else:
-                messages.error(request, "Generated PDF is empty")
-                return redirect('result:view_results')
-                
-    except Exception as e:
-        print(f"CRITICAL ERROR in simple version: {str(e)}")
-        import traceback
-        traceback.print_exc()
-        messages.error(request, f"Test PDF generation failed: {str(e)}")
-        return redirect('result:view_results')
-import asyncio
-from playwright.async_api import async_playwright
 
 @login_required
 @user_passes_test(is_admin)
-def generate_class_results_pdf_async(request, exam_id, class_id):
-    """Async version for better performance with large classes"""
-    
-    examination = get_object_or_404(Examination, id=exam_id)
-    classroom = get_object_or_404(Class, id=class_id)
-    
-    students = Student.objects.filter(
-        classroom=classroom,
-        is_active=True,
-        overall_results__examination=examination
-    ).order_by('roll_number')
-    
-    if not students:
-        messages.error(request, "No students with results found for this class and exam.")
-        return redirect('result:view_results')
-    
-    async def generate_bulk_pdfs():
-        zip_buffer = BytesIO()
-        
-        async with async_playwright() as p:
-            browser = await p.chromium.launch(headless=True)
-            
-            with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
-                
-                # Process multiple students concurrently
-                tasks = []
-                
-                for student in students:
-                    task = generate_student_pdf(browser, student, examination, zip_file)
-                    tasks.append(task)
-                
-                # Process up to 5 PDFs concurrently (adjust based on server capacity)
-                semaphore = asyncio.Semaphore(5)
-                
-                async def bounded_task(task):
-                    async with semaphore:
-                        return await task
-                
-                await asyncio.gather(*[bounded_task(task) for task in tasks])
-            
-            await browser.close()
-        
-        return zip_buffer
-    
-    async def generate_student_pdf(browser, student, examination, zip_file):
-        try:
-            overall_result = StudentOverallResult.objects.filter(
-                student=student, examination=examination
-            ).first()
-            
-            if overall_result:
-                subject_results = StudentResult.objects.filter(
-                    student=student, examination=examination
-                ).select_related('subject', 'exam_config').order_by('subject__name')
-                
-                context = {
-                    'student': student,
-                    'exam': examination,
-                    'overall_result': overall_result,
-                    'subject_results': subject_results,
-                    'school_info': {
-                        'name': 'Siddhartha Academy',
-                        'address': 'Sallaghari,Srijana Nagar-Bhaktapur',
-                        'phone': '01- 6615178'
-                    },
-                    'attendance_days': 59,
-                    'total_days': 67,
-                    'current_date': examination.date,
-                }
-                
-                template = get_template('ResultManagement/result_card_pdf.html')
-                html_content = template.render(context)
-                
-                page = await browser.new_page()
-                await page.set_content(html_content, wait_until='networkidle')
-                
-                pdf_bytes = await page.pdf(
-                    format='A4',
-                    print_background=True,
-                    margin={
-                        'top': '10mm',
-                        'bottom': '10mm', 
-                        'left': '8mm',
-                        'right': '8mm'
-                    }
-                )
-                
-                await page.close()
-                
-                pdf_filename = f"{student.first_name}_{student.last_name}_{student.roll_number}.pdf"
-                zip_file.writestr(pdf_filename, pdf_bytes)
-                
-        except Exception as e:
-            print(f"Error generating PDF for {student}: {str(e)}")
-    
-    try:
-        # Run async function
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        zip_buffer = loop.run_until_complete(generate_bulk_pdfs())
-        loop.close()
-        
-        zip_buffer.seek(0)
-        zip_filename = f"{examination.name}_{classroom.name}_results.zip"
-        
-        response = HttpResponse(zip_buffer.getvalue(), content_type='application/zip')
-        response['Content-Disposition'] = f'attachment; filename="{zip_filename}"'
-        
-        return response
-        
-    except Exception as e:
-        messages.error(request, f"Bulk PDF generation failed: {str(e)}")
-        return redirect('result:view_results')
-
+def bulk_pdf_job(request, job_id):
+    """Progress page of a bulk PDF job, with the download link once it finishes"""
+    job = get_bulk_pdf_job(request, job_id)
+    return render(request, 'ResultManagement/bulk_pdf_job.html', {
+        'job': job,
+        'examination': Examination.objects.filter(id=job.params.get('exam_id')).first(),
+        'classroom': Class.objects.filter(id=job.params.get('class_id')).first(),
+    })
 
-# Progress tracking version (optional - for large classes)
-from django.http import JsonResponse
-from django.core.cache import cache
 
 @login_required
 @user_passes_test(is_admin)
-def generate_class_results_pdf_with_progress(request, exam_id, class_id):
-    """Generate PDFs with progress tracking for large classes"""
-    
-    examination = get_object_or_404(Examination, id=exam_id)
-    classroom = get_object_or_404(Class, id=class_id)
-    
-    students = Student.objects.filter(
-        classroom=classroom,
-        is_active=True,
-        overall_results__examination=examination
-    ).order_by('roll_number')
-    
-    if not students:
-        messages.error(request, "No students with results found for this class and exam.")
-        return redirect('result:view_results')
-    
-    total_students = students.count()
-    progress_key = f"bulk_pdf_progress_{exam_id}_{class_id}_{request.user.id}"
-    
-    # Initialize progress
-    cache.set(progress_key, {'completed': 0, 'total': total_students, 'status': 'processing'}, 300)
-    
-    try:
-        zip_buffer = BytesIO()
-        
-        with sync_playwright() as p:
-            browser = p.chromium.launch(headless=True)
-            
-            with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
-                
-                for index, student in enumerate(students, 1):
-                    try:
-                        # Generate PDF (same code as above)
-                        overall_result = StudentOverallResult.objects.filter(
-                            student=student, examination=examination
-                        ).first()
-                        
-                        if overall_result:
-                            # ... (PDF generation code same as above)
-                            subject_results = StudentResult.objects.filter(
-                                student=student, examination=examination
-                            ).select_related('subject', 'exam_config').order_by('subject__name')
-                            
-                            context = {
-                                'student': student,
-                                'exam': examination,
-                                'overall_result': overall_result,
-                                'subject_results': subject_results,
-                                'school_info': {
-                                    'name': 'Siddhartha Academy',
-                                    'address': 'Sallaghari,Srijana Nagar-Bhaktapur',
-                                    'phone': '01- 6615178'
-                                },
-                                'attendance_days': 59,
-                                'total_days': 67,
-                                'current_date': examination.date,
-                            }
-                            
-                            template = get_template('ResultManagement/result_card_pdf.html')
-                            html_content = template.render(context)
-                            
-                            page = browser.new_page()
-                            page.set_content(html_content, wait_until='networkidle')
-                            
-                            pdf_bytes = page.pdf(
-                                format='A4',
-                                print_background=True,
-                                margin={
-                                    'top': '10mm',
-                                    'bottom': '10mm',
-                                    'left': '8mm', 
-                                    'right': '8mm'
-                                }
-                            )
-                            
-                            page.close()
-                            
-                            pdf_filename = f"{student.first_name}_{student.last_name}_{student.roll_number}.pdf"
-                            zip_file.writestr(pdf_filename, pdf_bytes)
-                        
-                        # Update progress
-                        cache.set(progress_key, {
-                            'completed': index, 
-                            'total': total_students, 
-                            'status': 'processing',
-                            'current_student': f"{student.first_name} {student.last_name}"
-                        }, 300)
-                        
-                    except Exception as e:
-                        print(f"Error generating PDF for {student}: {str(e)}")
-                        continue
-            
-            browser.close()
-        
-        # Mark as completed
-        cache.set(progress_key, {'completed': total_students, 'total': total_students, 'status': 'completed'}, 300)
-        
-        zip_buffer.seek(0)
-        zip_filename = f"{examination.name}_{classroom.name}_results.zip"
-        
-        response = HttpResponse(zip_buffer.getvalue(), content_type='application/zip')
-        response['Content-Disposition'] = f'attachment; filename="{zip_filename}"'
-        
-        return response
-        
-    except Exception as e:
-        cache.set(progress_key, {'completed': 0, 'total': total_students, 'status': 'error', 'error': str(e)}, 300)
-        messages.error(request, f"Bulk PDF generation failed: {str(e)}")
-        return redirect('result:view_results')
+def download_bulk_pdf(request, job_id):
+    """Serve the ZIP of a finished bulk PDF job"""
+    job = get_bulk_pdf_job(request, job_id)
+    path = bulk_pdf_path(job) if job.status == BackgroundJob.COMPLETED else None
+    if path is None:
+        raise Http404("The ZIP of this job is not available.")
+    return FileResponse(open(path, 'rb'), as_attachment=True, filename=job.result.get('download_name') or path.name)
+
 
 @login_required
 def bulk_pdf_progress(request, exam_id, class_id):
-    """API endpoint to check bulk PDF generation progress"""
-    progress_key = f"bulk_pdf_progress_{exam_id}_{class_id}_{request.user.id}"
-    progress = cache.get(progress_key, {'completed': 0, 'total': 0, 'status': 'not_started'})
-    return JsonResponse(progress)
\ No newline at end of file
+    """API endpoint to check the progress of the latest bulk PDF job of a class"""
+    jobs = BackgroundJob.objects.filter(
+        kind=BackgroundJob.BULK_PDF,
+        params__exam_id=exam_id,
+        params__class_id=class_id,
+    )
+    if not request.user.is_superuser:
+        jobs = jobs.filter(created_by=request.user)
+    job = jobs.first()
+    if job is None:
+        return JsonResponse({'completed': 0, 'total': 0, 'status': 'not_started'})
+    
+    progress = job.as_dict()
+    if job.status == BackgroundJob.COMPLETED:
+        progress['download_url'] = reverse('result:download_bulk_pdf', args=[job.id])
+    return JsonResponse(progress)
@@ -82,6 +82,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'ResultManagement.middleware.OverallResultRecomputeMiddleware',
 ]
 
 ROOT_URLCONF = 'SiddharthaAcademy.urls'
@@ -113,9 +114,68 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': {
+            # Take the write lock at BEGIN so concurrent writers (marks entry,
+            # bulk recomputes) queue up instead of failing with "database is locked"
+            'transaction_mode': 'IMMEDIATE',
+            'timeout': 20,
+        },
+    }
+}
+
+
+# Cache shared by every worker process (grading scale version stamps, etc.)
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.environ.get('CACHE_LOCATION', BASE_DIR / '.cache'),
     }
 }
 
+# Shared headless browser for result card PDFs (see ResultManagement/renderer.py).
+# Run it with `python manage.py run_pdf_renderer`, or let the first PDF start it.
+RESULT_PDF_RENDERER = {
+    'ADDRESS': os.environ.get('PDF_RENDERER_ADDRESS', str(BASE_DIR / '.renderer.sock')),
+    'PAGES': int(os.environ.get('PDF_RENDERER_PAGES', 4)),
+    'RESTART_AFTER': 500,
+}
+
+# How result cards are drawn: 'playwright' (headless Chromium), 'xhtml2pdf'
+# or 'reportlab'. Bulk class ZIPs use the cheaper in-process BULK backend;
+# FALLBACKS are tried in order when the chosen one is unavailable.
+RESULT_PDF_BACKENDS = {
+    'DEFAULT': os.environ.get('PDF_BACKEND', 'playwright'),
+    'BULK': os.environ.get('PDF_BULK_BACKEND', 'xhtml2pdf'),
+    'FALLBACKS': ['xhtml2pdf', 'reportlab'],
+}
+
+# Rendered result cards, keyed by a hash of what they show; least recently
+# used cards are evicted once the directory passes MAX_SIZE bytes (0 disables)
+RESULT_PDF_CACHE = {
+    'DIR': os.environ.get('PDF_CACHE_LOCATION', str(BASE_DIR / '.pdf_cache')),
+    'MAX_SIZE': int(os.environ.get('PDF_CACHE_MAX_SIZE', 500 * 1024 * 1024)),
+}
+
+# Leave background jobs to `python manage.py run_result_jobs` instead of
+# running them in a thread of the web process that queued them
+RESULT_JOB_WORKER = os.environ.get('RESULT_JOB_WORKER', '') == '1'
+
+# Finished class result ZIPs, served only through the download view
+RESULT_PDF_OUTPUT_DIR = BASE_DIR / 'generated_pdfs'
+
+# How bulk result PDFs are shrunk before zipping: 'screen' (recompress and
+# downsample images), 'grayscale' (also gray, for black-and-white printing) or 'none'
+RESULT_PDF_OPTIMIZE = {
+    'PROFILE': os.environ.get('PDF_OPTIMIZE_PROFILE', 'screen'),
+}
+
+# End-of-term cards for every class (`python manage.py generate_school_results`),
+# a file per class under OUTPUT_DIR, rendered by WORKERS processes (default: one per core)
+RESULT_SCHOOL_CARDS = {
+    'WORKERS': int(os.environ.get('RESULT_CARD_WORKERS', 0)) or None,
+    'OUTPUT_DIR': RESULT_PDF_OUTPUT_DIR / 'school',
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -207,5 +267,9 @@ LOGGING = {
             'level': 'WARNING',
             'propagate': True,
         },
+        # xhtml2pdf warns about unsupported CSS on every card it renders
+        'xhtml2pdf': {
+            'level': 'ERROR',
+        },
     },
 }
\ No newline at end of file